@@ -0,0 +1,42 @@
+"""add tasks_archive table
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The enum types already exist for tasks; on PostgreSQL reuse them
+    op.create_table(
+        'tasks_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('priority', postgresql.ENUM('low', 'medium', 'high', name='priorityenum', create_type=False), nullable=True),
+        sa.Column('status', postgresql.ENUM('pending', 'in_progress', 'completed', name='statusenum', create_type=False), nullable=True),
+        sa.Column('due_date', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tasks_archive_owner_id'), 'tasks_archive', ['owner_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_tasks_archive_owner_id'), table_name='tasks_archive')
+    op.drop_table('tasks_archive')
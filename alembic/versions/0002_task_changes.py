@@ -0,0 +1,45 @@
+"""add task change log tables
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'task_changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_task_changes_owner_seq', 'task_changes', ['owner_id', 'seq'], unique=True)
+    op.create_table(
+        'task_change_cursors',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('compacted_seq', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('owner_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('task_change_cursors')
+    op.drop_index('ix_task_changes_owner_seq', table_name='task_changes')
+    op.drop_table('task_changes')
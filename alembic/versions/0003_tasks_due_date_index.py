@@ -0,0 +1,24 @@
+"""index tasks.due_date for the reminder scheduler
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tasks_due_date', 'tasks', ['due_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_due_date', table_name='tasks')
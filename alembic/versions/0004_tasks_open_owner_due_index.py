@@ -0,0 +1,31 @@
+"""partial index on open tasks by owner and due date
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_tasks_open_owner_due',
+        'tasks',
+        ['owner_id', 'due_date'],
+        unique=False,
+        sqlite_where=sa.text("status != 'completed'"),
+        postgresql_where=sa.text("status != 'completed'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_open_owner_due', table_name='tasks')
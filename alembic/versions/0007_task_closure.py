@@ -0,0 +1,49 @@
+"""add task parent_id and closure table
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('tasks') as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_tasks_parent_id', 'tasks', ['parent_id'], ['id'])
+        batch_op.create_index('ix_tasks_parent_id', ['parent_id'], unique=False)
+    op.add_column('tasks_archive', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.create_table(
+        'task_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_task_closure_descendant', 'task_closure', ['descendant_id', 'depth'], unique=False)
+    # Every existing task is a root: it is only its own ancestor
+    op.execute(
+        "INSERT INTO task_closure (ancestor_id, descendant_id, depth, owner_id) "
+        "SELECT id, id, 0, owner_id FROM tasks"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_closure_descendant', table_name='task_closure')
+    op.drop_table('task_closure')
+    op.drop_column('tasks_archive', 'parent_id')
+    with op.batch_alter_table('tasks') as batch_op:
+        batch_op.drop_index('ix_tasks_parent_id')
+        batch_op.drop_constraint('fk_tasks_parent_id', type_='foreignkey')
+        batch_op.drop_column('parent_id')
@@ -0,0 +1,46 @@
+"""add tags and task_tags tables
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tags',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tags_owner_name', 'tags', ['owner_id', 'name'], unique=True)
+    op.create_table(
+        'task_tags',
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+        sa.PrimaryKeyConstraint('task_id', 'tag_id')
+    )
+    op.create_index('ix_task_tags_tag_task', 'task_tags', ['tag_id', 'task_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_tags_tag_task', table_name='task_tags')
+    op.drop_table('task_tags')
+    op.drop_index('ix_tags_owner_name', table_name='tags')
+    op.drop_table('tags')
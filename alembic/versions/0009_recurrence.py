@@ -0,0 +1,41 @@
+"""add task recurrence and occurrence exceptions
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('recurrence', sa.String(), nullable=True))
+    op.add_column('tasks_archive', sa.Column('recurrence', sa.String(), nullable=True))
+    # The status enum type already exists for tasks; on PostgreSQL reuse it
+    op.create_table(
+        'task_occurrences',
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('occurs_at', sa.DateTime(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('status', postgresql.ENUM('pending', 'in_progress', 'completed', name='statusenum', create_type=False), nullable=False),
+        sa.Column('due_date', sa.DateTime(), nullable=True),
+        sa.Column('cancelled', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+        sa.PrimaryKeyConstraint('task_id', 'occurs_at')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('task_occurrences')
+    op.drop_column('tasks_archive', 'recurrence')
+    op.drop_column('tasks', 'recurrence')
@@ -0,0 +1,26 @@
+"""add version column to tasks and tasks_archive
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('tasks_archive', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks_archive', 'version')
+    op.drop_column('tasks', 'version')
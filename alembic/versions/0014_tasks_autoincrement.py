@@ -0,0 +1,32 @@
+"""never reuse task ids (SQLite AUTOINCREMENT)
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def _recreate_tasks(autoincrement: bool) -> None:
+    # Only SQLite reuses the highest deleted rowid; other databases use sequences
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('tasks', recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        pass
+
+
+def upgrade() -> None:
+    _recreate_tasks(True)
+
+
+def downgrade() -> None:
+    _recreate_tasks(False)
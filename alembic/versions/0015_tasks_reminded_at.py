@@ -0,0 +1,24 @@
+"""add reminded_at column to tasks
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-20 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('reminded_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'reminded_at')
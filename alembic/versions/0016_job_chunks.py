@@ -0,0 +1,33 @@
+"""add job_chunks table
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'job_chunks',
+        sa.Column('job_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('start', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('checkpoint', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('job_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_chunks')
@@ -0,0 +1,32 @@
+"""add job_results table
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-20 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'job_results',
+        sa.Column('job_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('seq', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('job_id', 'seq')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_results')
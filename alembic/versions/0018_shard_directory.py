@@ -0,0 +1,35 @@
+"""add shard_directory and id_blocks tables
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-20 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'shard_directory',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table(
+        'id_blocks',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('id_blocks')
+    op.drop_table('shard_directory')
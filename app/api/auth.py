@@ -1,14 +1,21 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from .. import crud, schemas, auth
-from ..database import get_db
+from .. import crud, schemas, auth, availability, api_keys
+from ..database import get_db, get_read_db, pin_to_primary
+from ..rate_limit import availability_limiter, login_limiter, register_limiter
+
+_CONFLICT_DETAILS = {
+    "username": "Username already registered",
+    "email": "Email already registered",
+}
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-@router.post("/register", response_model=schemas.User)
+@router.post("/register", response_model=schemas.User, dependencies=[Depends(register_limiter)])
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """
     Register a new user.
@@ -17,32 +24,35 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     - **email**: Valid email address
     - **password**: Secure password (minimum 6 characters)
     """
-    # Check if username already exists
-    db_user = crud.get_user_by_username(db, username=user.username)
-    if db_user:
+    # Validate password length
+    if len(user.password) < 6:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
+            detail="Password must be at least 6 characters long"
         )
     
-    # Check if email already exists
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
+    # Check username and email together, before paying for the password hash
+    conflict = crud.get_user_conflict(db, username=user.username, email=user.email)
+    if conflict:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+            detail=_CONFLICT_DETAILS[conflict]
         )
     
-    # Validate password length
-    if len(user.password) < 6:
+    try:
+        db_user = crud.create_user(db=db, user=user)
+    except IntegrityError:
+        # A concurrent registration took the name or email after our check
+        db.rollback()
+        conflict = crud.get_user_conflict(db, username=user.username, email=user.email) or "username"
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Password must be at least 6 characters long"
+            detail=_CONFLICT_DETAILS[conflict]
         )
-    
-    return crud.create_user(db=db, user=user)
+    availability.usernames.add(db_user.username)
+    return db_user
 
-@router.post("/login", response_model=schemas.Token)
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(login_limiter)])
 def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
@@ -61,18 +71,87 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    tokens = auth.issue_tokens(db, user)
+    # The new user may not have replicated yet; read it back from the primary
+    pin_to_primary(f"Bearer {tokens['access_token']}")
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return tokens
+
+@router.post("/refresh", response_model=schemas.Token)
+def refresh_access_token(body: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token and refresh token.
+    
+    - **refresh_token**: The refresh token from `/auth/login` or the previous refresh
+    
+    Each refresh token can be used once; reusing one revokes the session.
+    """
+    return auth.rotate_refresh_token(db, body.refresh_token)
+
+@router.get("/available", dependencies=[Depends(availability_limiter)])
+def check_username_available(
+    username: str = Query(..., min_length=1, description="Username to check"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Check whether a username is still free, for validating signup forms as users type.
+    
+    - **username**: Username to check
+    
+    Served mostly from an in-memory filter; registration remains the final check.
+    """
+    return {"username": username, "available": availability.usernames.is_available(db, username)}
 
 @router.get("/me", response_model=schemas.User)
-def read_users_me(current_user: schemas.User = Depends(auth.get_current_active_user)):
+def read_users_me(current_user: schemas.User = Depends(auth.get_current_read_user)):
     """
     Get current user information.
     
     Requires authentication.
     """
-    return current_user 
\ No newline at end of file
+    return current_user 
+
+@router.post("/api-keys", response_model=schemas.ApiKeyCreated)
+def create_api_key(
+    body: schemas.ApiKeyCreate,
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create an API key for service-to-service access.
+    
+    - **name**: Label to recognise the key by
+    
+    Send the key as `Authorization: Bearer <key>`. It is only shown in this response.
+    """
+    db_key, key = api_keys.create(db, user_id=current_user.id, name=body.name)
+    return {**schemas.ApiKey.model_validate(db_key).model_dump(), "key": key}
+
+@router.get("/api-keys", response_model=List[schemas.ApiKey])
+def read_api_keys(
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    List the current user's API keys (without the secrets).
+    """
+    return crud.get_api_keys(db, user_id=current_user.id)
+
+@router.delete("/api-keys/{key_id}", response_model=schemas.ApiKey)
+def revoke_api_key(
+    key_id: int,
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Revoke an API key.
+    
+    - **key_id**: ID of the key to revoke
+    """
+    db_key = api_keys.revoke(db, user_id=current_user.id, key_id=key_id)
+    if db_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+    return db_key
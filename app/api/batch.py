@@ -0,0 +1,135 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from .. import crud, schemas, auth, events, reminders
+from ..database import get_db, track_writes
+
+router = APIRouter(prefix="/batch", tags=["batch"], dependencies=[Depends(track_writes)])
+
+# Upper bound on operations per batch request
+MAX_BATCH_OPERATIONS = 100
+
+_CHANGE_OPS = {
+    "create": schemas.ChangeOp.created,
+    "update": schemas.ChangeOp.updated,
+}
+
+def _apply(db: Session, user_id: int, index: int, operation):
+    """Run one operation in the caller's transaction; returns its result and the task row (deleted ids for deletes)."""
+    task_id = getattr(operation, "task_id", None)
+    if operation.op == "create":
+        task = crud.create_task(db, task=operation.task, user_id=user_id, commit=False)
+    elif operation.op == "update":
+        task = crud.update_task(
+            db, task_id=task_id, task_update=operation.task, user_id=user_id, commit=False,
+            expected_version=operation.version,
+        )
+    else:
+        task = None
+        deleted = crud.delete_task(db, task_id=task_id, user_id=user_id, commit=False)
+        if deleted:
+            return schemas.BatchResult(index=index, op=operation.op, status=status.HTTP_200_OK, task_id=task_id), deleted
+    if task is None:
+        missing = "Parent task not found" if operation.op == "create" else "Task not found"
+        return schemas.BatchResult(
+            index=index, op=operation.op, status=status.HTTP_404_NOT_FOUND, task_id=task_id, error=missing
+        ), None
+    code = status.HTTP_201_CREATED if operation.op == "create" else status.HTTP_200_OK
+    return schemas.BatchResult(index=index, op=operation.op, status=code, task_id=task.id, task=task), task
+
+def _failed(index: int, operation, exc: SQLAlchemyError) -> schemas.BatchResult:
+    """The result for an operation that raised; the caller rolls back."""
+    if isinstance(exc, StaleDataError) and getattr(operation, "version", None) is not None:
+        code, error = status.HTTP_412_PRECONDITION_FAILED, "Task has been modified since the given version"
+    else:
+        code, error = status.HTTP_409_CONFLICT, "Operation could not be applied"
+    return schemas.BatchResult(
+        index=index, op=operation.op, status=code, task_id=getattr(operation, "task_id", None), error=error
+    )
+
+@router.post("/", response_model=schemas.BatchResponse)
+def run_batch(
+    batch: schemas.BatchRequest,
+    response: Response,
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Run several task operations in one request and one commit.
+
+    - **operations**: Ordered list of `{"op": "create", "task": {...}}`,
+      `{"op": "update", "task_id": 1, "task": {...}}` or `{"op": "delete", "task_id": 1}`;
+      an update may give the task's `version`, and fails with 412 if the task has moved on
+    - **atomic**: If true (default) the batch is all-or-nothing: the first failing
+      operation rolls everything back, and the response is 409 with that
+      operation's error. If false failures are reported per operation and the
+      rest is committed, still in one transaction.
+    """
+    if len(batch.operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_OPERATIONS} operations can be run at once"
+        )
+
+    results = []
+    tasks = []
+    failed = False
+    # Operations that raised, by index. No savepoints: pysqlite's RELEASE would
+    # commit. Instead the transaction is rolled back and the batch is run again
+    # without them, like app.group_commit does.
+    conflicts = {}
+    index = 0
+    while index < len(batch.operations):
+        operation = batch.operations[index]
+        if index in conflicts:
+            result, task = conflicts[index], None
+        else:
+            try:
+                result, task = _apply(db, current_user.id, index, operation)
+            except SQLAlchemyError as exc:
+                db.rollback()
+                result, task = _failed(index, operation, exc), None
+                if not batch.atomic:
+                    conflicts[index] = result
+                    results, tasks, index = [], [], 0
+                    continue
+        results.append(result)
+        tasks.append(task)
+        index += 1
+        if result.error is not None and batch.atomic:
+            failed = True
+            break
+
+    if failed:
+        db.rollback()
+        for result in results[:-1]:
+            result.status, result.task, result.error = status.HTTP_424_FAILED_DEPENDENCY, None, "Rolled back"
+            if result.op == "create":
+                result.task_id = None
+        executed = len(results)
+        results.extend(
+            schemas.BatchResult(
+                index=index, op=operation.op, status=status.HTTP_424_FAILED_DEPENDENCY,
+                task_id=getattr(operation, "task_id", None), error="Not executed"
+            )
+            for index, operation in enumerate(batch.operations) if index >= executed
+        )
+        response.status_code = status.HTTP_409_CONFLICT
+        return schemas.BatchResponse(committed=False, results=results)
+
+    # Keep the flushed rows loaded for the events and reminders below
+    db.expire_on_commit = False
+    db.commit()
+    for result, task in zip(results, tasks):
+        if result.error is not None:
+            continue
+        if result.op == "delete":
+            for deleted_id in task:
+                events.publish_task(current_user.id, schemas.ChangeOp.deleted, deleted_id)
+                reminders.scheduler.forget(deleted_id)
+        else:
+            events.publish_task(current_user.id, _CHANGE_OPS[result.op], result.task_id, task)
+            reminders.scheduler.track(task)
+    return schemas.BatchResponse(committed=True, results=results)
@@ -0,0 +1,130 @@
+from typing import List
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from .. import crud, schemas, auth, jobs
+from ..database import get_db, get_read_db, track_writes
+
+router = APIRouter(prefix="/jobs", tags=["jobs"], dependencies=[Depends(track_writes)])
+
+# Upper bound on tasks per import job
+MAX_IMPORT_TASKS = 10000
+
+def _params(job) -> dict:
+    """What the handler needs from a job request, as stored in the jobs table."""
+    if job.kind == "import":
+        return {"tasks": [task.model_dump(mode="json") for task in job.tasks]}
+    if job.kind == "bulk_update":
+        return {
+            "filter": job.filter.model_dump(mode="json", exclude_none=True),
+            "update": job.update.model_dump(mode="json", exclude_unset=True),
+        }
+    return {"fields": job.fields}
+
+@router.post("/", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    job: schemas.JobCreate = Body(..., discriminator="kind"),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue a long-running operation; poll `GET /jobs/{job_id}` for its progress.
+    
+    - **kind**: `import` (with `tasks`), `bulk_update` (with `filter` and `update`)
+      or `export` (with optional `fields`; download from `GET /jobs/{job_id}/result`)
+    - **max_attempts**: Attempts before the job is marked failed (retried with backoff)
+    """
+    if job.kind == "import" and len(job.tasks) > MAX_IMPORT_TASKS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_IMPORT_TASKS} tasks can be imported at once"
+        )
+    if job.kind == "export" and job.fields:
+        unknown = [field for field in job.fields if field not in crud.TASK_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(crud.TASK_FIELDS)}"
+            )
+        job.fields = ["id"] + [field for field in dict.fromkeys(job.fields) if field != "id"]
+    return crud.create_job(
+        db,
+        user_id=current_user.id,
+        kind=job.kind,
+        params=_params(job),
+        max_attempts=job.max_attempts or jobs.JOB_MAX_ATTEMPTS,
+    )
+
+@router.get("/", response_model=List[schemas.Job])
+def read_jobs(
+    limit: int = Query(50, ge=1, le=100, description="Maximum number of jobs to return"),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the current user's most recent jobs.
+    """
+    return crud.get_jobs(db, user_id=current_user.id, limit=limit)
+
+@router.get("/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: int,
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get a job's status and progress (`processed` of `total`).
+    """
+    job = crud.get_job(db, job_id=job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@router.post("/{job_id}/cancel", response_model=schemas.Job)
+def cancel_job(
+    job_id: int,
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel a job. A queued job is cancelled at once; a running job stops after
+    its current chunk, keeping the work done so far.
+    """
+    job = crud.cancel_job(db, job_id=job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@router.get("/{job_id}/result")
+def read_job_result(
+    job_id: int,
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Download the NDJSON produced by a finished export job.
+    """
+    job = crud.get_job(db, job_id=job_id, user_id=current_user.id)
+    if job is None or job.kind != "export":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Export job not found"
+        )
+    if job.status != jobs.SUCCEEDED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The export is not ready"
+        )
+    return StreamingResponse(
+        crud.iter_job_result(db, job_id=job.id, user_id=current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="tasks-{job.id}.ndjson"'},
+    )
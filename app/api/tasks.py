@@ -1,15 +1,115 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import hashlib
+import json
+from typing import List, Optional, Union
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status, Query
+from fastapi import status as http_status
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
-from .. import crud, schemas, auth
-from ..database import get_db
+from .. import crud, schemas, auth, group_commit, events, idempotency, recurrence, reminders
+from ..database import get_db, get_read_db, track_writes
 
-router = APIRouter(prefix="/tasks", tags=["tasks"])
+router = APIRouter(prefix="/tasks", tags=["tasks"], dependencies=[Depends(track_writes)])
+
+# Upper bound on ids per batch fetch
+MAX_BATCH_IDS = 200
+
+# Tasks read per query while streaming an export
+EXPORT_CHUNK_SIZE = 500
+
+# Tasks listed in each dashboard section
+DASHBOARD_LIMIT = 5
+
+# Widest window the calendar expands recurring tasks over
+MAX_CALENDAR_DAYS = 366
+
+def sparse_fields(
+    fields: Optional[str] = Query(
+        None, description="Comma-separated task fields to return, e.g. id,title,status,due_date"
+    )
+) -> Optional[List[str]]:
+    """Parse `?fields=` into the columns to select; `id` is always included."""
+    if fields is None:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in crud.TASK_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(crud.TASK_FIELDS)}"
+        )
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+def _sparse(db: Session, user_id: int, tasks, fields: List[str]) -> List[dict]:
+    """Tasks read with ?fields=, as JSON-ready dicts of just those fields."""
+    if "tags" in fields:
+        tasks = crud.with_tag_names(db, user_id, tasks)
+    return [schemas.TaskPartial.model_validate(task).model_dump(mode="json", exclude_unset=True) for task in tasks]
+
+# Routes taking ?fields= return either form, so they document both and render
+# the response themselves instead of through a response_model
+TASK_RESPONSES = {200: {"model": Union[schemas.Task, schemas.TaskPartial]}}
+TASK_LIST_RESPONSES = {200: {"model": Union[List[schemas.Task], List[schemas.TaskPartial]]}}
+TASK_BATCH_RESPONSES = {200: {"model": Union[schemas.TaskBatch, schemas.TaskPartialBatch]}}
+
+_TASK_LIST = TypeAdapter(List[schemas.Task])
+
+def _task_list(db: Session, user_id: int, tasks, fields: Optional[List[str]]):
+    """Full tasks or, with ?fields=, the sparse form."""
+    if fields is None:
+        return Response(content=_TASK_LIST.dump_json(_TASK_LIST.validate_python(tasks)), media_type="application/json")
+    return JSONResponse(_sparse(db, user_id, tasks, fields))
+
+def _task_response(task):
+    return schemas.Task.model_validate(task)
+
+def _commit_write(
+    db: Session,
+    user_id: int,
+    operation,
+    idempotent: Optional[idempotency.IdempotentRequest],
+    response=_task_response,
+    grouped: bool = False,
+):
+    """
+    Run a crud write that only flushes (`commit=False`) and commit it, through the
+    group commit writer when `grouped` and enabled.
+
+    With an Idempotency-Key, `response(result)` is stored in the same transaction,
+    so the write and its recorded response commit together; a falsy result (not
+    found) stores nothing.
+    """
+    def run(session: Session):
+        result = operation(session)
+        if idempotent is not None and result:
+            idempotent.save(session, response(result))
+        return result
+
+    try:
+        if grouped and group_commit.writer is not None:
+            result = group_commit.writer.execute(run, owner_id=user_id)
+        else:
+            result = run(db)
+            # Keep the flushed rows loaded for the events and reminders that follow
+            db.expire_on_commit = False
+            db.commit()
+    except IntegrityError:
+        if idempotent is None:
+            raise
+        db.rollback()
+        raise idempotency.conflict()
+    if idempotent is not None:
+        idempotent.committed()
+    return result
 
 @router.post("/", response_model=schemas.Task)
 def create_task(
     task: schemas.TaskCreate,
+    idempotent: Optional[idempotency.IdempotentRequest] = Depends(idempotency.idempotent_request),
     current_user: schemas.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -21,48 +121,346 @@ def create_task(
     - **priority**: Task priority (low, medium, high) - defaults to medium
     - **status**: Task status (pending, in_progress, completed) - defaults to pending
     - **due_date**: Task due date (optional)
+    - **parent_id**: ID of the parent task, to create a subtask (optional)
+    - **recurrence**: RRULE such as `FREQ=WEEKLY;BYDAY=MO`, repeating the task from its due date (optional)
+    
+    Send an `Idempotency-Key` header to make retries safe: a repeat of the same
+    request with the same key returns the first response instead of creating
+    another task.
     """
-    return crud.create_task(db=db, task=task, user_id=current_user.id)
+    if idempotent is not None and idempotent.replay is not None:
+        return idempotent.replay
+    db_task = _commit_write(
+        db, current_user.id,
+        lambda session: crud.create_task(db=session, task=task, user_id=current_user.id, commit=False),
+        idempotent, grouped=True,
+    )
+    if db_task is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Parent task not found"
+        )
+    events.publish_task(current_user.id, schemas.ChangeOp.created, db_task.id, db_task)
+    reminders.scheduler.track(db_task)
+    return db_task
 
-@router.get("/", response_model=List[schemas.Task])
+@router.get("/", response_model=None, responses=TASK_LIST_RESPONSES)
 def read_tasks(
     skip: int = Query(0, ge=0, description="Number of tasks to skip"),
     limit: int = Query(100, ge=1, le=100, description="Maximum number of tasks to return"),
-    current_user: schemas.User = Depends(auth.get_current_active_user),
-    db: Session = Depends(get_db)
+    include_archived: bool = Query(False, description="Also return archived completed tasks"),
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get all tasks for the current user.
     
     - **skip**: Number of tasks to skip (for pagination)
     - **limit**: Maximum number of tasks to return (max 100)
+    - **include_archived**: Include tasks moved to the archive (default false)
     """
-    tasks = crud.get_tasks(db, user_id=current_user.id, skip=skip, limit=limit)
-    return tasks
+    tasks = crud.get_tasks(
+        db, user_id=current_user.id, skip=skip, limit=limit, include_archived=include_archived, columns=fields
+    )
+    return _task_list(db, current_user.id, tasks, fields)
+
+def _split_tags(value: Optional[str]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [tag.strip() for tag in value.split(",") if tag.strip()]
+
+@router.get("/query", response_model=None, responses=TASK_LIST_RESPONSES)
+def query_tasks(
+    status: Optional[schemas.StatusEnum] = Query(None, description="Filter by status"),
+    priority: Optional[schemas.PriorityEnum] = Query(None, description="Filter by priority"),
+    skip: int = Query(0, ge=0, description="Number of tasks to skip"),
+    limit: int = Query(100, ge=1, le=100, description="Maximum number of tasks to return"),
+    include_archived: bool = Query(False, description="Also return archived completed tasks"),
+    tags_any: Optional[str] = Query(None, description="Comma-separated tags; match tasks with any of them"),
+    tags_all: Optional[str] = Query(None, description="Comma-separated tags; match tasks with all of them"),
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Query tasks with optional filters.
+    
+    - **status**: Task status (pending, in_progress, completed)
+    - **priority**: Task priority (low, medium, high)
+    - **include_archived**: Include tasks moved to the archive (default false)
+    - **tags_any**: Tasks carrying at least one of these tags, e.g. `backend,frontend`
+    - **tags_all**: Tasks carrying every one of these tags
+    """
+    tasks = crud.query_tasks(
+        db,
+        user_id=current_user.id,
+        status=crud.models.StatusEnum(status.value) if status else None,
+        priority=crud.models.PriorityEnum(priority.value) if priority else None,
+        skip=skip,
+        limit=limit,
+        include_archived=include_archived,
+        columns=fields,
+        tags_any=_split_tags(tags_any),
+        tags_all=_split_tags(tags_all),
+    )
+    return _task_list(db, current_user.id, tasks, fields)
+
+def _fetch_batch(db: Session, user_id: int, task_ids: List[int], fields: Optional[List[str]]):
+    if len(task_ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids can be fetched at once"
+        )
+    task_ids = list(dict.fromkeys(task_ids))
+    tasks = crud.get_tasks_by_ids(db, user_id=user_id, task_ids=task_ids, columns=fields)
+    found = {task.id for task in tasks}
+    missing = [task_id for task_id in task_ids if task_id not in found]
+    if fields is not None:
+        return JSONResponse({"tasks": _sparse(db, user_id, tasks, fields), "missing": missing})
+    batch = schemas.TaskBatch.model_validate({"tasks": tasks, "missing": missing})
+    return Response(content=batch.model_dump_json(), media_type="application/json")
+
+@router.get("/batch", response_model=None, responses=TASK_BATCH_RESPONSES)
+def read_tasks_batch(
+    ids: str = Query(..., description="Comma-separated task ids"),
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get several tasks by ID in one request.
+    
+    - **ids**: Comma-separated task ids (at most 200)
+    
+    Ids that do not exist or belong to another user are listed in `missing`.
+    """
+    try:
+        task_ids = [int(task_id) for task_id in ids.split(",") if task_id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma-separated list of integers"
+        )
+    return _fetch_batch(db, current_user.id, task_ids, fields)
+
+@router.post("/batch", response_model=None, responses=TASK_BATCH_RESPONSES)
+def read_tasks_batch_post(
+    body: schemas.TaskIds,
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get several tasks by ID, for id lists too long for a query string.
+    
+    - **ids**: List of task ids (at most 200)
+    """
+    return _fetch_batch(db, current_user.id, body.ids, fields)
+
+@router.get("/overdue", response_model=None, responses=TASK_LIST_RESPONSES)
+def read_overdue_tasks(
+    after_due: Optional[datetime] = Query(None, description="due_date of the last task on the previous page"),
+    after_id: Optional[int] = Query(None, description="id of the last task on the previous page"),
+    limit: int = Query(100, ge=1, le=100, description="Maximum number of tasks to return"),
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get open tasks that are past their due date, oldest first.
+    
+    - **after_due** / **after_id**: Keyset cursor; pass the `due_date` and `id` of the
+      last task from the previous page to get the next one
+    - **limit**: Maximum number of tasks to return (max 100)
+    """
+    tasks = crud.get_overdue_tasks(
+        db,
+        user_id=current_user.id,
+        now=datetime.utcnow(),
+        after_due=after_due,
+        after_id=after_id,
+        limit=limit,
+        columns=fields,
+    )
+    return _task_list(db, current_user.id, tasks, fields)
+
+@router.get("/dashboard", response_model=schemas.TaskDashboard, response_model_exclude_unset=True)
+def read_dashboard(
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get the home screen summary in one call.
+    
+    Returns task counts per status and per priority, the next 5 open tasks by
+    due date and the 5 most recently updated tasks. Archived tasks are not counted.
+    """
+    return crud.get_dashboard(db, user_id=current_user.id, limit=DASHBOARD_LIMIT)
+
+@router.get("/calendar", response_model=List[schemas.Occurrence], response_model_exclude_unset=True)
+def read_calendar(
+    start: datetime = Query(..., description="Start of the window (inclusive)"),
+    end: datetime = Query(..., description="End of the window (exclusive)"),
+    limit: int = Query(500, ge=1, le=1000, description="Maximum number of entries to return"),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get the tasks due in a window, in due order, with recurring tasks expanded
+    into their occurrences.
+    
+    - **start** / **end**: Window to list, at most a year wide
+    - **limit**: Maximum number of entries to return (max 1000)
+    
+    Occurrences carry `occurs_at`, which identifies them for `PUT /tasks/{id}/occurrences`.
+    """
+    start, end = recurrence.naive_utc(start), recurrence.naive_utc(end)
+    if not start < end <= start + timedelta(days=MAX_CALENDAR_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"end must be after start and at most {MAX_CALENDAR_DAYS} days later"
+        )
+    return crud.get_calendar(db, user_id=current_user.id, start=start, end=end, limit=limit)
+
+@router.get("/changes", response_model=schemas.TaskChanges)
+def read_task_changes(
+    since: int = Query(0, ge=0, description="Cursor returned by the previous call"),
+    limit: int = Query(500, ge=1, le=1000, description="Maximum number of log entries to scan"),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get task changes since a sync cursor.
+    
+    - **since**: Cursor from the previous response (0 for a first sync)
+    - **limit**: Maximum number of log entries to scan; `has_more` signals another page
+    
+    Each task appears once with its latest change. If `resync_required` is true the
+    cursor has fallen out of the retained log: refetch `/tasks/` and continue from
+    the returned `cursor`.
+    """
+    return crud.get_changes(db, user_id=current_user.id, since=since, limit=limit)
+
+@router.get("/stream")
+async def stream_task_events(
+    last_event_id: Optional[str] = Header(None),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Stream task changes as Server-Sent Events.
+    
+    Emits `created`, `updated` and `deleted` events for the current user's tasks.
+    A `resync` event means the connection fell behind and was closed; catch up
+    through `/tasks/changes` and reconnect. Events carry their change sequence as
+    the SSE id, so a reconnecting client resumes after the last one it saw.
+    """
+    cursor = crud.get_change_cursor(db, user_id=current_user.id)
+    seq, compacted_seq = (cursor.seq, cursor.compacted_seq) if cursor is not None else (0, 0)
+    since = int(last_event_id) if last_event_id is not None and last_event_id.isdigit() else seq
+    subscription = events.hub.subscribe(current_user.id, since=min(since, seq))
+    if since < compacted_seq:
+        # The changes since then are no longer in the log
+        subscription.offer(events.OVERFLOW)
+    # Release the pooled connection now rather than when the stream ends
+    db.close()
+    return StreamingResponse(
+        events.hub.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/export")
+def export_tasks(
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Export all of the current user's tasks as newline-delimited JSON.
+    
+    The body is streamed as it is read, so large exports start immediately and
+    are compressed on the fly when the client accepts it.
+    """
+    def lines():
+        for chunk in crud.iter_tasks(db, user_id=current_user.id, chunk_size=EXPORT_CHUNK_SIZE, columns=fields):
+            if fields is None:
+                yield "".join(schemas.Task.model_validate(task).model_dump_json() + "\n" for task in chunk)
+            else:
+                yield "".join(json.dumps(task) + "\n" for task in _sparse(db, current_user.id, chunk, fields))
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as compressed responses carry a weakened tag."""
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
 
-@router.get("/{task_id}", response_model=schemas.Task)
+def _task_etag(body: bytes, version: Optional[int] = None) -> str:
+    """
+    A hash of the response body, so different bodies never share a tag (the
+    compressed-body cache is keyed by it). Full tasks prefix their version,
+    which is what If-Match on PUT compares.
+    """
+    digest = hashlib.sha1(body).hexdigest()
+    return '"%s"' % digest if version is None else '"%d-%s"' % (version, digest)
+
+def _if_match_version(if_match: Optional[str]) -> Optional[int]:
+    """The task version an If-Match header asks for; None for no header or `*`."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    tag = tag[2:] if tag.startswith("W/") else tag
+    version = tag[1:-1].partition("-")[0] if len(tag) >= 3 and tag[0] == tag[-1] == '"' else ""
+    if not version.isdigit():
+        # Not a tag this API hands out, so it cannot match
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="If-Match must be a single task ETag, e.g. \"3\""
+        )
+    return int(version)
+
+@router.get("/{task_id}", response_model=None, responses=TASK_RESPONSES)
 def read_task(
     task_id: int,
-    current_user: schemas.User = Depends(auth.get_current_active_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get a specific task by ID.
     
     - **task_id**: ID of the task to retrieve
+    
+    The response carries an ETag; send it back in `If-None-Match` to get a 304
+    when the task has not changed. Without `fields` the ETag also carries the
+    task's version, so `If-Match` on PUT accepts it.
     """
-    task = crud.get_task(db, task_id=task_id, user_id=current_user.id)
+    task = crud.get_task(db, task_id=task_id, user_id=current_user.id, columns=fields)
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
-    return task
+    if fields is None:
+        body = schemas.Task.model_validate(task).model_dump_json().encode()
+    else:
+        body = json.dumps(_sparse(db, current_user.id, [task], fields)[0]).encode()
+    etag = _task_etag(body, task.version if fields is None else None)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @router.put("/{task_id}", response_model=schemas.Task)
 def update_task(
     task_id: int,
     task_update: schemas.TaskUpdate,
+    if_match: Optional[str] = Header(None, description='The task\'s ETag, e.g. "3": update only if it is still at that version'),
+    idempotent: Optional[idempotency.IdempotentRequest] = Depends(idempotency.idempotent_request),
     current_user: schemas.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -71,39 +469,246 @@ def update_task(
     
     - **task_id**: ID of the task to update
     - **task_update**: Task data to update (only provided fields will be updated)
+    
+    Updates never overwrite a concurrent change: send the task's ETag (its
+    `version`) in `If-Match` to get a 412 if the task changed since you read it.
+    Without `If-Match`, an update racing another one gets a 409 and can be retried.
+    The response's ETag carries the new version.
+    
+    Accepts an `Idempotency-Key` header, like task creation.
     """
-    task = crud.update_task(db, task_id=task_id, task_update=task_update, user_id=current_user.id)
+    if idempotent is not None and idempotent.replay is not None:
+        return idempotent.replay
+    expected_version = _if_match_version(if_match)
+    try:
+        task = _commit_write(
+            db, current_user.id,
+            lambda session: crud.update_task(
+                session, task_id=task_id, task_update=task_update, user_id=current_user.id,
+                commit=False, expected_version=expected_version,
+            ),
+            idempotent, grouped=True,
+        )
+    except StaleDataError:
+        db.rollback()
+        if if_match is not None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Task has been modified since the version in If-Match"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Task was modified by a concurrent update; retry"
+        )
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
-    return task
+    events.publish_task(current_user.id, schemas.ChangeOp.updated, task.id, task)
+    reminders.scheduler.track(task)
+    body = schemas.Task.model_validate(task).model_dump_json().encode()
+    return Response(content=body, media_type="application/json", headers={"ETag": _task_etag(body, task.version)})
+
+def _deleted_response(deleted: List[int]):
+    return {"message": "Task deleted successfully", "deleted_ids": deleted}
 
 @router.delete("/{task_id}")
 def delete_task(
     task_id: int,
+    idempotent: Optional[idempotency.IdempotentRequest] = Depends(idempotency.idempotent_request),
     current_user: schemas.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
-    Delete a specific task.
+    Delete a specific task together with all of its subtasks.
     
     - **task_id**: ID of the task to delete
+    
+    Accepts an `Idempotency-Key` header, like task creation.
     """
-    success = crud.delete_task(db, task_id=task_id, user_id=current_user.id)
-    if not success:
+    if idempotent is not None and idempotent.replay is not None:
+        return idempotent.replay
+    deleted = _commit_write(
+        db, current_user.id,
+        lambda session: crud.delete_task(session, task_id=task_id, user_id=current_user.id, commit=False),
+        idempotent, response=_deleted_response,
+    )
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
-    return {"message": "Task deleted successfully"}
+    for deleted_id in deleted:
+        events.publish_task(current_user.id, schemas.ChangeOp.deleted, deleted_id)
+        reminders.scheduler.forget(deleted_id)
+    return _deleted_response(deleted)
 
-@router.get("/status/{status}", response_model=List[schemas.Task])
-def read_tasks_by_status(
-    status: str,
+@router.put("/{task_id}/occurrences", response_model=schemas.Occurrence)
+def update_occurrence(
+    task_id: int,
+    occurrence: schemas.OccurrenceUpdate,
+    idempotent: Optional[idempotency.IdempotentRequest] = Depends(idempotency.idempotent_request),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Change one occurrence of a recurring task: complete it, move it or cancel it.
+    
+    - **occurs_at**: The occurrence's time as generated by the rule
+    - **status**: New status of this occurrence
+    - **due_date**: New time for this occurrence
+    - **cancelled**: Drop this occurrence from the calendar
+    
+    Only changed occurrences are stored; the others keep being generated from the rule.
+    Accepts an `Idempotency-Key` header, like task creation.
+    """
+    if idempotent is not None and idempotent.replay is not None:
+        return idempotent.replay
+
+    def update(session: Session):
+        stored = crud.update_occurrence(session, task_id=task_id, occurrence=occurrence, user_id=current_user.id, commit=False)
+        if stored is None:
+            return None
+        task = crud.get_task(session, task_id=task_id, user_id=current_user.id)
+        return task, {
+            "task_id": task.id,
+            "title": task.title,
+            "priority": task.priority,
+            "status": stored.status,
+            "due_date": stored.due_date or stored.occurs_at,
+            "occurs_at": stored.occurs_at,
+            "recurring": True,
+            "cancelled": stored.cancelled,
+        }
+
+    try:
+        updated = _commit_write(db, current_user.id, update, idempotent, response=lambda result: result[1])
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
+    if updated is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recurring task not found"
+        )
+    task, body = updated
+    events.publish_task(current_user.id, schemas.ChangeOp.updated, task.id, task)
+    return body
+
+@router.get("/{task_id}/history", response_model=schemas.TaskHistory)
+def read_task_history(
+    task_id: int,
+    before_id: Optional[int] = Query(None, description="next_before_id from the previous page"),
+    limit: int = Query(50, ge=1, le=200, description="Maximum number of events to return"),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get a task's change history, newest first: who changed which fields, and when.
+    
+    - **before_id**: Keyset cursor; pass `next_before_id` from the previous page
+    - **limit**: Maximum number of events to return (max 200)
+    
+    History is written in the background, so a change can take a moment to appear.
+    It remains readable after the task is deleted.
+    """
+    events_page = crud.get_task_events(db, task_id=task_id, user_id=current_user.id, before_id=before_id, limit=limit)
+    if not events_page and before_id is None and crud.get_task(db, task_id=task_id, user_id=current_user.id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    return {
+        "events": events_page,
+        "next_before_id": events_page[-1].id if len(events_page) == limit else None,
+    }
+
+@router.get("/{task_id}/subtree", response_model=List[schemas.Task])
+def read_subtree(
+    task_id: int,
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get a task and all of its subtasks at any depth, parents before children.
+    
+    - **task_id**: ID of the root task
+    
+    Rebuild the tree client-side from each task's `parent_id`.
+    """
+    tasks = crud.get_subtree(db, task_id=task_id, user_id=current_user.id)
+    if not tasks:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    return tasks
+
+@router.get("/{task_id}/rollup", response_model=schemas.TaskRollup)
+def read_subtree_rollup(
+    task_id: int,
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get completion counts for a task and all of its subtasks.
+    
+    - **task_id**: ID of the root task
+    """
+    rollup = crud.get_subtree_rollup(db, task_id=task_id, user_id=current_user.id)
+    if rollup is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    return rollup
+
+@router.post("/{task_id}/move", response_model=schemas.Task)
+def move_task(
+    task_id: int,
+    move: schemas.TaskMove,
+    idempotent: Optional[idempotency.IdempotentRequest] = Depends(idempotency.idempotent_request),
     current_user: schemas.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
+):
+    """
+    Move a task and its subtasks under another parent.
+    
+    - **task_id**: ID of the task to move
+    - **parent_id**: ID of the new parent, or null to make it a top-level task
+    
+    Accepts an `Idempotency-Key` header, like task creation.
+    """
+    if idempotent is not None and idempotent.replay is not None:
+        return idempotent.replay
+    try:
+        task = _commit_write(
+            db, current_user.id,
+            lambda session: crud.move_task(session, task_id=task_id, parent_id=move.parent_id, user_id=current_user.id, commit=False),
+            idempotent,
+        )
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
+    if task is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    events.publish_task(current_user.id, schemas.ChangeOp.updated, task.id, task)
+    return task
+
+@router.get("/status/{status}", response_model=None, responses=TASK_LIST_RESPONSES)
+def read_tasks_by_status(
+    status: str,
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get tasks by status.
@@ -114,18 +719,19 @@ def read_tasks_by_status(
         status_enum = crud.models.StatusEnum(status)
     except ValueError:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
+            status_code=http_status.HTTP_400_BAD_REQUEST,
             detail="Invalid status. Must be one of: pending, in_progress, completed"
         )
     
-    tasks = crud.get_tasks_by_status(db, user_id=current_user.id, status=status_enum)
-    return tasks
+    tasks = crud.get_tasks_by_status(db, user_id=current_user.id, status=status_enum, columns=fields)
+    return _task_list(db, current_user.id, tasks, fields)
 
-@router.get("/priority/{priority}", response_model=List[schemas.Task])
+@router.get("/priority/{priority}", response_model=None, responses=TASK_LIST_RESPONSES)
 def read_tasks_by_priority(
     priority: str,
-    current_user: schemas.User = Depends(auth.get_current_active_user),
-    db: Session = Depends(get_db)
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    current_user: schemas.User = Depends(auth.get_current_read_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get tasks by priority.
@@ -140,5 +746,5 @@ def read_tasks_by_priority(
             detail="Invalid priority. Must be one of: low, medium, high"
         )
     
-    tasks = crud.get_tasks_by_priority(db, user_id=current_user.id, priority=priority_enum)
-    return tasks 
\ No newline at end of file
+    tasks = crud.get_tasks_by_priority(db, user_id=current_user.id, priority=priority_enum, columns=fields)
+    return _task_list(db, current_user.id, tasks, fields)
\ No newline at end of file
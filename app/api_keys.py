@@ -0,0 +1,110 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import crud, schemas
+
+load_dotenv()
+
+# API key configuration
+# How long a validated key is trusted from memory; bounds how stale another
+# worker's view of a revocation can be
+API_KEY_CACHE_SECONDS = float(os.getenv("API_KEY_CACHE_SECONDS", "60"))
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+
+# Keys look like "tm_<prefix>_<secret>", so they are distinguishable from JWTs
+KEY_MARKER = "tm_"
+PREFIX_LENGTH = 8
+
+def generate_key() -> Tuple[str, str]:
+    """Return a new (key, prefix); the key carries ~256 bits of entropy."""
+    prefix = secrets.token_hex(PREFIX_LENGTH // 2)
+    return f"{KEY_MARKER}{prefix}_{secrets.token_urlsafe(32)}", prefix
+
+def is_api_key(token: str) -> bool:
+    return token.startswith(KEY_MARKER)
+
+def digest(key: str) -> str:
+    # A plain hash suffices: unlike passwords, the keys are random and too long to brute-force
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def parse_prefix(key: str) -> Optional[str]:
+    prefix = key[len(KEY_MARKER):len(KEY_MARKER) + PREFIX_LENGTH]
+    return prefix if len(prefix) == PREFIX_LENGTH else None
+
+class ApiKeyCache:
+    """In-memory digest → user map, so a repeat request skips the database."""
+
+    def __init__(self, ttl: float = API_KEY_CACHE_SECONDS, max_size: int = API_KEY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[schemas.User, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key_digest: str) -> Optional[schemas.User]:
+        with self._lock:
+            entry = self._entries.get(key_digest)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[key_digest]
+                return None
+            return entry[0]
+
+    def put(self, key_digest: str, user: schemas.User) -> None:
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                now = time.monotonic()
+                for stale in [d for d, (_, expires) in self._entries.items() if expires < now]:
+                    del self._entries[stale]
+                if len(self._entries) >= self.max_size:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key_digest] = (user, time.monotonic() + self.ttl)
+
+    def invalidate(self, key_digest: str) -> None:
+        with self._lock:
+            self._entries.pop(key_digest, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+cache = ApiKeyCache()
+
+def authenticate(db: Session, key: str) -> Optional[schemas.User]:
+    """Resolve an API key to its owner, from memory when possible."""
+    key_digest = digest(key)
+    user = cache.get(key_digest)
+    if user is not None:
+        return user
+    prefix = parse_prefix(key)
+    if prefix is None:
+        return None
+    for stored in crud.get_active_api_keys_by_prefix(db, prefix=prefix):
+        if hmac.compare_digest(stored.key_hash, key_digest):
+            owner = crud.get_user(db, user_id=stored.user_id)
+            if owner is None:
+                return None
+            user = schemas.User.model_validate(owner)
+            cache.put(key_digest, user)
+            return user
+    return None
+
+def create(db: Session, user_id: int, name: str):
+    """Create a key for a user; returns the stored row and the plaintext key (shown once)."""
+    key, prefix = generate_key()
+    return crud.create_api_key(db, user_id=user_id, name=name, prefix=prefix, key_hash=digest(key)), key
+
+def revoke(db: Session, user_id: int, key_id: int):
+    """Revoke a key and drop it from this process's cache."""
+    revoked = crud.revoke_api_key(db, user_id=user_id, key_id=key_id)
+    if revoked is not None:
+        cache.invalidate(revoked.key_hash)
+    return revoked
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, exists, func, insert, literal, select
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+from . import models, sharding
+from .database import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Archival configuration
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+_COLUMNS = ["id", "title", "description", "priority", "status", "due_date", "created_at", "updated_at", "owner_id", "parent_id", "recurrence", "version"]
+
+def archive_completed_tasks(
+    bind: Engine,
+    older_than: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Move tasks completed longer than `older_than` ago into `tasks_archive`.
+
+    A task's completion time is its last update (or creation, if never updated).
+    Only tasks without subtasks are archived, so trees are archived leaves first.
+    Archived tasks keep no tags or occurrence exceptions.
+    Each batch is its own short transaction, so the write lock is never held for
+    more than `batch_size` rows. Returns the number of tasks archived.
+    """
+    tasks = models.Task.__table__
+    children = tasks.alias("children")
+    archive = models.TaskArchive.__table__
+    closure = models.TaskClosure.__table__
+    task_tags = models.TaskTag.__table__
+    occurrences = models.TaskOccurrence.__table__
+    cutoff = (now or datetime.now(timezone.utc)) - older_than
+    archived = 0
+    # Repeated on every statement, not only the SELECT: a task reopened or given
+    # a subtask in between (where FOR UPDATE does not block it) stays put
+    archivable = (
+        tasks.c.status == models.StatusEnum.completed,
+        func.coalesce(tasks.c.updated_at, tasks.c.created_at) < cutoff,
+        ~exists().where(children.c.parent_id == tasks.c.id),
+    )
+    while True:
+        with bind.begin() as conn:
+            ids = conn.execute(
+                select(tasks.c.id).where(*archivable).order_by(tasks.c.id).limit(batch_size).with_for_update()
+            ).scalars().all()
+            if not ids:
+                return archived
+            conn.execute(
+                insert(archive).from_select(
+                    _COLUMNS + ["archived_at"],
+                    select(*[tasks.c[name] for name in _COLUMNS], literal(datetime.now(timezone.utc)))
+                    .where(tasks.c.id.in_(ids), *archivable),
+                )
+            )
+            ids = conn.execute(
+                select(archive.c.id).where(archive.c.id.in_(ids)).order_by(archive.c.id)
+            ).scalars().all()
+            conn.execute(delete(task_tags).where(task_tags.c.task_id.in_(ids)))
+            conn.execute(delete(occurrences).where(occurrences.c.task_id.in_(ids)))
+            conn.execute(delete(tasks).where(tasks.c.id.in_(ids), *archivable))
+            conn.execute(delete(closure).where(closure.c.descendant_id.in_(ids)))
+        archived += len(ids)
+
+def archive_all() -> int:
+    """Run one archival pass over the primary or, when sharded, every shard."""
+    engines = list(sharding.router.shards.values()) if sharding.router is not None else [engine]
+    return sum(archive_completed_tasks(bind) for bind in engines)
+
+async def run_archiver(interval: float = ARCHIVE_INTERVAL_SECONDS):
+    """Background loop started from the app lifespan."""
+    while True:
+        try:
+            count = await asyncio.to_thread(archive_all)
+            if count:
+                logger.info("Archived %d completed tasks", count)
+        except Exception:
+            logger.exception("Task archival failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,195 @@
+import enum
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+from dotenv import load_dotenv
+
+from . import models, sharding
+from .database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Audit log configuration
+# Entries waiting to be written; beyond this, new entries are dropped (and counted)
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "0.5"))
+
+# Session.info key holding entries of the open transaction
+_STAGED = "audit_entries"
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """The fields whose value changed, as {field: {"old": ..., "new": ...}}."""
+    changes = {}
+    for field, value in new.items():
+        before, after = _jsonable(old.get(field)), _jsonable(value)
+        if before != after:
+            changes[field] = {"old": before, "new": after}
+    return changes
+
+def stage(db: Session, owner_id: int, task_id: int, op: str, changes: Optional[dict] = None, actor_id: Optional[int] = None) -> None:
+    """
+    Attach a history entry to the session's transaction.
+
+    Entries reach the writer when the transaction commits and are dropped if it
+    rolls back, so the audit log never records a change that did not happen.
+    """
+    db.info.setdefault(_STAGED, []).append({
+        "task_id": task_id,
+        "owner_id": owner_id,
+        "actor_id": owner_id if actor_id is None else actor_id,
+        "op": op,
+        "changes": json.dumps(changes) if changes else None,
+        "created_at": datetime.utcnow(),
+    })
+
+class AuditWriter:
+    """
+    Writes history entries in batches on a background thread.
+
+    Requests only enqueue, so the audit log adds no database work to a write.
+    The queue is bounded: when the writer falls behind, entries are dropped
+    rather than growing memory or blocking requests, and `stats()` reports
+    the backlog, its high-water mark and the drops.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        queue_size: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_seconds: float = AUDIT_FLUSH_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue: "queue.Queue[dict]" = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.high_water = 0
+        self.last_batch_ms = 0.0
+
+    def submit(self, entries: List[dict]) -> None:
+        """Queue entries without blocking; drops them when the queue is full."""
+        for entry in entries:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning("Audit queue full; %s entries dropped so far", self.dropped)
+                continue
+            self.enqueued += 1
+        self.high_water = max(self.high_water, self._queue.qsize())
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop the writer thread and write everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Write all queued entries now, in the calling thread (with the writer thread stopped)."""
+        written = 0
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_batch_ms": round(self.last_batch_ms, 3),
+        }
+
+    def _take(self, block: bool) -> List[dict]:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_seconds) if block else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        groups = {}
+        for entry in batch:
+            shard = sharding.router.shard_for(entry["owner_id"]) if sharding.router is not None else None
+            groups.setdefault(shard, []).append(entry)
+        started = time.perf_counter()
+        for entries in groups.values():
+            db = self.session_factory()
+            try:
+                sharding.bind_session(db, entries[0]["owner_id"])
+                db.add_all([models.TaskEvent(**entry) for entry in entries])
+                db.commit()
+                self.written += len(entries)
+            except Exception:
+                db.rollback()
+                self.failed += len(entries)
+                logger.exception("Failed to write %s audit entries", len(entries))
+            finally:
+                db.close()
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+
+writer = AuditWriter()
+
+@event.listens_for(Session, "after_commit")
+def _submit_staged(session: Session) -> None:
+    entries = session.info.pop(_STAGED, None)
+    if entries:
+        writer.submit(entries)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_staged(session: Session, previous_transaction) -> None:
+    # A rolled-back savepoint keeps the entries staged before it (see crud._audit)
+    if not previous_transaction.nested:
+        session.info.pop(_STAGED, None)
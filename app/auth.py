@@ -1,15 +1,17 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import hmac
+import secrets
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 
-from . import crud, schemas
-from .database import get_db
+from . import api_keys, crud, passwords, schemas, sharding
+from .database import get_db, get_read_db
 
 load_dotenv()
 
@@ -17,20 +19,18 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    return pwd_context.hash(password)
+    return passwords.context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
@@ -43,6 +43,62 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    """Keyed digest stored instead of the token; cheap to compute, useless if the table leaks."""
+    return hmac.new(SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def create_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """Issue an opaque refresh token, continuing `family_id` when rotating."""
+    token = secrets.token_urlsafe(32)
+    crud.create_refresh_token(
+        db,
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return token
+
+def issue_tokens(db: Session, user, family_id: Optional[str] = None) -> dict:
+    """Create an access token and a refresh token for a user."""
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": create_refresh_token(db, user.id, family_id),
+    }
+
+def rotate_refresh_token(db: Session, token: str) -> dict:
+    """
+    Exchange a refresh token for new tokens; each refresh token works once.
+
+    Presenting a token that was already used means it was copied, so the
+    whole family is revoked and the legitimate client must log in again.
+    """
+    invalid_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    now = datetime.utcnow()
+    stored = crud.get_refresh_token(db, token_hash=hash_refresh_token(token))
+    if stored is None or stored.revoked_at is not None or stored.expires_at.replace(tzinfo=None) <= now:
+        raise invalid_exception
+    if not crud.use_refresh_token(db, stored.id, now):
+        crud.revoke_refresh_token_family(db, stored.family_id, now)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token reuse detected",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = crud.get_user(db, user_id=stored.user_id)
+    if user is None:
+        db.rollback()
+        raise invalid_exception
+    return issue_tokens(db, user, family_id=stored.family_id)
+
 def authenticate_user(db: Session, username: str, password: str):
     """Authenticate a user with username and password."""
     user = crud.get_user_by_username(db, username=username)
@@ -50,15 +106,24 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     if not verify_password(password, user.hashed_password):
         return False
+    if passwords.context.needs_update(user.hashed_password):
+        # Weaker than the current policy; upgrade without delaying this login
+        passwords.schedule_rehash(db.get_bind(), user.id, password, user.hashed_password)
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Get the current authenticated user."""
+def _get_user_from_token(token: str, db: Session):
+    """Resolve a bearer token (JWT or API key) to its user."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if api_keys.is_api_key(token):
+        user = api_keys.authenticate(db, token)
+        if user is None:
+            raise credentials_exception
+        sharding.bind_session(db, user.id)
+        return user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -70,8 +135,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = crud.get_user_by_username(db, username=token_data.username)
     if user is None:
         raise credentials_exception
+    sharding.bind_session(db, user.id)
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Get the current authenticated user."""
+    return _get_user_from_token(token, db)
+
+def get_current_read_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    """Get the current authenticated user from the read session (replica when configured)."""
+    return _get_user_from_token(token, db)
+
 def get_current_active_user(current_user: schemas.User = Depends(get_current_user)):
     """Get the current active user."""
     return current_user 
\ No newline at end of file
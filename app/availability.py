@@ -0,0 +1,103 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import crud, models
+
+load_dotenv()
+
+# Username availability configuration
+USERNAME_FILTER_CAPACITY = int(os.getenv("USERNAME_FILTER_CAPACITY", "100000"))
+USERNAME_FILTER_ERROR_RATE = float(os.getenv("USERNAME_FILTER_ERROR_RATE", "0.01"))
+# Rebuild interval, so usernames registered through other workers are picked up
+USERNAME_FILTER_REFRESH_SECONDS = float(os.getenv("USERNAME_FILTER_REFRESH_SECONDS", "300"))
+
+class BloomFilter:
+    """Fixed-size bloom filter: no false negatives, `error_rate` false positives at `capacity`."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str) -> Iterable[int]:
+        # Double hashing: h1 + i * h2 gives k independent-enough positions
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+class UsernameIndex:
+    """
+    Answers "is this username free?" mostly from memory.
+
+    A username missing from the bloom filter is definitely free; a hit is
+    confirmed with an indexed lookup, so only taken names (and the ~1% of
+    false positives) reach the database. The filter is rebuilt from the users
+    table when it ages out or fills past its capacity.
+    """
+
+    def __init__(
+        self,
+        capacity: int = USERNAME_FILTER_CAPACITY,
+        error_rate: float = USERNAME_FILTER_ERROR_RATE,
+        refresh_seconds: float = USERNAME_FILTER_REFRESH_SECONDS,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._filter: Optional[BloomFilter] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        return (
+            self._filter is None
+            or self._filter.count > self._filter.capacity
+            or time.monotonic() - self._built_at > self.refresh_seconds
+        )
+
+    def rebuild(self, db: Session) -> None:
+        usernames = [username for (username,) in db.query(models.User.username).yield_per(1000)]
+        bloom = BloomFilter(max(self.capacity, 2 * len(usernames)), self.error_rate)
+        for username in usernames:
+            bloom.add(username)
+        self._filter = bloom
+        self._built_at = time.monotonic()
+
+    def add(self, username: str) -> None:
+        """Record a username registered by this process."""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(username)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._filter = None
+
+    def is_available(self, db: Session, username: str) -> bool:
+        with self._lock:
+            if self._stale():
+                self.rebuild(db)
+            maybe_taken = username in self._filter
+        if not maybe_taken:
+            return True
+        return crud.get_user_by_username(db, username=username) is None
+
+usernames = UsernameIndex()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+from . import models, sharding
+from .database import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Change log retention
+CHANGE_RETENTION_DAYS = float(os.getenv("CHANGE_RETENTION_DAYS", "30"))
+CHANGE_COMPACT_INTERVAL_SECONDS = float(os.getenv("CHANGE_COMPACT_INTERVAL_SECONDS", "3600"))
+
+def compact_changes(
+    bind: Engine,
+    older_than: timedelta = timedelta(days=CHANGE_RETENTION_DAYS),
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Delete change log entries older than the retention window.
+
+    Each owner's cursor remembers the highest sequence removed, so clients asking
+    for changes from before it are told to resync. Returns the number of entries
+    deleted.
+    """
+    changes = models.TaskChange.__table__
+    cursors = models.ChangeCursor.__table__
+    cutoff = (now or datetime.now(timezone.utc)) - older_than
+    deleted = 0
+    with bind.connect() as conn:
+        expired = conn.execute(
+            select(changes.c.owner_id, func.max(changes.c.seq))
+            .where(changes.c.changed_at < cutoff)
+            .group_by(changes.c.owner_id)
+        ).all()
+    for owner_id, max_seq in expired:
+        with bind.begin() as conn:
+            conn.execute(
+                update(cursors)
+                .where(cursors.c.owner_id == owner_id)
+                .where(cursors.c.compacted_seq < max_seq)
+                .values(compacted_seq=max_seq)
+            )
+            deleted += conn.execute(
+                delete(changes).where(changes.c.owner_id == owner_id).where(changes.c.seq <= max_seq)
+            ).rowcount
+    return deleted
+
+def compact_all() -> int:
+    """Run one compaction pass over the primary or, when sharded, every shard."""
+    engines = list(sharding.router.shards.values()) if sharding.router is not None else [engine]
+    return sum(compact_changes(bind) for bind in engines)
+
+async def run_compactor(interval: float = CHANGE_COMPACT_INTERVAL_SECONDS):
+    """Background loop started from the app lifespan."""
+    while True:
+        try:
+            count = await asyncio.to_thread(compact_all)
+            if count:
+                logger.info("Compacted %d task change entries", count)
+        except Exception:
+            logger.exception("Change log compaction failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,217 @@
+import os
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from dotenv import load_dotenv
+import brotli
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+load_dotenv()
+
+# Compression configuration
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "256"))
+
+# Content types worth compressing; event streams are left alone so events are not held back
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+SKIPPED_TYPES = ("text/event-stream",)
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else output
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        output = self._compressor.process(data)
+        return output + self._compressor.flush() if flush else output
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else output
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+# Server preference order; encodings whose library is missing are never offered
+ENCODERS = {"br": _BrotliEncoder, "zstd": _ZstdEncoder, "gzip": _GzipEncoder}
+AVAILABLE = [
+    name for name, enabled in (("br", True), ("zstd", zstandard is not None), ("gzip", True))
+    if enabled
+]
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred available encoding the client accepts, honouring q-values."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(name, wildcard), -rank, name) for rank, name in enumerate(AVAILABLE)]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+def _compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    if "content-encoding" in headers or content_type.startswith(SKIPPED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by (path, ETag, encoding)."""
+
+    def __init__(self, size: int = COMPRESSION_CACHE_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Tuple[str, str, str], body: bytes) -> None:
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+# Shared by the middleware instances of this process
+body_cache = CompressedBodyCache()
+
+class CompressionMiddleware:
+    """
+    Compresses responses with gzip, brotli or zstd as negotiated by Accept-Encoding.
+
+    Bodies below `minimum_size` are sent as-is. Streamed responses (exports) are
+    compressed chunk by chunk and flushed, so nothing is buffered. When a complete
+    response carries an ETag, its compressed body is cached under that tag and
+    reused while the resource is unchanged; the ETag is weakened as the encoded
+    bytes differ from the identity representation.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        cache: Optional[CompressedBodyCache] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache if cache is not None else body_cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, scope, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+class _CompressingResponder:
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.path = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope["query_string"] else "")
+        self._send = send
+        self.start: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(scope=start)
+            if not _compressible(headers) or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            self._set_encoding_headers(headers)
+            if not more_body:
+                body = self._compress_whole(body, headers.get("etag"))
+                headers["content-length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            del headers["content-length"]
+            self.encoder = ENCODERS[self.encoding]()
+            await self._send(start)
+
+        if self.passthrough:
+            await self._send(message)
+            return
+        chunk = self.encoder.compress(body, flush=more_body)
+        if not more_body:
+            chunk += self.encoder.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = "W/" + etag
+
+    def _compress_whole(self, body: bytes, etag: Optional[str]) -> bytes:
+        key = (self.path, etag, self.encoding) if etag else None
+        if key is not None:
+            cached = self.middleware.cache.get(key)
+            if cached is not None:
+                return cached
+        encoder = ENCODERS[self.encoding]()
+        compressed = encoder.compress(body) + encoder.finish()
+        if key is not None:
+            self.middleware.cache.put(key, compressed)
+        return compressed
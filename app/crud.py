@@ -1,7 +1,12 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.orm import Session, aliased, selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import and_, case, delete, func, insert, join, literal, or_, select, text, true, tuple_, union_all, update
+import heapq
+import json
+from itertools import islice
 from typing import List, Optional
-from . import models, schemas
+from datetime import datetime, timedelta
+from . import audit, models, recurrence, schemas
 from .auth import get_password_hash
 
 # User CRUD operations
@@ -17,6 +22,17 @@ def get_user_by_email(db: Session, email: str):
     """Get a user by email."""
     return db.query(models.User).filter(models.User.email == email).first()
 
+def get_user_conflict(db: Session, username: str, email: str) -> Optional[str]:
+    """Return "username" or "email" if either is already taken, in a single query."""
+    taken = db.query(models.User.username, models.User.email).filter(
+        or_(models.User.username == username, models.User.email == email)
+    ).limit(2).all()
+    if any(row.username == username for row in taken):
+        return "username"
+    if taken:
+        return "email"
+    return None
+
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     """Get all users with pagination."""
     return db.query(models.User).offset(skip).limit(limit).all()
@@ -34,59 +50,777 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
+# Refresh tokens
+def create_refresh_token(db: Session, user_id: int, token_hash: str, family_id: str, expires_at: datetime):
+    """Store a refresh token digest."""
+    db_token = models.RefreshToken(
+        user_id=user_id, token_hash=token_hash, family_id=family_id, expires_at=expires_at
+    )
+    db.add(db_token)
+    db.commit()
+    return db_token
+
+def get_refresh_token(db: Session, token_hash: str):
+    """Get a refresh token by its digest."""
+    return db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == token_hash).first()
+
+def use_refresh_token(db: Session, token_id: int, now: datetime) -> bool:
+    """Mark a refresh token used; False if another request already used it."""
+    claimed = db.query(models.RefreshToken).filter(
+        and_(
+            models.RefreshToken.id == token_id,
+            models.RefreshToken.used_at.is_(None),
+            models.RefreshToken.revoked_at.is_(None),
+        )
+    ).update({models.RefreshToken.used_at: now}, synchronize_session=False)
+    return claimed == 1
+
+def revoke_refresh_token_family(db: Session, family_id: str, now: datetime):
+    """Revoke every token descended from the same login."""
+    db.query(models.RefreshToken).filter(
+        and_(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+    ).update({models.RefreshToken.revoked_at: now}, synchronize_session=False)
+    db.commit()
+
+# API keys
+def create_api_key(db: Session, user_id: int, name: str, prefix: str, key_hash: str):
+    """Store an API key digest."""
+    db_key = models.ApiKey(user_id=user_id, name=name, prefix=prefix, key_hash=key_hash)
+    db.add(db_key)
+    db.commit()
+    db.refresh(db_key)
+    return db_key
+
+def get_api_keys(db: Session, user_id: int):
+    """Get a user's API keys, including revoked ones."""
+    return db.query(models.ApiKey).filter(models.ApiKey.user_id == user_id).order_by(models.ApiKey.id).all()
+
+def get_active_api_keys_by_prefix(db: Session, prefix: str):
+    """Get unrevoked API keys sharing a prefix (normally at most one)."""
+    return db.query(models.ApiKey).filter(
+        and_(models.ApiKey.prefix == prefix, models.ApiKey.revoked_at.is_(None))
+    ).all()
+
+def revoke_api_key(db: Session, user_id: int, key_id: int):
+    """Revoke one of a user's API keys."""
+    db_key = db.query(models.ApiKey).filter(
+        and_(models.ApiKey.id == key_id, models.ApiKey.user_id == user_id)
+    ).first()
+    if db_key is None:
+        return None
+    if db_key.revoked_at is None:
+        db_key.revoked_at = datetime.utcnow()
+        db.commit()
+        db.refresh(db_key)
+    return db_key
+
 # Task CRUD operations
-def get_task(db: Session, task_id: int, user_id: int):
+TASK_COLUMNS = ["id", "title", "description", "priority", "status", "due_date", "created_at", "updated_at", "owner_id", "parent_id", "recurrence", "version"]
+
+# What ?fields= may ask for: the columns, and tags (see with_tag_names)
+TASK_FIELDS = TASK_COLUMNS + ["tags"]
+
+def _task_query(db: Session, columns: Optional[List[str]] = None):
+    """Query whole Task entities (tags loaded in one extra query), or only the given columns as rows."""
+    if columns is None:
+        return db.query(models.Task).options(selectinload(models.Task.tags))
+    return db.query(*[getattr(models.Task, column) for column in columns if column != "tags"])
+
+def with_tag_names(db: Session, user_id: int, rows) -> List[dict]:
+    """Column rows (see _task_query) as dicts, each with its task's tag names; one query for all."""
+    names = {row.id: [] for row in rows}
+    tagged = db.execute(
+        select(models.TaskTag.task_id, models.Tag.name)
+        .join(models.Tag, models.Tag.id == models.TaskTag.tag_id)
+        .where(models.TaskTag.owner_id == user_id, models.TaskTag.task_id.in_(names))
+        .order_by(models.Tag.name)
+    )
+    for task_id, name in tagged:
+        names[task_id].append(name)
+    return [{**row._mapping, "tags": names[row.id]} for row in rows]
+
+def get_task(db: Session, task_id: int, user_id: int, columns: Optional[List[str]] = None):
     """Get a task by ID for a specific user."""
-    return db.query(models.Task).filter(
+    return _task_query(db, columns).filter(
         and_(models.Task.id == task_id, models.Task.owner_id == user_id)
     ).first()
 
-def get_tasks(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+def get_tasks_by_ids(db: Session, user_id: int, task_ids: List[int], columns: Optional[List[str]] = None):
+    """Get several tasks for a specific user in one query, in the requested order."""
+    found = {
+        task.id: task
+        for task in _task_query(db, columns).filter(
+            and_(models.Task.owner_id == user_id, models.Task.id.in_(set(task_ids)))
+        )
+    }
+    return [found[task_id] for task_id in task_ids if task_id in found]
+
+def get_tasks(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    include_archived: bool = False,
+    columns: Optional[List[str]] = None,
+):
     """Get all tasks for a specific user with pagination."""
-    return db.query(models.Task).filter(
+    if include_archived:
+        return query_tasks(
+            db, user_id=user_id, skip=skip, limit=limit, include_archived=True, columns=columns
+        )
+    return _task_query(db, columns).filter(
         models.Task.owner_id == user_id
     ).offset(skip).limit(limit).all()
 
-def create_task(db: Session, task: schemas.TaskCreate, user_id: int):
-    """Create a new task for a user."""
-    db_task = models.Task(**task.dict(), owner_id=user_id)
+def query_tasks(
+    db: Session,
+    user_id: int,
+    status: Optional[models.StatusEnum] = None,
+    priority: Optional[models.PriorityEnum] = None,
+    skip: int = 0,
+    limit: int = 100,
+    include_archived: bool = False,
+    columns: Optional[List[str]] = None,
+    tags_any: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+):
+    """Get tasks matching optional filters, reading the archive only when asked."""
+    tagged = _tagged_task_ids(user_id, tags_any, tags_all)
+
+    def filtered(model):
+        conditions = [model.owner_id == user_id]
+        if status is not None:
+            conditions.append(model.status == status)
+        if priority is not None:
+            conditions.append(model.priority == priority)
+        conditions.extend(model.id.in_(subquery) for subquery in tagged)
+        return conditions
+
+    if not include_archived:
+        return _task_query(db, columns).filter(*filtered(models.Task)).order_by(
+            models.Task.id
+        ).offset(skip).limit(limit).all()
+
+    columns = [column for column in columns if column != "tags"] if columns else TASK_COLUMNS
+    hot = select(*[getattr(models.Task, c) for c in columns]).where(*filtered(models.Task))
+    cold = select(*[getattr(models.TaskArchive, c) for c in columns]).where(*filtered(models.TaskArchive))
+    combined = union_all(hot, cold).subquery()
+    # Both tables are mapped to the same database, so the Task bind serves the union
+    return db.execute(
+        select(combined).order_by(combined.c.id).offset(skip).limit(limit),
+        bind_arguments={"mapper": models.Task},
+    ).all()
+
+def _matching(
+    user_id: int,
+    after_id: int = 0,
+    status: Optional[models.StatusEnum] = None,
+    priority: Optional[models.PriorityEnum] = None,
+    tags_any: Optional[List[str]] = None,
+):
+    conditions = [models.Task.owner_id == user_id, models.Task.id > after_id]
+    if status is not None:
+        conditions.append(models.Task.status == models.StatusEnum(status))
+    if priority is not None:
+        conditions.append(models.Task.priority == models.PriorityEnum(priority))
+    conditions.extend(models.Task.id.in_(subquery) for subquery in _tagged_task_ids(user_id, tags_any, None))
+    return conditions
+
+def get_matching_task_ids(db: Session, user_id: int, after_id: int = 0, limit: int = 100, **filters) -> List[int]:
+    """Ids of a user's tasks matching the filters (status, priority, tags_any), in id order after `after_id`."""
+    return db.execute(
+        select(models.Task.id).where(*_matching(user_id, after_id, **filters)).order_by(models.Task.id).limit(limit)
+    ).scalars().all()
+
+def count_matching_tasks(db: Session, user_id: int, after_id: int = 0, **filters) -> int:
+    return db.execute(select(func.count()).select_from(models.Task).where(*_matching(user_id, after_id, **filters))).scalar()
+
+def _tagged_task_ids(user_id: int, tags_any: Optional[List[str]], tags_all: Optional[List[str]]):
+    """Subqueries of task ids having any / all of the given tags, via the (tag_id, task_id) index."""
+    subqueries = []
+    for names, require_all in ((tags_any, False), (tags_all, True)):
+        if not names:
+            continue
+        names = list(dict.fromkeys(names))
+        query = select(models.TaskTag.task_id).join(models.Tag, models.Tag.id == models.TaskTag.tag_id).where(
+            and_(models.Tag.owner_id == user_id, models.Tag.name.in_(names))
+        )
+        if require_all:
+            query = query.group_by(models.TaskTag.task_id).having(func.count() == len(names))
+        subqueries.append(query)
+    return subqueries
+
+def _tag_list(names: List[str]) -> List[str]:
+    """Tag names as stored: stripped, without blanks or duplicates."""
+    return list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+def _set_tags(db: Session, task_id: int, user_id: int, names: List[str]):
+    """Replace a task's tags, creating tags the user does not have yet."""
+    names = _tag_list(names)
+    db.execute(
+        delete(models.TaskTag).where(models.TaskTag.task_id == task_id),
+        execution_options={"synchronize_session": False},
+    )
+    if not names:
+        return
+    existing = dict(db.execute(
+        select(models.Tag.name, models.Tag.id).where(
+            and_(models.Tag.owner_id == user_id, models.Tag.name.in_(names))
+        )
+    ).all())
+    new_tags = [models.Tag(owner_id=user_id, name=name) for name in names if name not in existing]
+    if new_tags:
+        db.add_all(new_tags)
+        db.flush()
+        existing.update((tag.name, tag.id) for tag in new_tags)
+    db.add_all([models.TaskTag(task_id=task_id, tag_id=existing[name], owner_id=user_id) for name in names])
+    db.flush()
+
+def _save(db: Session, instance, commit: bool):
+    """Commit, or just flush when the caller owns the transaction."""
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    db.refresh(instance)
+
+# Task fields tracked in the history (see app.audit)
+AUDITED_FIELDS = ["title", "description", "priority", "status", "due_date", "parent_id", "recurrence"]
+
+def _audit(db: Session, user_id: int, task_id: int, op: str, changes: Optional[dict] = None):
+    """Stage a history entry, written after commit; flushing first keeps a failed write from staging one."""
+    db.flush()
+    audit.stage(db, owner_id=user_id, task_id=task_id, op=op, changes=changes)
+
+def create_task(db: Session, task: schemas.TaskCreate, user_id: int, commit: bool = True):
+    """Create a new task for a user; None if the requested parent does not exist."""
+    if task.parent_id is not None and get_task(db, task_id=task.parent_id, user_id=user_id) is None:
+        return None
+    db_task = models.Task(**task.dict(exclude={"tags"}), owner_id=user_id)
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    db.flush()
+    _link_to_parent(db, db_task.id, task.parent_id, user_id)
+    if task.tags:
+        _set_tags(db, db_task.id, user_id, task.tags)
+    record_change(db, user_id=user_id, task_id=db_task.id, op=schemas.ChangeOp.created)
+    created = {field: getattr(db_task, field) for field in AUDITED_FIELDS if getattr(db_task, field) is not None}
+    if task.tags:
+        created["tags"] = _tag_list(task.tags)
+    _audit(db, user_id, db_task.id, "created", audit.diff({}, created))
+    _save(db, db_task, commit)
     return db_task
 
-def update_task(db: Session, task_id: int, task_update: schemas.TaskUpdate, user_id: int):
-    """Update a task for a specific user."""
+def update_task(
+    db: Session,
+    task_id: int,
+    task_update: schemas.TaskUpdate,
+    user_id: int,
+    commit: bool = True,
+    expected_version: Optional[int] = None,
+):
+    """
+    Update a task for a specific user.
+
+    The UPDATE only applies to the version read here (see models.Task.version):
+    raises StaleDataError if another write got in between, or if the task is not
+    at `expected_version` when one is given.
+    """
     db_task = get_task(db, task_id=task_id, user_id=user_id)
     if not db_task:
         return None
+    if expected_version is not None and db_task.version != expected_version:
+        raise StaleDataError(f"Task {task_id} is at version {db_task.version}, not {expected_version}")
     
     update_data = task_update.dict(exclude_unset=True)
+    tags = update_data.pop("tags", None)
+    old = {field: getattr(db_task, field) for field in update_data}
+    new = dict(update_data)
+    if tags is not None:
+        old["tags"] = [tag.name for tag in db_task.tags]
+        new["tags"] = _tag_list(tags)
     for field, value in update_data.items():
         setattr(db_task, field, value)
+    if tags is not None:
+        _set_tags(db, task_id, user_id, tags)
+        # Tags live in another table; touch the row so its version moves on too
+        db_task.updated_at = func.now()
+    if "recurrence" in update_data or "due_date" in update_data:
+        # Stored occurrences are keyed by the old series' times
+        db.execute(
+            delete(models.TaskOccurrence).where(models.TaskOccurrence.task_id == task_id),
+            execution_options={"synchronize_session": False},
+        )
+    record_change(db, user_id=user_id, task_id=task_id, op=schemas.ChangeOp.updated)
+    changes = audit.diff(old, new)
+    if changes:
+        _audit(db, user_id, task_id, "updated", changes)
     
-    db.commit()
-    db.refresh(db_task)
+    _save(db, db_task, commit)
     return db_task
 
-def delete_task(db: Session, task_id: int, user_id: int):
-    """Delete a task for a specific user."""
-    db_task = get_task(db, task_id=task_id, user_id=user_id)
-    if not db_task:
-        return False
+def delete_task(db: Session, task_id: int, user_id: int, commit: bool = True) -> List[int]:
+    """Delete a task and all of its subtasks; returns the deleted ids (empty if not found)."""
+    closure = models.TaskClosure
+    deleted = db.execute(
+        select(closure.descendant_id)
+        .where(and_(closure.ancestor_id == task_id, closure.owner_id == user_id))
+        .order_by(closure.depth.desc(), closure.descendant_id)
+    ).scalars().all()
+    if not deleted:
+        return []
     
-    db.delete(db_task)
-    db.commit()
-    return True
+    for dependent in (models.TaskTag, models.TaskOccurrence):
+        db.execute(
+            delete(dependent).where(dependent.task_id.in_(deleted)),
+            execution_options={"synchronize_session": False},
+        )
+    db.execute(
+        delete(models.Task).where(models.Task.id.in_(deleted)),
+        execution_options={"synchronize_session": False},
+    )
+    db.execute(
+        delete(closure).where(and_(closure.owner_id == user_id, closure.descendant_id.in_(deleted))),
+        execution_options={"synchronize_session": False},
+    )
+    record_changes(db, user_id=user_id, task_ids=deleted, op=schemas.ChangeOp.deleted)
+    for deleted_id in deleted:
+        _audit(db, user_id, deleted_id, "deleted")
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return deleted
+
+# Recurring tasks
+def _series_start(task) -> datetime:
+    return recurrence.naive_utc(task.due_date or task.created_at)
+
+def update_occurrence(
+    db: Session, task_id: int, occurrence: schemas.OccurrenceUpdate, user_id: int, commit: bool = True
+):
+    """
+    Record how one occurrence of a recurring task differs from its series.
+
+    Returns None if the task does not exist or does not recur; raises ValueError
+    if the series has no occurrence at `occurrence.occurs_at`.
+    """
+    db_task = get_task(db, task_id=task_id, user_id=user_id)
+    if db_task is None or db_task.recurrence is None:
+        return None
+    occurs_at = recurrence.naive_utc(occurrence.occurs_at)
+    rule = recurrence.parse(db_task.recurrence)
+    if next(recurrence.between(rule, _series_start(db_task), occurs_at, occurs_at + timedelta(microseconds=1)), None) is None:
+        raise ValueError("The series has no occurrence at that time")
+
+    db_occurrence = db.get(models.TaskOccurrence, (task_id, occurs_at))
+    if db_occurrence is None:
+        db_occurrence = models.TaskOccurrence(task_id=task_id, occurs_at=occurs_at, owner_id=user_id)
+        db.add(db_occurrence)
+    new = occurrence.dict(exclude_unset=True, exclude={"occurs_at"})
+    if new.get("due_date") is not None:
+        new["due_date"] = recurrence.naive_utc(new["due_date"])
+    old = {field: getattr(db_occurrence, field) for field in new}
+    for field, value in new.items():
+        setattr(db_occurrence, field, value)
+    record_change(db, user_id=user_id, task_id=task_id, op=schemas.ChangeOp.updated)
+    _audit(db, user_id, task_id, "occurrence_updated", {
+        "occurs_at": {"old": occurs_at.isoformat(), "new": occurs_at.isoformat()}, **audit.diff(old, new)
+    })
+    _save(db, db_occurrence, commit)
+    return db_occurrence
+
+# Task history
+def get_task_events(db: Session, task_id: int, user_id: int, before_id: Optional[int] = None, limit: int = 50):
+    """Get a task's history, newest first, paging by event id."""
+    query = db.query(models.TaskEvent).filter(
+        models.TaskEvent.task_id == task_id, models.TaskEvent.owner_id == user_id
+    )
+    if before_id is not None:
+        query = query.filter(models.TaskEvent.id < before_id)
+    return query.order_by(models.TaskEvent.id.desc()).limit(limit).all()
+
+def get_calendar(db: Session, user_id: int, start: datetime, end: datetime, limit: int = 500):
+    """
+    Tasks due in [start, end), with recurring tasks expanded into their occurrences.
+
+    Series are expanded lazily and merged in due order, so only the returned
+    `limit` entries are ever materialized, however long the window.
+    """
+    one_off = db.query(models.Task).filter(
+        models.Task.owner_id == user_id,
+        models.Task.recurrence.is_(None),
+        models.Task.due_date >= start,
+        models.Task.due_date < end,
+    ).order_by(models.Task.due_date, models.Task.id).limit(limit).all()
+    series = db.query(models.Task).filter(
+        models.Task.owner_id == user_id,
+        models.Task.recurrence.isnot(None),
+        models.Task.status != models.StatusEnum.completed,
+        func.coalesce(models.Task.due_date, models.Task.created_at) < end,
+    ).all()
+    tasks = {task.id: task for task in one_off + series}
+    exceptions = {}
+    if series:
+        exceptions = {
+            (row.task_id, row.occurs_at): row
+            for row in db.query(models.TaskOccurrence).filter(
+                models.TaskOccurrence.task_id.in_([task.id for task in series]),
+                or_(
+                    and_(models.TaskOccurrence.occurs_at >= start, models.TaskOccurrence.occurs_at < end),
+                    and_(models.TaskOccurrence.due_date >= start, models.TaskOccurrence.due_date < end),
+                ),
+            )
+        }
+
+    def expand(task):
+        rule = recurrence.parse(task.recurrence)
+        for occurs_at in recurrence.between(rule, _series_start(task), start, end):
+            exception = exceptions.get((task.id, occurs_at))
+            # Moved occurrences are merged in at their new time below
+            if exception is None or not (exception.cancelled or exception.due_date is not None):
+                yield occurs_at, task.id, occurs_at
+
+    moved = sorted(
+        (row.due_date, row.task_id, row.occurs_at) for row in exceptions.values()
+        if not row.cancelled and row.due_date is not None and start <= row.due_date < end
+    )
+    merged = heapq.merge(
+        ((recurrence.naive_utc(task.due_date), task.id, None) for task in one_off),
+        moved,
+        *[expand(task) for task in series],
+    )
+
+    entries = []
+    for due_date, task_id, occurs_at in islice(merged, limit):
+        task = tasks[task_id]
+        entry = {"task_id": task_id, "title": task.title, "priority": task.priority, "status": task.status, "due_date": due_date}
+        if occurs_at is not None:
+            exception = exceptions.get((task_id, occurs_at))
+            entry.update(
+                status=exception.status if exception is not None else models.StatusEnum.pending,
+                occurs_at=occurs_at,
+                recurring=True,
+            )
+        entries.append(entry)
+    return entries
+
+# Task hierarchy (closure table)
+def _link_to_parent(db: Session, task_id: int, parent_id: Optional[int], user_id: int):
+    """Add closure rows for a new task: itself, plus every ancestor of its parent."""
+    closure = models.TaskClosure
+    db.execute(insert(closure).values(ancestor_id=task_id, descendant_id=task_id, depth=0, owner_id=user_id))
+    if parent_id is not None:
+        db.execute(insert(closure).from_select(
+            ["ancestor_id", "descendant_id", "depth", "owner_id"],
+            select(closure.ancestor_id, literal(task_id), closure.depth + 1, closure.owner_id)
+            .where(closure.descendant_id == parent_id),
+        ))
+
+def get_subtree(db: Session, task_id: int, user_id: int):
+    """Get a task and all its descendants, parents before children."""
+    closure = models.TaskClosure
+    return db.query(models.Task).join(closure, closure.descendant_id == models.Task.id).filter(
+        and_(closure.ancestor_id == task_id, closure.owner_id == user_id)
+    ).order_by(closure.depth, models.Task.id).all()
+
+def get_subtree_rollup(db: Session, task_id: int, user_id: int):
+    """Count a subtree's tasks by completion; None if the task does not exist."""
+    closure = models.TaskClosure
+    total, completed, depth = db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(case((models.Task.status == models.StatusEnum.completed, 1), else_=0)), 0),
+            func.max(closure.depth),
+        )
+        .select_from(closure)
+        .join(models.Task, models.Task.id == closure.descendant_id)
+        .where(and_(closure.ancestor_id == task_id, closure.owner_id == user_id))
+    ).one()
+    if not total:
+        return None
+    return {"task_id": task_id, "total": total, "completed": completed, "open": total - completed, "depth": depth}
+
+def move_task(db: Session, task_id: int, parent_id: Optional[int], user_id: int, commit: bool = True):
+    """
+    Re-parent a task together with its subtree (`parent_id=None` makes it a root).
 
-def get_tasks_by_status(db: Session, user_id: int, status: models.StatusEnum):
+    Returns None if the task or new parent does not exist; raises ValueError if
+    the new parent lies inside the moved subtree.
+    """
+    closure = models.TaskClosure
+    db_task = get_task(db, task_id=task_id, user_id=user_id)
+    if db_task is None:
+        return None
+    if parent_id is not None:
+        if get_task(db, task_id=parent_id, user_id=user_id) is None:
+            return None
+        if db.get(closure, (task_id, parent_id)) is not None:
+            raise ValueError("A task cannot be moved under its own subtree")
+
+    subtree = select(closure.descendant_id).where(closure.ancestor_id == task_id)
+    # Cut the links from the old ancestors to every node of the subtree...
+    db.execute(
+        delete(closure).where(and_(
+            closure.descendant_id.in_(subtree),
+            closure.ancestor_id.in_(
+                select(closure.ancestor_id).where(and_(closure.descendant_id == task_id, closure.ancestor_id != task_id))
+            ),
+        )),
+        execution_options={"synchronize_session": False},
+    )
+    # ...and link the new parent's ancestors to every node of the subtree
+    if parent_id is not None:
+        above = aliased(closure)
+        below = aliased(closure)
+        db.execute(insert(closure).from_select(
+            ["ancestor_id", "descendant_id", "depth", "owner_id"],
+            # Every ancestor with every descendant: a deliberate cross join
+            select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1, below.owner_id)
+            .select_from(join(above, below, true()))
+            .where(and_(above.descendant_id == parent_id, below.ancestor_id == task_id)),
+        ))
+    changes = audit.diff({"parent_id": db_task.parent_id}, {"parent_id": parent_id})
+    db_task.parent_id = parent_id
+    record_change(db, user_id=user_id, task_id=task_id, op=schemas.ChangeOp.updated)
+    if changes:
+        _audit(db, user_id, task_id, "moved", changes)
+    _save(db, db_task, commit)
+    return db_task
+
+def get_overdue_tasks(
+    db: Session,
+    user_id: int,
+    now: datetime,
+    after_due: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    columns: Optional[List[str]] = None,
+):
+    """Get open tasks past their due date, oldest first, paging by (due_date, id)."""
+    query = _task_query(db, columns).filter(
+        models.Task.owner_id == user_id,
+        text(models.OPEN_TASK_CONDITION),
+        models.Task.due_date < now,
+    )
+    if after_due is not None:
+        query = query.filter(tuple_(models.Task.due_date, models.Task.id) > tuple_(after_due, after_id or 0))
+    return query.order_by(models.Task.due_date, models.Task.id).limit(limit).all()
+
+# Columns shown for the tasks listed on the dashboard
+DASHBOARD_COLUMNS = ["id", "title", "priority", "status", "due_date", "updated_at"]
+
+def get_dashboard(db: Session, user_id: int, limit: int = 5):
+    """
+    Task counts by status and priority, the next open tasks by due date and the
+    most recently updated tasks, in two statements.
+    """
+    counts = db.execute(
+        select(models.Task.status, models.Task.priority, func.count())
+        .where(models.Task.owner_id == user_id)
+        .group_by(models.Task.status, models.Task.priority)
+    ).all()
+    by_status = {member.value: 0 for member in models.StatusEnum}
+    by_priority = {member.value: 0 for member in models.PriorityEnum}
+    for task_status, priority, count in counts:
+        by_status[task_status.value] += count
+        by_priority[priority.value] += count
+
+    # Rank every task both ways in one pass, then keep the top of each ranking
+    due_candidate = case(
+        (and_(models.Task.status != models.StatusEnum.completed, models.Task.due_date.isnot(None)), 1), else_=0
+    )
+    last_touched = func.coalesce(models.Task.updated_at, models.Task.created_at)
+    ranked = select(
+        *[getattr(models.Task, c) for c in DASHBOARD_COLUMNS],
+        due_candidate.label("due_candidate"),
+        func.row_number().over(
+            partition_by=due_candidate, order_by=(models.Task.due_date, models.Task.id)
+        ).label("due_rank"),
+        func.row_number().over(order_by=(last_touched.desc(), models.Task.id.desc())).label("recent_rank"),
+    ).where(models.Task.owner_id == user_id).subquery()
+    rows = db.execute(
+        select(ranked).where(or_(
+            and_(ranked.c.due_candidate == 1, ranked.c.due_rank <= limit),
+            ranked.c.recent_rank <= limit,
+        ))
+    ).all()
+    next_due = sorted((row for row in rows if row.due_candidate and row.due_rank <= limit), key=lambda row: row.due_rank)
+    recent = sorted((row for row in rows if row.recent_rank <= limit), key=lambda row: row.recent_rank)
+    return {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "by_priority": by_priority,
+        "next_due": next_due,
+        "recently_updated": recent,
+    }
+
+def iter_tasks(db: Session, user_id: int, chunk_size: int = 500, columns: Optional[List[str]] = None):
+    """Yield all of a user's tasks in id order, one keyset page at a time."""
+    after_id = 0
+    while True:
+        chunk = _task_query(db, columns).filter(
+            and_(models.Task.owner_id == user_id, models.Task.id > after_id)
+        ).order_by(models.Task.id).limit(chunk_size).all()
+        if not chunk:
+            return
+        yield chunk
+        after_id = chunk[-1].id
+
+def get_tasks_by_status(db: Session, user_id: int, status: models.StatusEnum, columns: Optional[List[str]] = None):
     """Get tasks by status for a specific user."""
-    return db.query(models.Task).filter(
+    return _task_query(db, columns).filter(
         and_(models.Task.owner_id == user_id, models.Task.status == status)
     ).all()
 
-def get_tasks_by_priority(db: Session, user_id: int, priority: models.PriorityEnum):
+def get_tasks_by_priority(db: Session, user_id: int, priority: models.PriorityEnum, columns: Optional[List[str]] = None):
     """Get tasks by priority for a specific user."""
-    return db.query(models.Task).filter(
+    return _task_query(db, columns).filter(
         and_(models.Task.owner_id == user_id, models.Task.priority == priority)
-    ).all() 
\ No newline at end of file
+    ).all()
+
+# Change feed
+def record_change(db: Session, user_id: int, task_id: int, op: schemas.ChangeOp):
+    """Append a change log entry in the caller's transaction."""
+    record_changes(db, user_id=user_id, task_ids=[task_id], op=op)
+
+def record_changes(db: Session, user_id: int, task_ids: List[int], op: schemas.ChangeOp):
+    """Append one change log entry per task, taking the cursor lock once."""
+    # Locking the owner's cursor row serializes that owner's writers, so
+    # sequence order matches commit order
+    cursor = db.get(models.ChangeCursor, user_id, with_for_update=True)
+    if cursor is None:
+        cursor = models.ChangeCursor(owner_id=user_id, seq=0, compacted_seq=0)
+        db.add(cursor)
+    db.add_all([
+        models.TaskChange(owner_id=user_id, seq=cursor.seq + offset, task_id=task_id, op=op.value)
+        for offset, task_id in enumerate(task_ids, start=1)
+    ])
+    cursor.seq += len(task_ids)
+
+def get_change_cursor(db: Session, user_id: int):
+    """The user's change sequence counter; None before their first write."""
+    return db.get(models.ChangeCursor, user_id)
+
+def get_changes(db: Session, user_id: int, since: int = 0, limit: int = 500):
+    """Get the latest change per task after `since`, with the current state of live tasks."""
+    cursor = db.get(models.ChangeCursor, user_id)
+    if cursor is None:
+        return {"changes": [], "cursor": 0}
+    if since < cursor.compacted_seq:
+        return {"changes": [], "cursor": cursor.seq, "resync_required": True}
+
+    entries = db.query(models.TaskChange).filter(
+        and_(models.TaskChange.owner_id == user_id, models.TaskChange.seq > since)
+    ).order_by(models.TaskChange.seq).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        latest.pop(entry.task_id, None)
+        latest[entry.task_id] = entry
+    live_ids = [task_id for task_id, entry in latest.items() if entry.op != schemas.ChangeOp.deleted.value]
+    tasks = {
+        task.id: task
+        for task in db.query(models.Task).filter(
+            and_(models.Task.owner_id == user_id, models.Task.id.in_(live_ids))
+        )
+    } if live_ids else {}
+
+    return {
+        "changes": [
+            {"seq": entry.seq, "op": entry.op, "task_id": task_id, "task": tasks.get(task_id)}
+            for task_id, entry in latest.items()
+        ],
+        "cursor": entries[-1].seq if entries else max(since, 0),
+        "has_more": has_more,
+    }
+
+# Background jobs
+def create_job(db: Session, user_id: int, kind: str, params: dict, max_attempts: int):
+    """Queue a job to run as soon as a worker is free."""
+    now = datetime.utcnow()
+    db_job = models.Job(
+        owner_id=user_id,
+        kind=kind,
+        params=json.dumps(params),
+        status="queued",
+        max_attempts=max_attempts,
+        run_after=now,
+        created_at=now,
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_job(db: Session, job_id: int, user_id: int):
+    return db.query(models.Job).filter(models.Job.id == job_id, models.Job.owner_id == user_id).first()
+
+def get_jobs(db: Session, user_id: int, limit: int = 50):
+    """Get a user's most recent jobs."""
+    return db.query(models.Job).filter(models.Job.owner_id == user_id).order_by(models.Job.id.desc()).limit(limit).all()
+
+def cancel_job(db: Session, job_id: int, user_id: int):
+    """
+    Cancel a job: a queued job is cancelled at once, a running one is asked to
+    stop at its next progress report. Finished jobs are left as they are.
+    Returns None if the job does not exist.
+    """
+    jobs = models.Job
+    db.execute(
+        update(jobs)
+        .where(jobs.id == job_id, jobs.owner_id == user_id, jobs.status == "queued")
+        .values(status="cancelled", finished_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False},
+    )
+    db.execute(
+        update(jobs)
+        .where(jobs.id == job_id, jobs.owner_id == user_id, jobs.status == "running")
+        .values(cancel_requested=True),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return get_job(db, job_id=job_id, user_id=user_id)
+
+def iter_job_result(db: Session, job_id: int, user_id: int):
+    """Yield the NDJSON an export job stored, one chunk at a time."""
+    results = models.JobResult
+    query = db.query(results.data).filter(
+        results.job_id == job_id, results.owner_id == user_id
+    ).order_by(results.seq)
+    for row in query.yield_per(10):
+        yield row.data
+
+def delete_job_result(db: Session, job_id: int, user_id: int):
+    """Drop what an earlier attempt of an export job stored, in the caller's transaction."""
+    db.query(models.JobResult).filter(
+        models.JobResult.job_id == job_id, models.JobResult.owner_id == user_id
+    ).delete(synchronize_session=False)
+
+# Idempotency keys
+def get_idempotency_key(db: Session, user_id: int, key: str, now: datetime):
+    """The stored response for a user's key; None if unused or expired."""
+    stored = models.IdempotencyKey
+    return db.query(stored).filter(
+        stored.owner_id == user_id, stored.key == key, stored.expires_at > now
+    ).first()
+
+def save_idempotency_key(
+    db: Session, user_id: int, key: str, fingerprint: str, status_code: int, response: str, expires_at: datetime, now: datetime
+):
+    """
+    Store a write's response in the caller's transaction (flushed, not committed).
+
+    An expired entry for the key is replaced; a live one (e.g. from a concurrent
+    request with the same key) raises IntegrityError.
+    """
+    stored = models.IdempotencyKey
+    db.execute(
+        delete(stored).where(stored.owner_id == user_id, stored.key == key, stored.expires_at <= now),
+        execution_options={"synchronize_session": False},
+    )
+    db.execute(insert(stored).values(
+        owner_id=user_id, key=key, fingerprint=fingerprint, status_code=status_code,
+        response=response, expires_at=expires_at,
+    ))
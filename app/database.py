@@ -1,7 +1,12 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Depends, Request
+from typing import Dict, List
+import itertools
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,10 +14,19 @@ load_dotenv()
 # Database URL - using SQLite for simplicity
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./task_management.db")
 
+# Optional comma-separated read replica URLs
+SQLALCHEMY_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URL", "").split(",") if url.strip()]
+
+# How long a client reads from the primary after it writes
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+def _connect_args(url: str) -> dict:
+    return {"check_same_thread": False} if "sqlite" in url else {}
+
 # Create engine
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
+    connect_args=_connect_args(SQLALCHEMY_DATABASE_URL)
 )
 
 # Create SessionLocal class
@@ -27,4 +41,63 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# Read replicas
+_read_sessions: List[sessionmaker] = []
+_read_cycle = itertools.cycle([])
+_pins: Dict[str, float] = {}
+_pins_lock = threading.Lock()
+
+def _reject_writes(session, flush_context, instances):
+    raise RuntimeError("Read replica sessions are read-only")
+
+def configure_read_replicas(urls: List[str]) -> None:
+    """Create a session factory for each read replica URL (empty to read from the primary)."""
+    global _read_sessions, _read_cycle
+    factories = []
+    for url in urls:
+        replica_engine = create_engine(url, connect_args=_connect_args(url))
+        factory = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+        event.listen(factory, "before_flush", _reject_writes)
+        factories.append(factory)
+    _read_sessions = factories
+    _read_cycle = itertools.cycle(factories)
+
+configure_read_replicas(SQLALCHEMY_READ_URLS)
+
+def _pin_key(request: Request) -> str:
+    return request.headers.get("authorization", "")
+
+def pin_to_primary(key: str, seconds: float = None) -> None:
+    """Route reads for `key` (a client's Authorization header) to the primary for a while."""
+    if not key or not _read_sessions:
+        return
+    with _pins_lock:
+        now = time.monotonic()
+        if len(_pins) > 10000:
+            for stale in [k for k, until in _pins.items() if until <= now]:
+                del _pins[stale]
+        _pins[key] = now + (READ_YOUR_WRITES_SECONDS if seconds is None else seconds)
+
+def is_pinned(key: str) -> bool:
+    """Whether `key` wrote recently and must read its own writes from the primary."""
+    until = _pins.get(key)
+    return until is not None and until > time.monotonic()
+
+def track_writes(request: Request):
+    """Router dependency that pins the caller to the primary when it sends a write."""
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        pin_to_primary(_pin_key(request))
+
+# Dependency to get a read-only session, from a replica when one is configured.
+# Falls back to the request's primary session (which stays unused otherwise).
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    if not _read_sessions or is_pinned(_pin_key(request)):
+        yield primary
+        return
+    db = next(_read_cycle)()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+from . import models, schemas, sharding
+from .database import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Event hub configuration
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_HUB_BACKEND = os.getenv("EVENT_HUB_BACKEND", "local")
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "0.5"))
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+
+# Users per change log query; one IN list each, well within SQLite's limits
+EVENT_POLL_CHUNK_SIZE = 500
+
+# Sentinel queued for a subscriber that fell too far behind
+OVERFLOW = {"type": "resync"}
+
+class Subscription:
+    """One connected client: a bounded queue of pending events."""
+
+    __slots__ = ("user_id", "queue", "overflowed")
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event: dict) -> None:
+        """Queue an event; a full queue is replaced by a single resync marker."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+            self.overflowed = True
+
+class HubBackend:
+    """Interface for how published events reach the hub of every worker."""
+
+    def publish(self, user_id: int, event: dict) -> None:
+        raise NotImplementedError
+
+    def subscribed(self, user_id: int, since: int) -> None:
+        """A client connected having seen the user's changes up to sequence `since`."""
+
+    async def run(self, hub: "EventHub") -> None:
+        """Long-running delivery loop, if the backend needs one."""
+
+class LocalBackend(HubBackend):
+    """Delivers events only to clients connected to this process."""
+
+    def __init__(self):
+        self.hub: Optional["EventHub"] = None
+
+    def publish(self, user_id: int, event: dict) -> None:
+        if self.hub is not None:
+            self.hub.deliver(user_id, event)
+
+class ChangeLogBackend(HubBackend):
+    """
+    Multi-worker delivery by tailing the `task_changes` log every worker writes.
+
+    Each worker polls for new entries of the users connected to it, so an event
+    reaches clients on any process within one poll interval. Entries are read by
+    each user's change sequence, past the last one delivered (a range scan of
+    the (owner_id, seq) index). An owner's sequence numbers commit in order (see
+    crud.record_changes), so unlike a timestamp window this never skips a
+    late commit.
+    """
+
+    def __init__(self, interval: float = EVENT_POLL_SECONDS, bind: Engine = engine):
+        self.interval = interval
+        self.bind = bind
+        self._delivered: Dict[int, int] = {}
+        # Where users connected since the last poll start from
+        self._starts: Dict[int, int] = {}
+
+    def subscribed(self, user_id: int, since: int) -> None:
+        if user_id not in self._delivered:
+            self._starts[user_id] = min(since, self._starts.get(user_id, since))
+
+    def publish(self, user_id: int, event: dict) -> None:
+        # Writes reach other workers through the change log
+        pass
+
+    async def run(self, hub: "EventHub") -> None:
+        while True:
+            try:
+                for user_id, event in await asyncio.to_thread(self.poll, set(hub.subscribers)):
+                    hub.deliver(user_id, event)
+            except Exception:
+                logger.exception("Event change log poll failed")
+            await asyncio.sleep(self.interval)
+
+    def poll(self, user_ids: Set[int]) -> list:
+        """Read new change log entries for `user_ids` and turn them into events."""
+        for user_id in list(self._delivered):
+            if user_id not in user_ids:
+                del self._delivered[user_id]
+        if not user_ids:
+            return []
+        engines = list(sharding.router.shards.values()) if sharding.router is not None else [self.bind]
+        new = user_ids - set(self._delivered)
+        for user_id in list(new):
+            since = self._starts.pop(user_id, None)
+            if since is not None:
+                self._delivered[user_id] = since
+                new.discard(user_id)
+        if new:
+            # Users subscribed without a starting point begin at the current end of their log
+            changes = models.TaskChange.__table__
+            for user_id in new:
+                self._delivered[user_id] = 0
+            for chunk in _chunks(new):
+                query = select(changes.c.owner_id, func.max(changes.c.seq)).where(
+                    changes.c.owner_id.in_(chunk)
+                ).group_by(changes.c.owner_id)
+                for bind in engines:
+                    with bind.connect() as conn:
+                        for user_id, seq in conn.execute(query):
+                            self._delivered[user_id] = max(self._delivered[user_id], seq)
+        events = []
+        for chunk in _chunks(user_ids - new):
+            for bind in engines:
+                events.extend(self._poll_engine(bind, chunk))
+        return events
+
+    def _poll_engine(self, bind: Engine, user_ids: List[int]) -> list:
+        """
+        One query for a chunk of users: past the lowest of their cursors, with
+        entries a user has already had dropped here. A condition per user would
+        nest too deep for SQLite once there are about a thousand of them.
+        """
+        changes = models.TaskChange.__table__
+        tasks = models.Task.__table__
+        query = select(
+            changes.c.owner_id, changes.c.seq, changes.c.task_id, changes.c.op,
+            *[column.label(f"task__{column.name}") for column in tasks.c],
+        ).outerjoin(tasks, tasks.c.id == changes.c.task_id).where(
+            changes.c.owner_id.in_(user_ids),
+            changes.c.seq > min(self._delivered[user_id] for user_id in user_ids),
+        )
+        with bind.connect() as conn:
+            rows = conn.execute(query.order_by(changes.c.owner_id, changes.c.seq)).all()
+        events = []
+        for row in rows:
+            if row.seq <= self._delivered[row.owner_id]:
+                continue
+            self._delivered[row.owner_id] = row.seq
+            task = None
+            if row.op != schemas.ChangeOp.deleted.value and row.task__title is not None:
+                task = schemas.Task.model_validate(
+                    {column.name: row._mapping[f"task__{column.name}"] for column in tasks.c}
+                ).model_dump(mode="json")
+            events.append((row.owner_id, {"type": row.op, "task_id": row.task_id, "seq": row.seq, "task": task}))
+        return events
+
+def _chunks(user_ids: Set[int]) -> Iterator[List[int]]:
+    ordered = sorted(user_ids)
+    for start in range(0, len(ordered), EVENT_POLL_CHUNK_SIZE):
+        yield ordered[start:start + EVENT_POLL_CHUNK_SIZE]
+
+class EventHub:
+    """In-process pub/sub of task events, keyed by user."""
+
+    def __init__(self, backend: Optional[HubBackend] = None, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[int, Set[Subscription]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.set_backend(backend or LocalBackend())
+
+    def set_backend(self, backend: HubBackend) -> None:
+        self.backend = backend
+        if isinstance(backend, LocalBackend):
+            backend.hub = self
+
+    def subscribe(self, user_id: int, since: Optional[int] = None) -> Subscription:
+        """
+        Register a connection; must be called from the event loop. `since` is
+        the user's change sequence the client is up to date with, so changes
+        committed from then on are not missed.
+        """
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(user_id, self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(subscription)
+        if since is not None:
+            self.backend.subscribed(user_id, since)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self.subscribers.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, event: dict) -> None:
+        """Publish an event from any thread (the sync routes run in a threadpool)."""
+        self.backend.publish(user_id, event)
+
+    def deliver(self, user_id: int, event: dict) -> None:
+        """Hand an event to this process's subscribers of `user_id`."""
+        if user_id not in self.subscribers or self.loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._fan_out(user_id, event)
+        else:
+            self.loop.call_soon_threadsafe(self._fan_out, user_id, event)
+
+    def _fan_out(self, user_id: int, event: dict) -> None:
+        for subscription in tuple(self.subscribers.get(user_id, ())):
+            subscription.offer(event)
+
+    async def stream(self, subscription: Subscription, keepalive: float = STREAM_KEEPALIVE_SECONDS):
+        """Render a subscription as a Server-Sent Events body."""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # The change sequence comes back as Last-Event-ID on reconnect
+                event_id = f"id: {event['seq']}\n" if "seq" in event else ""
+                yield f"{event_id}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event is OVERFLOW:
+                    # The client missed events; it should resync via /tasks/changes
+                    return
+        finally:
+            self.unsubscribe(subscription)
+
+def task_event(op: schemas.ChangeOp, task_id: int, task=None) -> dict:
+    """Build the event payload for a task write."""
+    return {
+        "type": op.value,
+        "task_id": task_id,
+        "task": schemas.Task.model_validate(task).model_dump(mode="json") if task is not None else None,
+    }
+
+def publish_task(user_id: int, op: schemas.ChangeOp, task_id: int, task=None) -> None:
+    """Publish a task write; skipped cheaply when no local client is listening."""
+    if isinstance(hub.backend, LocalBackend) and user_id not in hub.subscribers:
+        return
+    hub.publish(user_id, task_event(op, task_id, task))
+
+hub = EventHub(ChangeLogBackend() if EVENT_HUB_BACKEND == "changelog" else LocalBackend())
@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+from dotenv import load_dotenv
+
+from . import sharding
+from .database import SessionLocal
+
+load_dotenv()
+
+# Group commit configuration (opt-in)
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))
+
+class _Write:
+    __slots__ = ("operation", "owner_id", "future")
+
+    def __init__(self, operation: Callable[[Session], Any], owner_id: Optional[int]):
+        self.operation = operation
+        self.owner_id = owner_id
+        self.future: Future = Future()
+
+class GroupCommitWriter:
+    """
+    Collects write operations from many request threads and commits them together.
+
+    Operations arriving within `window_ms` of the first one (up to `max_batch`) run
+    on one session and share one commit, so concurrent writers pay for a single
+    lock acquisition and fsync. An operation is a callable taking the session; it
+    must flush rather than commit (see the `commit=False` flag on the crud writes).
+
+    If an operation raises, the batch is rolled back, that caller receives the
+    exception, and the remaining operations are re-run without it.
+
+    The writer thread runs from `start` (in the app lifespan) until `close`.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        window_ms: float = GROUP_COMMIT_WINDOW_MS,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+    ):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_Write]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        # Keeps operations from being queued behind the stop marker
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def submit(self, operation: Callable[[Session], Any], owner_id: Optional[int] = None) -> Future:
+        """Queue an operation; the future resolves once its batch has committed."""
+        write = _Write(operation, owner_id)
+        with self._lock:
+            if self._thread is None:
+                raise RuntimeError("The group commit writer is not running")
+            self._queue.put(write)
+        return write.future
+
+    def execute(self, operation: Callable[[Session], Any], owner_id: Optional[int] = None) -> Any:
+        """Queue an operation and wait for its result (or exception)."""
+        return self.submit(operation, owner_id).result()
+
+    def close(self) -> None:
+        """Flush queued operations and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    write = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if write is None:
+                    stop = True
+                    break
+                batch.append(write)
+            for group in self._by_shard(batch):
+                self._commit_group(group)
+            if stop:
+                return
+
+    def _by_shard(self, batch: List[_Write]) -> List[List[_Write]]:
+        """Split a batch so that each transaction touches a single shard."""
+        if sharding.router is None:
+            return [batch]
+        groups = {}
+        for write in batch:
+            shard = sharding.router.shard_for(write.owner_id) if write.owner_id is not None else None
+            groups.setdefault(shard, []).append(write)
+        return list(groups.values())
+
+    def _commit_group(self, pending: List[_Write]):
+        while pending:
+            db = self.session_factory(expire_on_commit=False)
+            if pending[0].owner_id is not None:
+                sharding.bind_session(db, pending[0].owner_id)
+            results = []
+            failed = None
+            try:
+                for write in pending:
+                    try:
+                        results.append(write.operation(db))
+                    except Exception as exc:
+                        failed = (write, exc)
+                        break
+                if failed is None:
+                    db.commit()
+            except Exception as exc:
+                db.rollback()
+                for write in pending:
+                    write.future.set_exception(exc)
+                return
+            finally:
+                if failed is not None:
+                    db.rollback()
+                db.close()
+            if failed is None:
+                for write, result in zip(pending, results):
+                    write.future.set_result(result)
+                return
+            failed[0].future.set_exception(failed[1])
+            pending = [write for write in pending if write is not failed[0]]
+
+writer: Optional[GroupCommitWriter] = GroupCommitWriter() if GROUP_COMMIT_ENABLED else None
@@ -0,0 +1,183 @@
+"""
+Idempotency keys for the task write routes.
+
+A client that may retry a write sends a unique `Idempotency-Key` header with
+it. The first request runs and its response is stored in the same transaction
+as the write, so either both commit or neither does. A retry with the same key
+(and the same method, path and body) gets the stored response back, marked with
+`Idempotent-Replayed: true`, and does not run the write again. Keys are scoped
+to the user and kept for IDEMPOTENCY_TTL_SECONDS.
+
+Recent responses are also held in a per-process LRU, so most retries are
+answered without a database query.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import crud, auth, models, schemas, sharding
+from .database import engine, get_db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Idempotency configuration
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status_code", "body", "expires_at")
+
+    def __init__(self, fingerprint: str, status_code: int, body: str, expires_at: datetime):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """Least-recently-used map of (user id, key) → stored response."""
+
+    def __init__(self, max_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[int, str], StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner_id: int, key: str, now: datetime) -> Optional[StoredResponse]:
+        with self._lock:
+            stored = self._entries.get((owner_id, key))
+            if stored is None:
+                return None
+            if stored.expires_at <= now:
+                del self._entries[(owner_id, key)]
+                return None
+            self._entries.move_to_end((owner_id, key))
+            return stored
+
+    def put(self, owner_id: int, key: str, stored: StoredResponse) -> None:
+        with self._lock:
+            self._entries[(owner_id, key)] = stored
+            self._entries.move_to_end((owner_id, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+cache = ResponseCache()
+
+def fingerprint(method: str, path: str, body: bytes) -> str:
+    digest = hashlib.sha256(f"{method} {path}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+class IdempotentRequest:
+    """A write sent with an Idempotency-Key; `replay` is set when the key was used before."""
+
+    def __init__(self, owner_id: int, key: str, fingerprint: str):
+        self.owner_id = owner_id
+        self.key = key
+        self.fingerprint = fingerprint
+        self.replay: Optional[Response] = None
+        self._saved: Optional[StoredResponse] = None
+
+    def lookup(self, db: Session) -> None:
+        now = datetime.utcnow()
+        stored = cache.get(self.owner_id, self.key, now)
+        if stored is None:
+            row = crud.get_idempotency_key(db, user_id=self.owner_id, key=self.key, now=now)
+            if row is None:
+                return
+            stored = StoredResponse(row.fingerprint, row.status_code, row.response, row.expires_at)
+            cache.put(self.owner_id, self.key, stored)
+        if stored.fingerprint != self.fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        self.replay = Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    def save(self, db: Session, content: Any, status_code: int = status.HTTP_200_OK) -> None:
+        """Store the response in the write's transaction; call before it commits."""
+        now = datetime.utcnow()
+        self._saved = StoredResponse(
+            self.fingerprint, status_code, json.dumps(jsonable_encoder(content)),
+            now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        )
+        crud.save_idempotency_key(
+            db, user_id=self.owner_id, key=self.key, fingerprint=self.fingerprint,
+            status_code=status_code, response=self._saved.body, expires_at=self._saved.expires_at, now=now,
+        )
+
+    def committed(self) -> None:
+        """Remember the saved response in this process once its transaction has committed."""
+        if self._saved is not None:
+            cache.put(self.owner_id, self.key, self._saved)
+
+async def _request_fingerprint(request: Request) -> str:
+    return fingerprint(request.method, request.url.path, await request.body())
+
+def idempotent_request(
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=MAX_KEY_LENGTH),
+    request_fingerprint: str = Depends(_request_fingerprint),
+    current_user: schemas.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db),
+) -> Optional[IdempotentRequest]:
+    """Route dependency: the request's Idempotency-Key, looked up; None when the header is absent."""
+    if idempotency_key is None:
+        return None
+    idempotent = IdempotentRequest(current_user.id, idempotency_key, request_fingerprint)
+    idempotent.lookup(db)
+    return idempotent
+
+def conflict() -> HTTPException:
+    """Raised when a concurrent request with the same key committed first."""
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is already being processed; retry it"
+    )
+
+def purge_expired(bind: Engine, now: Optional[datetime] = None) -> int:
+    """Delete expired keys (a range scan of the expires_at index); returns how many."""
+    stored = models.IdempotencyKey.__table__
+    with bind.begin() as conn:
+        return conn.execute(delete(stored).where(stored.c.expires_at <= (now or datetime.utcnow()))).rowcount
+
+def purge_all() -> int:
+    """Purge the primary or, when sharded, every shard."""
+    engines = list(sharding.router.shards.values()) if sharding.router is not None else [engine]
+    return sum(purge_expired(bind) for bind in engines)
+
+async def run_purger(interval: float = IDEMPOTENCY_PURGE_INTERVAL_SECONDS):
+    """Background loop started from the app lifespan."""
+    while True:
+        try:
+            count = await asyncio.to_thread(purge_all)
+            if count:
+                logger.info("Purged %d expired idempotency keys", count)
+        except Exception:
+            logger.exception("Idempotency key purge failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,374 @@
+"""
+Background jobs for operations too long for a request: exports, imports and
+bulk updates.
+
+Jobs are rows in the `jobs` table, so they survive restarts and are shared by
+every process using the database. Each process runs a small worker pool
+(started in the app lifespan). A worker claims a job with a conditional
+UPDATE that sets a lease; it renews the lease whenever it reports progress.
+If the worker dies, the lease runs out and another worker (in any process)
+picks the job up again, resuming from its last reported checkpoint (or from a
+chunk that committed after it, see JobContext.save_chunk). Failed
+attempts are retried with exponential backoff up to `max_attempts`.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from dotenv import load_dotenv
+
+from . import crud, events, models, reminders, schemas, sharding
+from .database import SessionLocal, engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Job configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# A worker silent for this long is presumed dead and its job is re-claimed
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "100"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Claimable jobs examined per poll; losing a race for one moves on to the next
+CLAIM_CANDIDATES = 5
+
+class JobCancelled(Exception):
+    """The job's owner asked for it to stop."""
+
+class JobInterrupted(Exception):
+    """This worker is shutting down; the job goes back to the queue."""
+
+class LeaseLost(Exception):
+    """The lease ran out and another worker may own the job now."""
+
+# Handlers by job kind; each takes a JobContext and returns the job's result
+HANDLERS: Dict[str, Callable[["JobContext"], Any]] = {}
+
+def handler(kind: str):
+    def register(function: Callable[["JobContext"], Any]):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+def _decode(value: Optional[str]) -> Any:
+    return json.loads(value) if value else None
+
+class JobContext:
+    """What a handler sees of its job: parameters, checkpoint, sessions and progress reporting."""
+
+    def __init__(self, runner: "JobRunner", job, worker_id: str):
+        self.runner = runner
+        self.job_id = job.id
+        self.owner_id = job.owner_id
+        self.params = _decode(job.params) or {}
+        # Progress saved by an earlier attempt, to resume from
+        self.processed = job.processed
+        self.checkpoint = _decode(job.result) or {}
+        self.worker_id = worker_id
+
+    def session(self) -> Session:
+        """A session routed to the job owner's shard."""
+        db = self.runner.session_factory()
+        sharding.bind_session(db, self.owner_id)
+        return db
+
+    def save_chunk(self, db: Session, processed: int, checkpoint: dict) -> None:
+        """
+        Record, in a chunk's own transaction, the progress it brings the job to;
+        call before the chunk commits. If the worker dies before reporting it,
+        the next attempt resumes from here instead of applying the chunk again.
+        """
+        chunks = models.JobChunk.__table__
+        db.execute(delete(chunks).where(chunks.c.job_id == self.job_id))
+        db.execute(insert(chunks).values(
+            job_id=self.job_id, owner_id=self.owner_id, start=self.processed,
+            processed=processed, checkpoint=json.dumps(checkpoint),
+        ))
+
+    def recover(self) -> None:
+        """Report a chunk that committed after the last report (see save_chunk)."""
+        chunks = models.JobChunk.__table__
+        with self.session() as db:
+            saved = db.execute(
+                select(chunks.c.processed, chunks.c.checkpoint)
+                .where(chunks.c.job_id == self.job_id, chunks.c.start == self.processed)
+            ).first()
+        if saved is not None:
+            checkpoint = json.loads(saved.checkpoint)
+            self.report(saved.processed, checkpoint=checkpoint)
+            self.checkpoint = checkpoint
+
+    def report(self, processed: int, total: Optional[int] = None, checkpoint: Optional[dict] = None) -> None:
+        """
+        Save progress (and what to resume from) and renew the lease.
+
+        Call after committing each unit of work. Raises JobCancelled,
+        JobInterrupted or LeaseLost when the handler should stop.
+        """
+        jobs = models.Job.__table__
+        values = {"processed": processed, "lease_expires_at": datetime.utcnow() + self.runner.lease}
+        if total is not None:
+            values["total"] = total
+        if checkpoint is not None:
+            values["result"] = json.dumps(checkpoint)
+        with self.runner.bind.begin() as conn:
+            renewed = conn.execute(
+                update(jobs)
+                .where(jobs.c.id == self.job_id, jobs.c.lease_owner == self.worker_id, jobs.c.status == RUNNING)
+                .values(**values)
+            ).rowcount
+            cancel_requested = conn.execute(select(jobs.c.cancel_requested).where(jobs.c.id == self.job_id)).scalar()
+        self.processed = processed
+        if not renewed:
+            raise LeaseLost()
+        if cancel_requested:
+            raise JobCancelled()
+        if self.runner.stopping.is_set():
+            raise JobInterrupted()
+
+class JobRunner:
+    """Claims and runs jobs, from a pool of worker threads or one at a time via `run_once`."""
+
+    def __init__(
+        self,
+        bind: Engine = engine,
+        session_factory: sessionmaker = SessionLocal,
+        workers: int = JOB_WORKERS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+    ):
+        self.bind = bind
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self.stopping.clear()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = [
+            threading.Thread(target=self._loop, args=(f"{prefix}:{i}",), name=f"job-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stop the workers; running jobs are released at their next progress report."""
+        self.stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _loop(self, worker_id: str) -> None:
+        while not self.stopping.is_set():
+            try:
+                ran = self.run_once(worker_id)
+            except Exception:
+                logger.exception("Job worker %s failed", worker_id)
+                ran = None
+            if ran is None:
+                self.stopping.wait(self.poll_seconds)
+
+    def claim(self, worker_id: str, now: Optional[datetime] = None):
+        """Lease the next runnable job (queued and due, or with an expired lease); None if there is none."""
+        jobs = models.Job.__table__
+        now = now or datetime.utcnow()
+        claimable = or_(
+            and_(jobs.c.status == QUEUED, jobs.c.run_after <= now),
+            and_(jobs.c.status == RUNNING, jobs.c.lease_expires_at < now),
+        )
+        with self.bind.connect() as conn:
+            candidates = conn.execute(
+                select(jobs.c.id).where(claimable).order_by(jobs.c.run_after, jobs.c.id).limit(CLAIM_CANDIDATES)
+            ).scalars().all()
+        for job_id in candidates:
+            with self.bind.begin() as conn:
+                # Only one worker's UPDATE can match while the job is still claimable
+                claimed = conn.execute(
+                    update(jobs).where(jobs.c.id == job_id, claimable).values(
+                        status=RUNNING,
+                        lease_owner=worker_id,
+                        lease_expires_at=now + self.lease,
+                        attempts=jobs.c.attempts + 1,
+                        started_at=func.coalesce(jobs.c.started_at, now),
+                    )
+                ).rowcount
+                if claimed:
+                    return conn.execute(select(jobs).where(jobs.c.id == job_id)).one()
+        return None
+
+    def _finish(self, job_id: int, worker_id: str, **values) -> None:
+        jobs = models.Job.__table__
+        with self.bind.begin() as conn:
+            conn.execute(
+                update(jobs)
+                .where(jobs.c.id == job_id, jobs.c.lease_owner == worker_id, jobs.c.status == RUNNING)
+                .values(lease_owner=None, lease_expires_at=None, **values)
+            )
+
+    def run_once(self, worker_id: str, now: Optional[datetime] = None) -> Optional[int]:
+        """Claim and run one job in the calling thread; returns its id, or None if none was runnable."""
+        job = self.claim(worker_id, now)
+        if job is None:
+            return None
+        finished_at = datetime.utcnow()
+        if job.cancel_requested:
+            self._finish(job.id, worker_id, status=CANCELLED, finished_at=finished_at)
+            return job.id
+        if job.attempts > job.max_attempts:
+            # Re-claimed after its last attempt's worker died
+            self._finish(job.id, worker_id, status=FAILED, error="Worker lost during the last attempt", finished_at=finished_at)
+            return job.id
+        run = HANDLERS.get(job.kind)
+        if run is None:
+            self._finish(job.id, worker_id, status=FAILED, error=f"Unknown job kind: {job.kind}", finished_at=finished_at)
+            return job.id
+
+        try:
+            ctx = JobContext(self, job, worker_id)
+            ctx.recover()
+            result = run(ctx)
+        except JobCancelled:
+            self._finish(job.id, worker_id, status=CANCELLED, finished_at=datetime.utcnow())
+            self._drop_chunks(job)
+        except JobInterrupted:
+            # Not the job's fault: give the attempt back
+            self._finish(job.id, worker_id, status=QUEUED, attempts=job.attempts - 1, run_after=datetime.utcnow())
+        except LeaseLost:
+            logger.warning("Job %s lost its lease on %s", job.id, worker_id)
+        except Exception as exc:
+            logger.exception("Job %s failed (attempt %s of %s)", job.id, job.attempts, job.max_attempts)
+            error = f"{type(exc).__name__}: {exc}"
+            if job.attempts < job.max_attempts:
+                delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+                self._finish(
+                    job.id, worker_id, status=QUEUED, error=error,
+                    run_after=(now or datetime.utcnow()) + timedelta(seconds=delay),
+                )
+            else:
+                self._finish(job.id, worker_id, status=FAILED, error=error, finished_at=datetime.utcnow())
+                self._drop_chunks(job)
+        else:
+            self._finish(
+                job.id, worker_id, status=SUCCEEDED, error=None,
+                result=json.dumps(result) if result is not None else None, finished_at=datetime.utcnow(),
+            )
+            self._drop_chunks(job)
+        return job.id
+
+    def _drop_chunks(self, job) -> None:
+        """Forget a finished job's chunk progress (see JobContext.save_chunk)."""
+        chunks = models.JobChunk.__table__
+        with self.session_factory() as db:
+            sharding.bind_session(db, job.owner_id)
+            db.execute(delete(chunks).where(chunks.c.job_id == job.id))
+            db.commit()
+
+runner = JobRunner()
+
+# Handlers
+@handler("import")
+def import_tasks(ctx: JobContext):
+    """Create the given tasks, one transaction per chunk."""
+    tasks = ctx.params["tasks"]
+    skipped = ctx.checkpoint.get("skipped", 0)
+    for start in range(ctx.processed, len(tasks), JOB_CHUNK_SIZE):
+        created = []
+        with ctx.session() as db:
+            db.expire_on_commit = False
+            for task in tasks[start:start + JOB_CHUNK_SIZE]:
+                db_task = crud.create_task(db, task=schemas.TaskCreate(**task), user_id=ctx.owner_id, commit=False)
+                if db_task is None:
+                    skipped += 1
+                else:
+                    created.append(db_task)
+            ctx.save_chunk(db, min(start + JOB_CHUNK_SIZE, len(tasks)), {"skipped": skipped})
+            db.commit()
+        for db_task in created:
+            events.publish_task(ctx.owner_id, schemas.ChangeOp.created, db_task.id, db_task)
+            reminders.scheduler.track(db_task)
+        ctx.report(min(start + JOB_CHUNK_SIZE, len(tasks)), len(tasks), {"skipped": skipped})
+    return {"created": len(tasks) - skipped, "skipped": skipped}
+
+@handler("bulk_update")
+def bulk_update_tasks(ctx: JobContext):
+    """Apply one update to every matching task, in id order so a retry resumes after the last chunk."""
+    match = ctx.params.get("filter") or {}
+    task_update = schemas.TaskUpdate(**ctx.params["update"])
+    after_id = ctx.checkpoint.get("after_id", 0)
+    processed = ctx.processed
+    with ctx.session() as db:
+        total = processed + crud.count_matching_tasks(db, user_id=ctx.owner_id, after_id=after_id, **match)
+    while True:
+        with ctx.session() as db:
+            db.expire_on_commit = False
+            ids = crud.get_matching_task_ids(db, user_id=ctx.owner_id, after_id=after_id, limit=JOB_CHUNK_SIZE, **match)
+            if not ids:
+                break
+            updated = [
+                crud.update_task(db, task_id=task_id, task_update=task_update, user_id=ctx.owner_id, commit=False)
+                for task_id in ids
+            ]
+            updated = [db_task for db_task in updated if db_task is not None]
+            ctx.save_chunk(db, processed + len(ids), {"after_id": ids[-1]})
+            db.commit()
+        for db_task in updated:
+            events.publish_task(ctx.owner_id, schemas.ChangeOp.updated, db_task.id, db_task)
+            reminders.scheduler.track(db_task)
+        processed += len(ids)
+        after_id = ids[-1]
+        ctx.report(processed, total, {"after_id": after_id})
+    return {"updated": processed}
+
+@handler("export")
+def export_tasks(ctx: JobContext):
+    """
+    Store the owner's tasks as NDJSON in job_results, one row per chunk,
+    committed together at the end; restarts from scratch on retry.
+    """
+    columns = ctx.params.get("fields")
+    exported = 0
+    with ctx.session() as db:
+        crud.delete_job_result(db, job_id=ctx.job_id, user_id=ctx.owner_id)
+        total = crud.count_matching_tasks(db, user_id=ctx.owner_id)
+        chunks = crud.iter_tasks(db, user_id=ctx.owner_id, chunk_size=JOB_CHUNK_SIZE, columns=columns)
+        for seq, chunk in enumerate(chunks):
+            if columns and "tags" in columns:
+                chunk = crud.with_tag_names(db, ctx.owner_id, chunk)
+            db.add(models.JobResult(
+                job_id=ctx.job_id, seq=seq, owner_id=ctx.owner_id,
+                data="".join(
+                    schemas.TaskPartial.model_validate(task).model_dump_json(exclude_unset=True) + "\n"
+                    for task in chunk
+                ),
+            ))
+            # Flushed rows are not kept in memory until the commit
+            db.flush()
+            exported += len(chunk)
+            ctx.report(exported, total)
+        db.commit()
+    return {"tasks": exported}
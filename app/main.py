@@ -1,22 +1,47 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 from sqlalchemy import text
 
 from .database import engine, get_db
-from . import models
-from .api import auth, tasks
+from . import models, sharding, archival, audit, change_feed, events, group_commit, idempotency, jobs, reminders, passwords
+from .compression import CompressionMiddleware
+from .api import auth, tasks, batch, jobs as jobs_api
 
 # Create database tables
 def create_tables():
     models.Base.metadata.create_all(bind=engine)
+    sharding.create_shard_tables()
 
 # Startup event
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create tables on startup
     create_tables()
+    # Pick the password hashing cost for this host's speed
+    await asyncio.to_thread(passwords.configure)
+    audit.writer.start()
+    jobs.runner.start()
+    if group_commit.writer is not None:
+        group_commit.writer.start()
+    background = [
+        asyncio.create_task(archival.run_archiver()),
+        asyncio.create_task(change_feed.run_compactor()),
+        asyncio.create_task(idempotency.run_purger()),
+        asyncio.create_task(events.hub.backend.run(events.hub)),
+        asyncio.create_task(reminders.scheduler.run()),
+    ]
     yield
+    for job in background:
+        job.cancel()
+    # Running jobs go back to the queue at their next progress report
+    await asyncio.to_thread(jobs.runner.stop)
+    # Commit the writes still queued for a shared commit
+    if group_commit.writer is not None:
+        await asyncio.to_thread(group_commit.writer.close)
+    # Write the history entries still queued
+    await asyncio.to_thread(audit.writer.close)
 
 # Get port from environment variable
 def get_port():
@@ -41,9 +66,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (gzip or brotli, and zstd when zstandard is installed)
+app.add_middleware(CompressionMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(tasks.router)
+app.include_router(batch.router)
+app.include_router(jobs_api.router)
 
 @app.get("/")
 async def root():
@@ -67,7 +97,7 @@ async def health_check():
         db = next(get_db())
         db.execute(text("SELECT 1"))
         db.close()
-        return {"status": "healthy", "database": "connected"}
+        return {"status": "healthy", "database": "connected", "audit": audit.writer.stats()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
@@ -85,24 +115,57 @@ async def api_info():
             "JWT token-based security",
             "CRUD operations for tasks",
             "Task filtering by status and priority",
+            "Transactional batch operations",
+            "Idempotency-Key support on task writes",
+            "Optimistic concurrency for task updates (If-Match)",
+            "Background jobs for imports, exports and bulk updates",
             "Pagination support",
+            "Response compression (gzip, brotli; zstd when zstandard is installed)",
             "Input validation",
             "Comprehensive error handling"
         ],
         "endpoints": {
             "authentication": {
                 "POST /auth/register": "Register a new user",
-                "POST /auth/login": "Login and get access token",
-                "GET /auth/me": "Get current user info"
+                "POST /auth/login": "Login and get access and refresh tokens",
+                "POST /auth/refresh": "Exchange a refresh token for new tokens",
+                "GET /auth/available": "Check whether a username is free",
+                "GET /auth/me": "Get current user info",
+                "POST /auth/api-keys": "Create an API key",
+                "GET /auth/api-keys": "List API keys",
+                "DELETE /auth/api-keys/{key_id}": "Revoke an API key"
             },
             "tasks": {
                 "GET /tasks/": "Get all tasks (paginated)",
+                "GET /tasks/query": "Query tasks by status and priority",
+                "GET /tasks/batch": "Get several tasks by ID (POST for long lists)",
+                "GET /tasks/overdue": "Get open overdue tasks (keyset paginated)",
+                "GET /tasks/dashboard": "Get task counts and the next due / recently updated tasks",
+                "GET /tasks/calendar": "Get tasks due in a window, with recurring tasks expanded",
+                "GET /tasks/changes": "Get task changes since a sync cursor",
+                "GET /tasks/stream": "Stream task changes (Server-Sent Events)",
+                "GET /tasks/export": "Export all tasks as newline-delimited JSON (streamed)",
                 "POST /tasks/": "Create a new task",
                 "GET /tasks/{task_id}": "Get a specific task",
                 "PUT /tasks/{task_id}": "Update a task",
-                "DELETE /tasks/{task_id}": "Delete a task",
+                "DELETE /tasks/{task_id}": "Delete a task and its subtasks",
+                "GET /tasks/{task_id}/subtree": "Get a task with all of its subtasks",
+                "GET /tasks/{task_id}/rollup": "Get completion counts for a task tree",
+                "POST /tasks/{task_id}/move": "Move a task and its subtasks under another parent",
+                "PUT /tasks/{task_id}/occurrences": "Complete, move or cancel one occurrence of a recurring task",
+                "GET /tasks/{task_id}/history": "Get a task's change history (keyset paginated)",
                 "GET /tasks/status/{status}": "Get tasks by status",
                 "GET /tasks/priority/{priority}": "Get tasks by priority"
+            },
+            "batch": {
+                "POST /batch/": "Run several task operations in one transaction"
+            },
+            "jobs": {
+                "POST /jobs/": "Queue an import, export or bulk update",
+                "GET /jobs/": "List recent jobs",
+                "GET /jobs/{job_id}": "Get a job's status and progress",
+                "POST /jobs/{job_id}/cancel": "Cancel a job",
+                "GET /jobs/{job_id}/result": "Download an export job's file"
             }
         }
     } 
\ No newline at end of file
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum
 from .database import Base
 
@@ -14,6 +14,9 @@ class StatusEnum(enum.Enum):
     in_progress = "in_progress"
     completed = "completed"
 
+# Must match the partial index predicate verbatim for the planner to use it
+OPEN_TASK_CONDITION = "status != 'completed'"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -29,6 +32,21 @@ class User(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __shard_key__ = "owner_id"
+    __table_args__ = (
+        Index("ix_tasks_due_date", "due_date"),
+        # Partial index: open tasks only, for "what's overdue?"
+        Index(
+            "ix_tasks_open_owner_due",
+            "owner_id",
+            "due_date",
+            sqlite_where=text(OPEN_TASK_CONDITION),
+            postgresql_where=text(OPEN_TASK_CONDITION),
+        ),
+        # Never reuse a deleted task's id: caches keyed by task path must not
+        # serve one task's entry for another
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -39,8 +57,250 @@ class Task(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
-    # Foreign key
+    # Foreign keys
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    parent_id = Column(Integer, ForeignKey("tasks.id"), index=True)
+    # RRULE (see app.recurrence) starting at due_date; occurrences are never stored as tasks
+    recurrence = Column(String)
+    # Bumped by every UPDATE, which is issued as "... WHERE id = ? AND version = ?"
+    # so a write based on a stale read matches no row (StaleDataError) instead of
+    # overwriting; carried in the task's ETag for If-Match
+    version = Column(Integer, nullable=False, server_default="1")
+    # Fire time of the last due/overdue reminder sent, claimed by one worker (app.reminders)
+    reminded_at = Column(DateTime)
     
-    # Relationship
-    owner = relationship("User", back_populates="tasks") 
\ No newline at end of file
+    # Relationships
+    owner = relationship("User", back_populates="tasks")
+    # Loaded with one SELECT ... IN per query (or refresh), never per task;
+    # written through TaskTag rows by crud
+    tags = relationship("Tag", secondary="task_tags", viewonly=True, lazy="selectin", order_by="Tag.name")
+
+    __mapper_args__ = {"version_id_col": version}
+
+class TaskArchive(Base):
+    """Cold storage for tasks that have been completed for a while."""
+    __tablename__ = "tasks_archive"
+    __shard_key__ = "owner_id"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    description = Column(Text)
+    priority = Column(Enum(PriorityEnum), default=PriorityEnum.medium)
+    status = Column(Enum(StatusEnum), default=StatusEnum.completed)
+    due_date = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    parent_id = Column(Integer)
+    recurrence = Column(String)
+    version = Column(Integer, nullable=False, server_default="1")
+
+class Tag(Base):
+    """A user's label, e.g. "backend" or "customer-x"."""
+    __tablename__ = "tags"
+    __shard_key__ = "owner_id"
+    __table_args__ = (Index("ix_tags_owner_name", "owner_id", "name", unique=True),)
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+
+class TaskTag(Base):
+    """Association of tasks and tags; the (tag_id, task_id) index serves tag filters."""
+    __tablename__ = "task_tags"
+    __shard_key__ = "owner_id"
+    __table_args__ = (Index("ix_task_tags_tag_task", "tag_id", "task_id"),)
+
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+class TaskOccurrence(Base):
+    """
+    One occurrence of a recurring task that differs from its series: completed
+    (or otherwise progressed), moved to another time, or cancelled. Occurrences
+    without a row are generated from the rule.
+    """
+    __tablename__ = "task_occurrences"
+    __shard_key__ = "owner_id"
+
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    # The time the rule generates, which identifies the occurrence
+    occurs_at = Column(DateTime, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(Enum(StatusEnum), default=StatusEnum.pending, nullable=False)
+    # Set when the occurrence was moved
+    due_date = Column(DateTime)
+    cancelled = Column(Boolean, default=False, nullable=False)
+
+class TaskClosure(Base):
+    """
+    Ancestor/descendant pairs of the task tree, including each task paired with
+    itself at depth 0, so subtree reads and writes are one indexed query at any depth.
+    """
+    __tablename__ = "task_closure"
+    __shard_key__ = "owner_id"
+    __table_args__ = (Index("ix_task_closure_descendant", "descendant_id", "depth"),)
+
+    ancestor_id = Column(Integer, primary_key=True)
+    descendant_id = Column(Integer, primary_key=True)
+    depth = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+class TaskEvent(Base):
+    """
+    History entry for a task: who changed which fields, and when. Written by
+    app.audit after the change commits; kept after the task is deleted.
+    """
+    __tablename__ = "task_events"
+    __shard_key__ = "owner_id"
+    __table_args__ = (Index("ix_task_events_task_id", "task_id", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    actor_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    # JSON object of {field: {"old": ..., "new": ...}}
+    changes = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+
+class Job(Base):
+    """
+    A background job (app.jobs). Workers lease a job by setting `lease_owner`
+    and `lease_expires_at`; a job whose lease expires is picked up again.
+    Kept on the primary database, not sharded, so every worker sees one queue.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "run_after"),
+        Index("ix_jobs_owner", "owner_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)
+    # JSON-encoded parameters and result
+    params = Column(Text, nullable=False)
+    result = Column(Text)
+    status = Column(String, nullable=False, default="queued")
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    run_after = Column(DateTime, nullable=False)
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class JobChunk(Base):
+    """
+    Progress of a job's last committed chunk (app.jobs), written in the chunk's
+    own transaction on the owner's shard, so a retry does not apply it again
+    when the worker died before reporting it on the job row.
+    """
+    __tablename__ = "job_chunks"
+    __shard_key__ = "owner_id"
+
+    job_id = Column(Integer, primary_key=True, autoincrement=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # The job's progress before and after the chunk, and what to resume from
+    start = Column(Integer, nullable=False)
+    processed = Column(Integer, nullable=False)
+    checkpoint = Column(Text, nullable=False)
+
+class JobResult(Base):
+    """
+    One chunk of the NDJSON an export job (app.jobs) produces, kept in the
+    database so that any API process can serve it.
+    """
+    __tablename__ = "job_results"
+    __shard_key__ = "owner_id"
+
+    job_id = Column(Integer, primary_key=True, autoincrement=False)
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    data = Column(Text, nullable=False)
+
+class IdempotencyKey(Base):
+    """
+    The response to a write sent with an `Idempotency-Key` header (app.idempotency).
+    Stored in the write's own transaction, on the owner's shard, so a retried
+    request is answered from here instead of being applied twice.
+    """
+    __tablename__ = "idempotency_keys"
+    __shard_key__ = "owner_id"
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # SHA-256 of the method, path and body the key was first used with
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class TaskChange(Base):
+    """Change log entry for a task; `seq` increases monotonically per owner."""
+    __tablename__ = "task_changes"
+    __shard_key__ = "owner_id"
+    __table_args__ = (Index("ix_task_changes_owner_seq", "owner_id", "seq", unique=True),)
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    task_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ChangeCursor(Base):
+    """Per-owner change sequence counter and the highest sequence compacted away."""
+    __tablename__ = "task_change_cursors"
+    __shard_key__ = "owner_id"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    seq = Column(Integer, nullable=False, default=0)
+    compacted_seq = Column(Integer, nullable=False, default=0)
+
+class RefreshToken(Base):
+    """Refresh token, stored only as an HMAC digest; rotated tokens share a `family_id`."""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String(32), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True))
+    revoked_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ApiKey(Base):
+    """Long-lived service credential, stored as a SHA-256 digest and looked up by prefix."""
+    __tablename__ = "api_keys"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    prefix = Column(String(16), index=True, nullable=False)
+    key_hash = Column(String(64), unique=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    revoked_at = Column(DateTime(timezone=True))
+
+class ShardAssignment(Base):
+    """Directory entry recording which shard holds a user's tasks."""
+    __tablename__ = "shard_directory"
+
+    user_id = Column(Integer, primary_key=True)
+    shard = Column(String, nullable=False)
+
+class IdBlock(Base):
+    """Reserved blocks of task ids, so ids stay unique across shards."""
+    __tablename__ = "id_blocks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
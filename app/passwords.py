@@ -0,0 +1,159 @@
+"""
+Password hashing policy, calibrated to a latency budget.
+
+The bcrypt cost (or argon2 time cost) is picked by timing hashes on this host,
+so a login costs about `PASSWORD_HASH_TARGET_MS` on every node type. Stored
+hashes weaker than the current policy, or made with a deprecated scheme, are
+rehashed in the background after the next successful login.
+
+Calibrate without starting the app, to pin the settings in the environment:
+
+    python -m app.passwords calibrate [--target-ms 250] [--scheme bcrypt|argon2]
+"""
+import argparse
+import logging
+import math
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+from passlib.hash import argon2, bcrypt
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Hashing configuration
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+# Set to skip calibration and use a fixed cost (bcrypt rounds or argon2 time cost)
+PASSWORD_HASH_COST = os.getenv("PASSWORD_HASH_COST")
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "2"))
+
+# Never go below these, however slow the host
+BCRYPT_ROUNDS_RANGE = (10, 16)
+ARGON2_TIME_COST_RANGE = (2, 10)
+
+def _clamp(value: int, bounds) -> int:
+    return max(bounds[0], min(bounds[1], value))
+
+def _time_hash(handler, samples: int = 3) -> float:
+    """Best-of-`samples` seconds for one hash."""
+    best = math.inf
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash("calibration-password")
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def calibrate_bcrypt(target_ms: float = PASSWORD_HASH_TARGET_MS) -> int:
+    """Bcrypt rounds whose hash time is closest to `target_ms`; each round doubles the cost."""
+    probe = BCRYPT_ROUNDS_RANGE[0]
+    elapsed = _time_hash(bcrypt.using(rounds=probe))
+    rounds = probe + round(math.log2(target_ms / 1000 / elapsed))
+    return _clamp(rounds, BCRYPT_ROUNDS_RANGE)
+
+def calibrate_argon2(target_ms: float = PASSWORD_HASH_TARGET_MS) -> int:
+    """Argon2 time cost meeting `target_ms` at the configured memory cost; cost is linear in it."""
+    probe = argon2.using(time_cost=1, memory_cost=ARGON2_MEMORY_KIB, parallelism=ARGON2_PARALLELISM)
+    elapsed = _time_hash(probe)
+    return _clamp(round(target_ms / 1000 / elapsed), ARGON2_TIME_COST_RANGE)
+
+def build_context(scheme: str, cost: int) -> CryptContext:
+    """
+    Hashing policy for `scheme` at `cost`.
+
+    Hashes below the cost, or in another scheme, report `needs_update`; the other
+    scheme stays verifiable so existing users can still log in and be migrated.
+    """
+    if scheme == "argon2":
+        return CryptContext(
+            schemes=["argon2", "bcrypt"],
+            deprecated="auto",
+            argon2__time_cost=cost,
+            argon2__min_rounds=cost,
+            argon2__memory_cost=ARGON2_MEMORY_KIB,
+            argon2__parallelism=ARGON2_PARALLELISM,
+        )
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=cost,
+        bcrypt__min_rounds=cost,
+    )
+
+def _available(scheme: str) -> str:
+    if scheme == "argon2" and not argon2.has_backend():
+        logger.warning("argon2 requested but argon2-cffi is not installed; using bcrypt")
+        return "bcrypt"
+    return scheme
+
+def calibrate(scheme: str = PASSWORD_HASH_SCHEME, target_ms: float = PASSWORD_HASH_TARGET_MS):
+    """Return (scheme, cost) meeting the latency budget on this host."""
+    scheme = _available(scheme)
+    cost = calibrate_argon2(target_ms) if scheme == "argon2" else calibrate_bcrypt(target_ms)
+    return scheme, cost
+
+# Passlib's defaults until `configure` runs (app startup)
+context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def configure(scheme: str = PASSWORD_HASH_SCHEME, cost: Optional[int] = None) -> CryptContext:
+    """Install the hashing policy, calibrating when no fixed cost is given."""
+    global context
+    if cost is None and PASSWORD_HASH_COST:
+        cost = int(PASSWORD_HASH_COST)
+    if _available(scheme) != scheme:
+        # A fixed argon2 cost means nothing to bcrypt
+        scheme, cost = "bcrypt", None
+    if cost is None:
+        scheme, cost = calibrate(scheme)
+        logger.info("Password hashing calibrated: %s cost %s", scheme, cost)
+    context = build_context(scheme, cost)
+    return context
+
+# Rehashes run one at a time, off the request path
+rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-rehash")
+
+def _rehash(bind: Engine, user_id: int, password: str, old_hash: str) -> None:
+    new_hash = context.hash(password)
+    with Session(bind=bind) as db:
+        # Skip if the password changed since the login that triggered this
+        db.query(models.User).filter(
+            models.User.id == user_id, models.User.hashed_password == old_hash
+        ).update({models.User.hashed_password: new_hash}, synchronize_session=False)
+        db.commit()
+
+def schedule_rehash(bind: Engine, user_id: int, password: str, old_hash: str) -> Future:
+    """Upgrade a stored hash to the current policy in the background."""
+    future = rehash_executor.submit(_rehash, bind, user_id, password, old_hash)
+    future.add_done_callback(_log_failure)
+    return future
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error("Password rehash failed", exc_info=future.exception())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Password hashing calibration")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_cmd = commands.add_parser("calibrate", help="Benchmark this host and print the settings")
+    calibrate_cmd.add_argument("--target-ms", type=float, default=PASSWORD_HASH_TARGET_MS)
+    calibrate_cmd.add_argument("--scheme", choices=["bcrypt", "argon2"], default=PASSWORD_HASH_SCHEME)
+    args = parser.parse_args()
+
+    scheme, cost = calibrate(args.scheme, args.target_ms)
+    elapsed = _time_hash(build_context(scheme, cost), samples=1)
+    print(f"# {scheme} cost {cost}: {elapsed * 1000:.0f} ms per hash (target {args.target_ms:.0f} ms)")
+    print(f"PASSWORD_HASH_SCHEME={scheme}")
+    print(f"PASSWORD_HASH_COST={cost}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from dotenv import load_dotenv
+
+from . import auth
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+
+class RateLimit:
+    """A token bucket limit: `burst` requests, refilled at `burst / period` per second."""
+
+    __slots__ = ("burst", "rate")
+
+    def __init__(self, burst: int, period: float):
+        self.burst = float(burst)
+        self.rate = burst / period
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        """Parse a "<burst>/<seconds>" spec such as "10/60"."""
+        burst, period = spec.split("/", 1)
+        return cls(int(burst), float(period))
+
+class RateLimitBackend:
+    """Interface for bucket storage, so a shared store can replace the in-memory one."""
+
+    def consume(self, key: str, limit: RateLimit) -> float:
+        """Take one token for key. Return 0.0 if allowed, else seconds until a token is available."""
+        return self.consume_all([(key, limit)])
+
+    def consume_all(self, buckets: List[Tuple[str, RateLimit]]) -> float:
+        """
+        Take one token from each bucket only if all of them have one; a rejected
+        request charges none. Return 0.0 if allowed, else the longest wait.
+        """
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Forget all buckets."""
+        raise NotImplementedError
+
+class InMemoryBackend(RateLimitBackend):
+    """
+    Token buckets kept in a fixed number of lock-protected shards, each a
+    least-recently-used map: a full shard drops its least recently used bucket,
+    which is the one most likely to have refilled anyway.
+    """
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10000):
+        self._shards: List["OrderedDict[str, List[float]]"] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._max_keys = max_keys_per_shard
+
+    def consume_all(self, buckets: List[Tuple[str, RateLimit]]) -> float:
+        indexes = sorted({hash(key) % len(self._shards) for key, _ in buckets})
+        for index in indexes:
+            self._locks[index].acquire()
+        try:
+            now = time.monotonic()
+            levels = [self._refill(key, limit, now) for key, limit in buckets]
+            retry_after = max(
+                ((1.0 - tokens) / limit.rate for tokens, (_, limit) in zip(levels, buckets) if tokens < 1.0),
+                default=0.0,
+            )
+            for tokens, (key, _) in zip(levels, buckets):
+                self._store(key, tokens if retry_after else tokens - 1.0, now)
+            return retry_after
+        finally:
+            for index in reversed(indexes):
+                self._locks[index].release()
+
+    def _refill(self, key: str, limit: RateLimit, now: float) -> float:
+        bucket = self._shards[hash(key) % len(self._shards)].get(key)
+        if bucket is None:
+            return limit.burst
+        return min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        buckets = self._shards[hash(key) % len(self._shards)]
+        if key in buckets:
+            buckets.move_to_end(key)
+        else:
+            while len(buckets) >= self._max_keys:
+                buckets.popitem(last=False)
+        buckets[key] = [tokens, now]
+
+    def reset(self) -> None:
+        for index, buckets in enumerate(self._shards):
+            with self._locks[index]:
+                buckets.clear()
+
+backend: RateLimitBackend = InMemoryBackend()
+
+def set_backend(new_backend: RateLimitBackend) -> None:
+    """Replace the bucket store, e.g. with one shared between workers."""
+    global backend
+    backend = new_backend
+
+def _limit_from_env(name: str, default: Optional[str]) -> Optional[RateLimit]:
+    spec = os.getenv(f"RATE_LIMIT_{name.upper()}", default)
+    return RateLimit.parse(spec) if spec else None
+
+class RouteLimiter:
+    """
+    Dependency that sheds load with 429 before any database or hashing work.
+
+    Add it to a route's `dependencies` so it runs ahead of `get_db`. Requests are
+    charged against a per-IP bucket and, when a user can be identified from the
+    bearer token or the submitted `username` form field, a per-user bucket; a
+    request is charged only if both allow it. A `username` form field is not
+    proof of who is calling, so its bucket is per username and IP: nobody can
+    exhaust another user's bucket from elsewhere.
+    Limits are read from `RATE_LIMIT_<NAME>_IP` / `RATE_LIMIT_<NAME>_USER`.
+    """
+
+    def __init__(self, name: str, per_ip: Optional[str] = None, per_user: Optional[str] = None):
+        self.name = name
+        self.per_ip = _limit_from_env(f"{name}_ip", per_ip)
+        self.per_user = _limit_from_env(f"{name}_user", per_user)
+
+    async def __call__(self, request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        client_ip = request.client.host if request.client else "unknown"
+        buckets = []
+        if self.per_ip is not None:
+            buckets.append((f"{self.name}:ip:{client_ip}", self.per_ip))
+        if self.per_user is not None:
+            user_key = await _user_key(request, client_ip)
+            if user_key:
+                buckets.append((f"{self.name}:user:{user_key}", self.per_user))
+        retry_after = backend.consume_all(buckets) if buckets else 0.0
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+async def _user_key(request: Request, client_ip: str) -> Optional[str]:
+    """Identify the caller without touching the database."""
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        try:
+            return jwt.decode(authorization[7:], auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("sub")
+        except JWTError:
+            return None
+    if request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+        # FastAPI has already parsed the form for the endpoint; Starlette caches it.
+        username = (await request.form()).get("username")
+        return f"{username}@{client_ip}" if isinstance(username, str) else None
+    return None
+
+# Per-route limits for the expensive authentication routes
+login_limiter = RouteLimiter("login", per_ip="30/60", per_user="10/60")
+register_limiter = RouteLimiter("register", per_ip="10/60")
+# Signup forms call this on every keystroke; generous, but bounded
+availability_limiter = RouteLimiter("available", per_ip="300/60")
@@ -0,0 +1,174 @@
+"""
+Recurrence rules for repeating tasks, expanded lazily.
+
+A recurring task stores an RRULE (RFC 5545 subset) and is one row; its
+occurrences are generated on demand, one at a time, and only for the window
+being read. Supported parts:
+
+    FREQ=DAILY|WEEKLY|MONTHLY|YEARLY   (required)
+    INTERVAL=n                         every n periods (default 1)
+    BYDAY=MO,WE,...                    weekdays, with FREQ=WEEKLY
+    BYMONTHDAY=1,15,-1                 days of the month, with FREQ=MONTHLY
+    COUNT=n / UNTIL=YYYYMMDD[THHMMSSZ] end of the series
+
+e.g. "FREQ=WEEKLY;BYDAY=MO" is every Monday at the time of the series start.
+"""
+import calendar
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# Stop a series whose periods keep producing nothing (e.g. BYMONTHDAY=31 every 2 months from February)
+MAX_EMPTY_PERIODS = 1000
+
+def naive_utc(moment: datetime) -> datetime:
+    """Rules are expanded in naive UTC, the way SQLite hands datetimes back."""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+class Rule:
+    """A parsed recurrence rule."""
+
+    def __init__(
+        self,
+        freq: str,
+        interval: int = 1,
+        by_day: Optional[List[int]] = None,
+        by_month_day: Optional[List[int]] = None,
+        count: Optional[int] = None,
+        until: Optional[datetime] = None,
+    ):
+        self.freq = freq
+        self.interval = interval
+        self.by_day = by_day
+        self.by_month_day = by_month_day
+        self.count = count
+        self.until = until
+
+def _parse_until(value: str) -> datetime:
+    for fmt in ("%Y%m%dT%H%M%SZ", "%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            until = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        # A date-only UNTIL includes that whole day
+        return until + timedelta(days=1) - timedelta(microseconds=1) if fmt == "%Y%m%d" else until
+    raise ValueError(f"Invalid UNTIL: {value}")
+
+def _positive_int(name: str, value: str) -> int:
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return int(value)
+
+def parse(text: str) -> Rule:
+    """Parse an RRULE string; raises ValueError for anything outside the supported subset."""
+    parts = {}
+    for part in text.strip().removeprefix("RRULE:").split(";"):
+        name, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Invalid rule part: {part!r}")
+        parts[name.strip().upper()] = value.strip().upper()
+
+    freq = parts.pop("FREQ", None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    rule = Rule(freq)
+    if "INTERVAL" in parts:
+        rule.interval = _positive_int("INTERVAL", parts.pop("INTERVAL"))
+    if "COUNT" in parts:
+        rule.count = _positive_int("COUNT", parts.pop("COUNT"))
+    if "UNTIL" in parts:
+        rule.until = _parse_until(parts.pop("UNTIL"))
+    if rule.count is not None and rule.until is not None:
+        raise ValueError("COUNT and UNTIL cannot both be set")
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY")
+        days = parts.pop("BYDAY").split(",")
+        if any(day not in WEEKDAYS for day in days):
+            raise ValueError(f"BYDAY values must be among {', '.join(WEEKDAYS)}")
+        rule.by_day = sorted({WEEKDAYS.index(day) for day in days})
+    if "BYMONTHDAY" in parts:
+        if freq != "MONTHLY":
+            raise ValueError("BYMONTHDAY is only supported with FREQ=MONTHLY")
+        try:
+            month_days = {int(day) for day in parts.pop("BYMONTHDAY").split(",")}
+        except ValueError:
+            raise ValueError("BYMONTHDAY values must be integers")
+        if any(day == 0 or not -31 <= day <= 31 for day in month_days):
+            raise ValueError("BYMONTHDAY values must be within 1..31 or -31..-1")
+        rule.by_month_day = sorted(month_days)
+    if parts:
+        raise ValueError(f"Unsupported rule parts: {', '.join(sorted(parts))}")
+    return rule
+
+def _add_months(year: int, month: int, months: int):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+def _period(rule: Rule, start: datetime, index: int) -> List[datetime]:
+    """Candidate occurrences of the `index`-th period after `start`, in order."""
+    step = index * rule.interval
+    if rule.freq == "DAILY":
+        return [start + timedelta(days=step)]
+    if rule.freq == "WEEKLY":
+        week = start - timedelta(days=start.weekday()) + timedelta(weeks=step)
+        return [week + timedelta(days=day) for day in (rule.by_day or [start.weekday()])]
+    if rule.freq == "MONTHLY":
+        year, month = _add_months(start.year, start.month, step)
+        last = calendar.monthrange(year, month)[1]
+        days = sorted({day if day > 0 else last + 1 + day for day in (rule.by_month_day or [start.day])})
+        return [start.replace(year=year, month=month, day=day) for day in days if 1 <= day <= last]
+    year = start.year + step
+    if start.month == 2 and start.day == 29 and not calendar.isleap(year):
+        return []
+    return [start.replace(year=year)]
+
+def _monday(moment: datetime):
+    return moment.date() - timedelta(days=moment.weekday())
+
+def _first_period(rule: Rule, start: datetime, after: datetime) -> int:
+    """Index of the period containing `after`, so expansion can skip the series' past."""
+    if rule.freq == "DAILY":
+        elapsed = (after - start).days
+    elif rule.freq == "WEEKLY":
+        elapsed = (_monday(after) - _monday(start)).days // 7
+    elif rule.freq == "MONTHLY":
+        elapsed = (after.year - start.year) * 12 + after.month - start.month
+    else:
+        elapsed = after.year - start.year
+    return max(0, elapsed // rule.interval)
+
+def occurrences(rule: Rule, start: datetime, after: Optional[datetime] = None) -> Iterator[datetime]:
+    """
+    Yield the series' occurrences in order, from `start` on.
+
+    With `after`, whole periods before it are skipped arithmetically (not when
+    COUNT is set, as counting starts at `start`); later occurrences before
+    `after` may still be yielded.
+    """
+    index = 0 if after is None or rule.count is not None else _first_period(rule, start, after)
+    produced = 0
+    empty = 0
+    while empty < MAX_EMPTY_PERIODS:
+        candidates = [occurrence for occurrence in _period(rule, start, index) if occurrence >= start]
+        empty = 0 if candidates else empty + 1
+        for occurrence in candidates:
+            if rule.until is not None and occurrence > rule.until:
+                return
+            yield occurrence
+            produced += 1
+            if rule.count is not None and produced >= rule.count:
+                return
+        index += 1
+
+def between(rule: Rule, start: datetime, window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+    """Yield the occurrences in [window_start, window_end)."""
+    for occurrence in occurrences(rule, start, after=window_start):
+        if occurrence >= window_end:
+            return
+        if occurrence >= window_start:
+            yield occurrence
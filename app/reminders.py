@@ -0,0 +1,228 @@
+import asyncio
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+from . import events, models, sharding
+from .database import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Reminder configuration
+REMINDER_WINDOW_MINUTES = float(os.getenv("REMINDER_WINDOW_MINUTES", "60"))
+REMINDER_OVERDUE_AFTER_MINUTES = float(os.getenv("REMINDER_OVERDUE_AFTER_MINUTES", "60"))
+
+DUE = "task.due"
+OVERDUE = "task.overdue"
+
+def _utc(value: datetime) -> datetime:
+    """Normalize to naive UTC, the form SQLite hands back."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class ReminderSink:
+    """Interface for consumers of due/overdue events."""
+
+    def emit(self, event: dict) -> None:
+        raise NotImplementedError
+
+class LoggingSink(ReminderSink):
+    def emit(self, event: dict) -> None:
+        logger.info("%s: task %s for user %s", event["type"], event["task_id"], event["owner_id"])
+
+class EventHubSink(ReminderSink):
+    """Push reminders to the owner's connected /tasks/stream clients."""
+
+    def emit(self, event: dict) -> None:
+        events.hub.publish(event["owner_id"], event)
+
+class ReminderScheduler:
+    """
+    Fires "task due" and "task overdue" events from an in-memory timer heap.
+
+    Only tasks due within the next `window` are loaded, through a range query on
+    the `due_date` index, and the window is topped up as time advances. Task
+    writes update the heap incrementally via `track`/`forget`, so the cost scales
+    with the number of tasks due soon rather than the table size. Superseded heap
+    entries are skipped lazily when they surface.
+
+    Every process runs a scheduler, and writes made elsewhere only reach their
+    own process's heap, so a reminder is `claim`ed in the database before it is
+    sent: once per task and time, and only if the task is still open and due then.
+    """
+
+    def __init__(
+        self,
+        window: timedelta = timedelta(minutes=REMINDER_WINDOW_MINUTES),
+        overdue_after: timedelta = timedelta(minutes=REMINDER_OVERDUE_AFTER_MINUTES),
+        sinks: Optional[List[ReminderSink]] = None,
+        bind: Engine = engine,
+    ):
+        self.bind = bind
+        self.window = window
+        self.overdue_after = overdue_after
+        self.sinks: List[ReminderSink] = sinks if sinks is not None else [LoggingSink(), EventHubSink()]
+        self._heap: List[Tuple[datetime, int, str, int]] = []
+        self._tasks: Dict[int, Tuple[datetime, int, str, int]] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def add_sink(self, sink: ReminderSink) -> None:
+        self.sinks.append(sink)
+
+    def load(self, start: datetime, end: datetime) -> int:
+        """Schedule reminders for open tasks whose due or overdue time falls in [start, end)."""
+        tasks = models.Task.__table__
+        engines = list(sharding.router.shards.values()) if sharding.router is not None else [self.bind]
+        query = select(tasks.c.id, tasks.c.owner_id, tasks.c.title, tasks.c.due_date).where(
+            and_(
+                tasks.c.due_date >= start - self.overdue_after,
+                tasks.c.due_date < end,
+                tasks.c.status != models.StatusEnum.completed,
+            )
+        )
+        count = 0
+        for bind in engines:
+            with bind.connect() as conn:
+                rows = conn.execute(query).all()
+            with self._lock:
+                for row in rows:
+                    count += self._schedule(row.id, row.owner_id, row.title, _utc(row.due_date), start, end)
+        self._loaded_until = end
+        return count
+
+    def track(self, task) -> None:
+        """Refresh a task's reminders after it was created or updated."""
+        if self._loaded_until is None:
+            return
+        with self._lock:
+            self._tasks.pop(task.id, None)
+            if task.due_date is None or task.status == models.StatusEnum.completed:
+                return
+            now = datetime.utcnow()
+            self._schedule(task.id, task.owner_id, task.title, _utc(task.due_date), now, self._loaded_until)
+        self._wake()
+
+    def forget(self, task_id: int) -> None:
+        """Drop reminders of a deleted task."""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def _schedule(self, task_id, owner_id, title, due, start, end) -> int:
+        current = self._tasks.get(task_id)
+        if current is not None and current[0] == due:
+            version = current[3]
+        else:
+            self._version += 1
+            version = self._version
+        scheduled = 0
+        for kind, fire_at in ((DUE, due), (OVERDUE, due + self.overdue_after)):
+            if start <= fire_at < end:
+                heapq.heappush(self._heap, (fire_at, task_id, kind, version))
+                scheduled += 1
+        if scheduled:
+            self._tasks[task_id] = (due, owner_id, title, version)
+        return scheduled
+
+    def pop_due(self, now: datetime) -> List[dict]:
+        """Remove and return the events whose time has come."""
+        fired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, task_id, kind, version = heapq.heappop(self._heap)
+                current = self._tasks.get(task_id)
+                if current is None or current[3] != version:
+                    # Superseded by a later write
+                    continue
+                due, owner_id, title, _ = current
+                if kind == OVERDUE or due + self.overdue_after >= self._loaded_until:
+                    self._tasks.pop(task_id, None)
+                fired.append({
+                    "type": kind,
+                    "task_id": task_id,
+                    "owner_id": owner_id,
+                    "title": title,
+                    "due_date": due.isoformat(),
+                })
+        return fired
+
+    def claim(self, event: dict) -> bool:
+        """
+        Take a popped reminder for this process with a conditional UPDATE of
+        `reminded_at`. False if another process sent it, or the task has since
+        been completed, rescheduled or deleted.
+        """
+        tasks = models.Task.__table__
+        due = datetime.fromisoformat(event["due_date"])
+        fire_at = due + self.overdue_after if event["type"] == OVERDUE else due
+        bind = sharding.router.engine_for(event["owner_id"]) if sharding.router is not None else self.bind
+        with bind.begin() as conn:
+            task = conn.execute(
+                select(tasks.c.status, tasks.c.due_date)
+                .where(tasks.c.id == event["task_id"], tasks.c.owner_id == event["owner_id"])
+            ).first()
+            if task is None or task.status == models.StatusEnum.completed or task.due_date is None:
+                return False
+            if _utc(task.due_date) != due:
+                return False
+            return conn.execute(
+                update(tasks)
+                .where(
+                    tasks.c.id == event["task_id"],
+                    or_(tasks.c.reminded_at.is_(None), tasks.c.reminded_at < fire_at),
+                )
+                # Not a change to the task: keep updated_at (and so its ETag) as is
+                .values(reminded_at=fire_at, updated_at=tasks.c.updated_at)
+            ).rowcount == 1
+
+    def next_fire_at(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _wake(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self) -> None:
+        """Background loop started from the app lifespan."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        now = datetime.utcnow()
+        await asyncio.to_thread(self.load, now, now + self.window)
+        while True:
+            try:
+                now = datetime.utcnow()
+                if now + self.window / 2 >= self._loaded_until:
+                    await asyncio.to_thread(self.load, self._loaded_until, now + self.window)
+                for event in self.pop_due(now):
+                    if not await asyncio.to_thread(self.claim, event):
+                        continue
+                    for sink in self.sinks:
+                        try:
+                            sink.emit(event)
+                        except Exception:
+                            logger.exception("Reminder sink failed")
+                next_at = min(filter(None, [self.next_fire_at(), now + self.window / 2]))
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max((next_at - datetime.utcnow()).total_seconds(), 0))
+                except asyncio.TimeoutError:
+                    pass
+            except Exception:
+                logger.exception("Reminder scheduler failed")
+                await asyncio.sleep(5)
+
+scheduler = ReminderScheduler()
@@ -1,8 +1,11 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+import json
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Annotated, Any, Dict, Optional, List, Literal, Union
 from datetime import datetime
 from enum import Enum
 
+from . import recurrence as recurrence_rules
+
 class PriorityEnum(str, Enum):
     low = "low"
     medium = "medium"
@@ -30,15 +33,30 @@ class User(UserBase):
         from_attributes = True
 
 # Task schemas
+def _tag_names(tags):
+    """Accept Tag rows (from the ORM) as well as plain names."""
+    return [getattr(tag, "name", tag) for tag in tags] if tags is not None else None
+
+def _valid_recurrence(rule):
+    """Reject rules outside the supported RRULE subset."""
+    if rule is not None:
+        rule = rule.strip().upper()
+        recurrence_rules.parse(rule)
+    return rule
+
 class TaskBase(BaseModel):
     title: str
     description: Optional[str] = None
     priority: PriorityEnum = PriorityEnum.medium
     status: StatusEnum = StatusEnum.pending
     due_date: Optional[datetime] = None
+    recurrence: Optional[str] = Field(None, description='RRULE subset, e.g. "FREQ=WEEKLY;BYDAY=MO"; starts at due_date')
+
+    _recurrence = field_validator("recurrence")(_valid_recurrence)
 
 class TaskCreate(TaskBase):
-    pass
+    parent_id: Optional[int] = None
+    tags: List[str] = []
 
 class TaskUpdate(BaseModel):
     title: Optional[str] = None
@@ -46,24 +64,251 @@ class TaskUpdate(BaseModel):
     priority: Optional[PriorityEnum] = None
     status: Optional[StatusEnum] = None
     due_date: Optional[datetime] = None
+    recurrence: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+    _recurrence = field_validator("recurrence")(_valid_recurrence)
 
 class Task(TaskBase):
     id: int
     owner_id: int
+    parent_id: Optional[int] = None
+    tags: List[str] = []
     created_at: datetime
     updated_at: Optional[datetime] = None
+    # Send as If-Match (e.g. "3") to update only if nobody else has since
+    version: int
+
+    _tags = field_validator("tags", mode="before")(_tag_names)
+
+    class Config:
+        from_attributes = True
+
+class TaskPartial(BaseModel):
+    """A task where every field is optional, for sparse (?fields=) responses."""
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[PriorityEnum] = None
+    status: Optional[StatusEnum] = None
+    due_date: Optional[datetime] = None
+    owner_id: Optional[int] = None
+    parent_id: Optional[int] = None
+    recurrence: Optional[str] = None
+    tags: Optional[List[str]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
+
+    _tags = field_validator("tags", mode="before")(_tag_names)
+
+    class Config:
+        from_attributes = True
+
+class TaskDashboard(BaseModel):
+    total: int
+    by_status: Dict[StatusEnum, int]
+    by_priority: Dict[PriorityEnum, int]
+    next_due: List[TaskPartial]
+    recently_updated: List[TaskPartial]
+
+# Recurring task schemas
+class OccurrenceUpdate(BaseModel):
+    occurs_at: datetime
+    status: Optional[StatusEnum] = None
+    due_date: Optional[datetime] = None
+    cancelled: Optional[bool] = None
+
+class Occurrence(BaseModel):
+    """A task, or one occurrence of a recurring task, on the calendar."""
+    task_id: int
+    title: str
+    priority: PriorityEnum
+    status: StatusEnum
+    due_date: datetime
+    # Identifies the occurrence of a recurring task (differs from due_date once moved)
+    occurs_at: Optional[datetime] = None
+    recurring: bool = False
+    cancelled: bool = False
+
+# Task hierarchy schemas
+class TaskMove(BaseModel):
+    parent_id: Optional[int] = None
+
+class TaskRollup(BaseModel):
+    task_id: int
+    total: int
+    completed: int
+    open: int
+    depth: int
+
+# Batch fetch schemas
+class TaskIds(BaseModel):
+    ids: List[int]
+
+class TaskBatch(BaseModel):
+    tasks: List[Task]
+    missing: List[int]
+
+class TaskPartialBatch(BaseModel):
+    """A TaskBatch read with ?fields=."""
+    tasks: List[TaskPartial]
+    missing: List[int]
+
+# Change feed schemas
+class ChangeOp(str, Enum):
+    created = "created"
+    updated = "updated"
+    deleted = "deleted"
+
+class TaskChange(BaseModel):
+    seq: int
+    op: ChangeOp
+    task_id: int
+    task: Optional[Task] = None
+
+class TaskChanges(BaseModel):
+    changes: List[TaskChange]
+    cursor: int
+    has_more: bool = False
+    resync_required: bool = False
+
+# Task history schemas
+class TaskEvent(BaseModel):
+    id: int
+    task_id: int
+    actor_id: int
+    op: str
+    changes: Dict[str, Dict[str, Any]] = {}
+    created_at: datetime
+
+    @field_validator("changes", mode="before")
+    @classmethod
+    def _decode(cls, changes):
+        if changes is None:
+            return {}
+        return json.loads(changes) if isinstance(changes, str) else changes
 
     class Config:
         from_attributes = True
 
+class TaskHistory(BaseModel):
+    events: List[TaskEvent]
+    # Pass as before_id for the next (older) page; null on the last page
+    next_before_id: Optional[int] = None
+
+# Transactional batch schemas
+class BatchCreate(BaseModel):
+    op: Literal["create"]
+    task: TaskCreate
+
+class BatchUpdate(BaseModel):
+    op: Literal["update"]
+    task_id: int
+    task: TaskUpdate
+    # Apply only if the task is still at this version (as If-Match does)
+    version: Optional[int] = None
+
+class BatchDelete(BaseModel):
+    op: Literal["delete"]
+    task_id: int
+
+BatchOperation = Annotated[Union[BatchCreate, BatchUpdate, BatchDelete], Field(discriminator="op")]
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    atomic: bool = True
+
+class BatchResult(BaseModel):
+    index: int
+    op: str
+    status: int
+    task_id: Optional[int] = None
+    task: Optional[Task] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    committed: bool
+    results: List[BatchResult]
+
 # Authentication schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+# API key schemas
+class ApiKeyCreate(BaseModel):
+    name: str
+
+class ApiKey(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    created_at: datetime
+    revoked_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ApiKeyCreated(ApiKey):
+    key: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
 
 class UserLogin(BaseModel):
     username: str
-    password: str 
\ No newline at end of file
+    password: str 
+
+# Background job schemas
+class JobFilter(BaseModel):
+    status: Optional[StatusEnum] = None
+    priority: Optional[PriorityEnum] = None
+    tags_any: Optional[List[str]] = None
+
+class JobBase(BaseModel):
+    # Defaults to JOB_MAX_ATTEMPTS
+    max_attempts: Optional[int] = Field(None, ge=1, le=10)
+
+class ImportJob(JobBase):
+    kind: Literal["import"]
+    tasks: List[TaskCreate] = Field(..., min_length=1)
+
+class BulkUpdateJob(JobBase):
+    kind: Literal["bulk_update"]
+    filter: JobFilter = JobFilter()
+    update: TaskUpdate
+
+class ExportJob(JobBase):
+    kind: Literal["export"]
+    fields: Optional[List[str]] = None
+
+# Discriminated on `kind` by the route's Body()
+JobCreate = Union[ImportJob, BulkUpdateJob, ExportJob]
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    processed: int
+    total: Optional[int] = None
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    # Resume checkpoint while the job runs; its result once it succeeded
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @field_validator("result", mode="before")
+    @classmethod
+    def _decode(cls, result):
+        return json.loads(result) if isinstance(result, str) else result
+
+    class Config:
+        from_attributes = True
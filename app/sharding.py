@@ -0,0 +1,250 @@
+"""
+Horizontal sharding of task data by owner.
+
+Users (and other global tables) stay on the primary database. Models that declare
+`__shard_key__` live on one of several shard databases, chosen per owner. The
+`shard_directory` table on the primary is the source of truth for placement; new
+owners are placed with a consistent hash ring so that adding a shard only affects
+where new owners land. Each process caches directory entries for
+SHARD_DIRECTORY_TTL_SECONDS, so a move made by another process is picked up
+within that time.
+
+Usage:
+    DATABASE_SHARD_URLS=sqlite:///./shard0.db,sqlite:///./shard1.db
+    python -m app.sharding move <user_id> <shard>
+"""
+import bisect
+import hashlib
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, create_engine, event, insert, select, delete, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models
+from .database import Base, engine as primary_engine, _connect_args
+
+load_dotenv()
+
+SHARD_URLS = [url.strip() for url in os.getenv("DATABASE_SHARD_URLS", "").split(",") if url.strip()]
+# How long a process trusts its cached copy of an owner's directory entry
+SHARD_DIRECTORY_TTL_SECONDS = float(os.getenv("SHARD_DIRECTORY_TTL_SECONDS", "5"))
+
+ID_BLOCK_SIZE = 1000
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+def sharded_models() -> list:
+    """Mapped classes whose rows are partitioned by `__shard_key__`."""
+    return [m.class_ for m in Base.registry.mappers if getattr(m.class_, "__shard_key__", None)]
+
+class ShardRouter:
+    """Maps owner ids to shard engines through the directory, placing new owners on a hash ring."""
+
+    def __init__(
+        self,
+        shards: Dict[str, Engine],
+        primary: Engine = primary_engine,
+        vnodes: int = 64,
+        directory_ttl: float = SHARD_DIRECTORY_TTL_SECONDS,
+    ):
+        self.shards = shards
+        self.primary = primary
+        self.directory_ttl = directory_ttl
+        self._ring = sorted((_hash(f"{name}#{i}"), name) for name in shards for i in range(vnodes))
+        self._ring_keys = [key for key, _ in self._ring]
+        # owner id -> (shard name, monotonic time the entry stops being trusted)
+        self._directory: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._last_id = -1
+
+    def ring_shard(self, owner_id: int) -> str:
+        """The shard the hash ring picks for an owner with no directory entry."""
+        index = bisect.bisect(self._ring_keys, _hash(str(owner_id))) % len(self._ring)
+        return self._ring[index][1]
+
+    def shard_for(self, owner_id: int) -> str:
+        """Look up (or assign) the shard name for an owner; cached for `directory_ttl` seconds."""
+        cached = self._directory.get(owner_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        with Session(self.primary) as db:
+            entry = db.get(models.ShardAssignment, owner_id)
+            if entry is None:
+                entry = models.ShardAssignment(user_id=owner_id, shard=self.ring_shard(owner_id))
+                db.add(entry)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Another worker assigned it first
+                    db.rollback()
+                    entry = db.get(models.ShardAssignment, owner_id)
+            name = entry.shard
+        self._directory[owner_id] = (name, time.monotonic() + self.directory_ttl)
+        return name
+
+    def engine_for(self, owner_id: int) -> Engine:
+        return self.shards[self.shard_for(owner_id)]
+
+    def bind_session(self, db: Session, owner_id: int) -> None:
+        """Point the sharded models of an existing session at the owner's shard."""
+        shard_engine = self.engine_for(owner_id)
+        for model in sharded_models():
+            db.bind_mapper(model, shard_engine)
+
+    def refresh(self) -> None:
+        """Drop cached directory entries, e.g. after another process moved users."""
+        self._directory.clear()
+
+    def next_id(self) -> int:
+        """Allocate a globally unique id from blocks reserved on the primary."""
+        with self._lock:
+            if self._next_id > self._last_id:
+                with Session(self.primary) as db:
+                    block = models.IdBlock()
+                    db.add(block)
+                    db.commit()
+                    self._next_id = block.id * ID_BLOCK_SIZE
+                    self._last_id = self._next_id + ID_BLOCK_SIZE - 1
+            allocated = self._next_id
+            self._next_id += 1
+            return allocated
+
+    def move_user(self, owner_id: int, target: str) -> int:
+        """
+        Move an owner's sharded rows to `target` while the API keeps serving.
+
+        Each pass goes over every other shard holding rows of the owner: it locks
+        them (a no-op UPDATE, which takes SQLite's write lock), copies them to the
+        target, skipping rows already there, flips the directory entry and deletes
+        the originals. Passes repeat until one finds nothing and `directory_ttl`
+        has passed since the flip, so writes from workers still routing to the old
+        shard are swept up as well. An interrupted move is finished by running it
+        again. Returns the number of rows moved.
+        """
+        if target not in self.shards:
+            raise ValueError(f"Unknown shard: {target}")
+        self._directory.pop(owner_id, None)
+        flipped_at = time.monotonic() if self.shard_for(owner_id) == target else None
+        moved = 0
+        while True:
+            pass_moved = 0
+            for source in self.shards:
+                if source != target:
+                    pass_moved += self._move_rows(owner_id, source, target, flip=flipped_at is None)
+                    if pass_moved and flipped_at is None:
+                        flipped_at = time.monotonic()
+            if flipped_at is None:
+                self._set_directory(owner_id, target)
+                flipped_at = time.monotonic()
+            moved += pass_moved
+            if pass_moved == 0:
+                waited = time.monotonic() - flipped_at
+                if waited >= self.directory_ttl:
+                    return moved
+                time.sleep(min(self.directory_ttl - waited, 0.5))
+
+    def _move_rows(self, owner_id: int, source: str, target: str, flip: bool) -> int:
+        tables = [m.__table__ for m in sharded_models()]
+        ordered = [t for t in Base.metadata.sorted_tables if t in tables]
+        with self.shards[source].begin() as src:
+            for table in ordered:
+                key = table.c[_shard_key(table)]
+                src.execute(update(table).where(key == owner_id).values({key.name: key}))
+            rows = {
+                table: [dict(r._mapping) for r in src.execute(select(table).where(table.c[_shard_key(table)] == owner_id))]
+                for table in ordered
+            }
+            count = sum(len(table_rows) for table_rows in rows.values())
+            if not count:
+                return 0
+            with self.shards[target].begin() as dst:
+                for table in ordered:
+                    if rows[table]:
+                        dst.execute(_insert_missing(dst, table), rows[table])
+            # A crash from here until the deletes commit leaves copies on the
+            # source; running the move again skips them on the target and deletes them
+            if flip:
+                self._set_directory(owner_id, target)
+            # Only the rows copied: where the lock does not block writers (e.g. on
+            # PostgreSQL) rows inserted since the SELECT are left for the next pass
+            for table in reversed(ordered):
+                if rows[table]:
+                    primary_key = table.primary_key.columns
+                    src.execute(
+                        delete(table).where(and_(*(column == bindparam(f"pk_{column.name}") for column in primary_key))),
+                        [{f"pk_{column.name}": row[column.name] for column in primary_key} for row in rows[table]],
+                    )
+        return count
+
+    def _set_directory(self, owner_id: int, name: str) -> None:
+        with Session(self.primary) as db:
+            db.merge(models.ShardAssignment(user_id=owner_id, shard=name))
+            db.commit()
+        self._directory[owner_id] = (name, time.monotonic() + self.directory_ttl)
+
+def _insert_missing(conn, table):
+    """INSERT that skips rows conflicting with ones already present, e.g. from an interrupted move."""
+    if conn.dialect.name == "sqlite":
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if conn.dialect.name == "postgresql":
+        return postgresql_insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def _shard_key(table) -> str:
+    for model in sharded_models():
+        if model.__table__ is table:
+            return model.__shard_key__
+    raise KeyError(table.name)
+
+router: Optional[ShardRouter] = None
+
+def _assign_id(mapper, connection, target):
+    if target.id is None:
+        target.id = router.next_id()
+
+def configure_shards(urls: List[str], primary: Engine = primary_engine) -> Optional[ShardRouter]:
+    """Create shard engines for `urls` (named shard0, shard1, ...); empty disables sharding."""
+    global router
+    for model in sharded_models():
+        if event.contains(model, "before_insert", _assign_id):
+            event.remove(model, "before_insert", _assign_id)
+    if not urls:
+        router = None
+        return None
+    shards = {f"shard{i}": create_engine(url, connect_args=_connect_args(url)) for i, url in enumerate(urls)}
+    router = ShardRouter(shards, primary=primary)
+    for model in sharded_models():
+        if "id" in model.__table__.c:
+            event.listen(model, "before_insert", _assign_id)
+    return router
+
+def create_shard_tables() -> None:
+    """Create the schema on every shard."""
+    if router is not None:
+        for shard_engine in router.shards.values():
+            Base.metadata.create_all(bind=shard_engine)
+
+def bind_session(db: Session, owner_id: int) -> None:
+    """Route a request's session to the owner's shard when sharding is enabled."""
+    if router is not None:
+        router.bind_session(db, owner_id)
+
+configure_shards(SHARD_URLS)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "move" or router is None:
+        print("Usage: DATABASE_SHARD_URLS=... python -m app.sharding move <user_id> <shard>")
+        sys.exit(1)
+    count = router.move_user(int(sys.argv[2]), sys.argv[3])
+    print(f"Moved {count} rows for user {sys.argv[2]} to {sys.argv[3]}")
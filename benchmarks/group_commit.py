@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark task write throughput: per-request commits vs. group commit.
+
+Usage: python -m benchmarks.group_commit [threads] [writes_per_thread]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.group_commit import GroupCommitWriter
+from app import crud, models, schemas
+
+def make_database(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with factory() as db:
+        db.add(models.User(username="bench", email="bench@example.com", hashed_password="x"))
+        db.commit()
+    return engine, factory
+
+def run_threads(threads, writes, write):
+    workers = [
+        threading.Thread(target=lambda n=n: [write(n, i) for i in range(writes)])
+        for n in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * writes / (time.perf_counter() - start)
+
+def bench_per_request(factory, threads, writes):
+    def write(n, i):
+        with factory() as db:
+            crud.create_task(db, schemas.TaskCreate(title=f"{n}-{i}"), user_id=1)
+    return run_threads(threads, writes, write)
+
+def bench_group_commit(factory, threads, writes):
+    writer = GroupCommitWriter(factory)
+    def write(n, i):
+        writer.execute(
+            lambda db: crud.create_task(db, schemas.TaskCreate(title=f"{n}-{i}"), user_id=1, commit=False),
+            owner_id=1,
+        )
+    try:
+        return run_threads(threads, writes, write)
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, bench in (("per-request commit", bench_per_request), ("group commit", bench_group_commit)):
+            engine, factory = make_database(os.path.join(tmp, f"{bench.__name__}.db"))
+            rate = bench(factory, threads, writes)
+            engine.dispose()
+            print(f"{name:>20}: {rate:8.0f} writes/s ({threads} threads x {writes} writes)")
@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -6,7 +7,8 @@ from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.database import get_db, Base
-from app import crud, schemas
+from app import rate_limit
+from app import api_keys, availability, crud, models, passwords, schemas
 
 # Create in-memory database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -32,6 +34,8 @@ client = TestClient(app)
 @pytest.fixture(autouse=True)
 def setup_database():
     """Create tables before each test and clean up after."""
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
@@ -194,4 +198,239 @@ def test_get_current_user_invalid_token():
 def test_get_current_user_no_token():
     """Test getting current user without token."""
     response = client.get("/auth/me")
-    assert response.status_code == 401 
\ No newline at end of file
+    assert response.status_code == 401 
+
+def test_login_rate_limited_per_user():
+    """Test that repeated logins for one username are shed with 429."""
+    limit = rate_limit.login_limiter.per_user.burst
+    for _ in range(int(limit)):
+        client.post("/auth/login", data={"username": "victim", "password": "wrong"})
+
+    response = client.post("/auth/login", data={"username": "victim", "password": "wrong"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Other usernames still have their own bucket
+    response = client.post("/auth/login", data={"username": "someone", "password": "wrong"})
+    assert response.status_code == 401
+
+def test_login_rate_limit_cannot_lock_out_a_user_from_elsewhere():
+    """Test that failed logins for a username from one address leave it usable from another."""
+    client.post("/auth/register", json={"username": "victim", "email": "victim@example.com", "password": "password123"})
+    limit = rate_limit.login_limiter.per_user.burst
+
+    async def from_elsewhere(scope, receive, send):
+        await app({**scope, "client": ("203.0.113.9", 50000)}, receive, send)
+
+    attacker = TestClient(from_elsewhere)
+    for _ in range(int(limit) + 1):
+        attacker.post("/auth/login", data={"username": "victim", "password": "wrong"})
+
+    response = client.post("/auth/login", data={"username": "victim", "password": "password123"})
+    assert response.status_code == 200
+
+def test_rejected_request_charges_no_bucket():
+    """Test that a request refused by one bucket takes no token from the others."""
+    backend = rate_limit.InMemoryBackend(shards=2)
+    roomy, tight = rate_limit.RateLimit(2, 1000), rate_limit.RateLimit(1, 1000)
+    assert backend.consume_all([("ip", roomy), ("user", tight)]) == 0.0
+    assert backend.consume_all([("ip", roomy), ("user", tight)]) > 0
+    # The refused request left the IP bucket its second token
+    assert backend.consume("ip", roomy) == 0.0
+
+def test_token_bucket_refills():
+    """Test the in-memory token bucket refill arithmetic."""
+    backend = rate_limit.InMemoryBackend(shards=2)
+    limit = rate_limit.RateLimit(2, 1000)
+    assert backend.consume("k", limit) == 0.0
+    assert backend.consume("k", limit) == 0.0
+    retry_after = backend.consume("k", limit)
+    assert 0 < retry_after <= 500
+
+def test_full_shard_evicts_least_recently_used_bucket():
+    """Test that a full shard drops only its least recently used bucket."""
+    backend = rate_limit.InMemoryBackend(shards=1, max_keys_per_shard=2)
+    limit = rate_limit.RateLimit(1, 1000)
+    assert backend.consume("a", limit) == 0.0
+    assert backend.consume("b", limit) == 0.0
+    assert backend.consume("a", limit) > 0
+    # "b" is now the least recently used and makes room for "c"
+    assert backend.consume("c", limit) == 0.0
+    assert backend.consume("a", limit) > 0
+    assert backend.consume("b", limit) == 0.0
+
+def test_register_duplicate_race_returns_400(monkeypatch):
+    """Test that a unique-constraint violation after the pre-check maps to 400."""
+    client.post(
+        "/auth/register",
+        json={"username": "racer", "email": "racer@example.com", "password": "testpassword123"}
+    )
+    # Simulate a concurrent registration landing between the check and the insert
+    checks = iter([None])
+    original = crud.get_user_conflict
+    monkeypatch.setattr(crud, "get_user_conflict", lambda *args, **kwargs: next(checks, None) or original(*args, **kwargs))
+
+    response = client.post(
+        "/auth/register",
+        json={"username": "other", "email": "racer@example.com", "password": "testpassword123"}
+    )
+    assert response.status_code == 400
+    assert "Email already registered" in response.json()["detail"]
+
+def test_username_availability():
+    """Test the availability endpoint with the bloom filter in front of the database."""
+    availability.usernames.invalidate()
+    client.post(
+        "/auth/register",
+        json={"username": "taken", "email": "taken@example.com", "password": "testpassword123"}
+    )
+    assert client.get("/auth/available", params={"username": "taken"}).json()["available"] is False
+    assert client.get("/auth/available", params={"username": "free"}).json()["available"] is True
+    assert client.get("/auth/available", params={"username": ""}).status_code == 422
+
+    # Users created elsewhere are picked up when the filter is rebuilt
+    with TestingSessionLocal() as db:
+        db.add(models.User(username="imported", email="imported@example.com", hashed_password="x"))
+        db.commit()
+    availability.usernames.invalidate()
+    assert client.get("/auth/available", params={"username": "imported"}).json()["available"] is False
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test the bloom filter sizing and membership."""
+    bloom = availability.BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"user{i}")
+    assert all(f"user{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+def _login_tokens():
+    client.post(
+        "/auth/register",
+        json={"username": "refresher", "email": "refresher@example.com", "password": "testpassword123"}
+    )
+    response = client.post("/auth/login", data={"username": "refresher", "password": "testpassword123"})
+    assert response.status_code == 200
+    return response.json()
+
+def test_refresh_rotates_tokens():
+    """Test that a refresh token yields new tokens and is stored only as a digest."""
+    tokens = _login_tokens()
+    assert tokens["refresh_token"]
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    me = client.get("/auth/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.json()["username"] == "refresher"
+
+    with TestingSessionLocal() as db:
+        stored = db.query(models.RefreshToken).all()
+        assert len(stored) == 2
+        assert len({row.family_id for row in stored}) == 1
+        assert tokens["refresh_token"] not in {row.token_hash for row in stored}
+
+def test_refresh_token_reuse_revokes_family():
+    """Test that replaying a used refresh token revokes the whole session."""
+    tokens = _login_tokens()
+    rotated = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    assert "reuse" in response.json()["detail"]
+
+    # The token issued to the legitimate client is revoked as well
+    response = client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+
+def test_refresh_rejects_unknown_and_expired_tokens():
+    """Test that unknown and expired refresh tokens are rejected."""
+    tokens = _login_tokens()
+    assert client.post("/auth/refresh", json={"refresh_token": "bogus"}).status_code == 401
+
+    with TestingSessionLocal() as db:
+        db.query(models.RefreshToken).update({models.RefreshToken.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+@pytest.fixture
+def restore_password_context():
+    original = passwords.context
+    yield
+    passwords.context = original
+
+def test_login_rehashes_outdated_hash(restore_password_context):
+    """Test that a hash below the current cost is upgraded after login."""
+    passwords.configure("bcrypt", cost=4)
+    client.post(
+        "/auth/register",
+        json={"username": "rehash", "email": "rehash@example.com", "password": "testpassword123"}
+    )
+    passwords.configure("bcrypt", cost=5)
+
+    response = client.post("/auth/login", data={"username": "rehash", "password": "testpassword123"})
+    assert response.status_code == 200
+    passwords.rehash_executor.submit(lambda: None).result()
+
+    with TestingSessionLocal() as db:
+        stored = crud.get_user_by_username(db, "rehash").hashed_password
+    assert stored.startswith("$2b$05$")
+    assert not passwords.context.needs_update(stored)
+    response = client.post("/auth/login", data={"username": "rehash", "password": "testpassword123"})
+    assert response.status_code == 200
+
+def test_bcrypt_calibration_targets_latency(monkeypatch):
+    """Test that calibration scales rounds by the measured hash time."""
+    monkeypatch.setattr(passwords, "_time_hash", lambda handler, samples=3: 0.0625)
+    assert passwords.calibrate_bcrypt(target_ms=250) == 12
+    assert passwords.calibrate_bcrypt(target_ms=1) == passwords.BCRYPT_ROUNDS_RANGE[0]
+    assert passwords.calibrate("bcrypt", target_ms=500) == ("bcrypt", 13)
+
+def _user_headers():
+    client.post(
+        "/auth/register",
+        json={"username": "service", "email": "service@example.com", "password": "testpassword123"}
+    )
+    response = client.post("/auth/login", data={"username": "service", "password": "testpassword123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_api_key_authenticates_from_cache():
+    """Test that an API key works as a bearer credential and is served from memory."""
+    api_keys.cache.clear()
+    headers = _user_headers()
+    response = client.post("/auth/api-keys", json={"name": "ci"}, headers=headers)
+    assert response.status_code == 200
+    created = response.json()
+    assert created["key"].startswith("tm_" + created["prefix"])
+
+    key_headers = {"Authorization": f"Bearer {created['key']}"}
+    assert client.get("/auth/me", headers=key_headers).json()["username"] == "service"
+    assert client.post("/tasks/", json={"title": "From CI"}, headers=key_headers).status_code == 200
+
+    with TestingSessionLocal() as db:
+        stored = db.query(models.ApiKey).one()
+        assert stored.key_hash == api_keys.digest(created["key"])
+        assert created["key"] not in (stored.key_hash, stored.prefix)
+    assert api_keys.cache.get(api_keys.digest(created["key"])).username == "service"
+
+    listed = client.get("/auth/api-keys", headers=headers).json()
+    assert [key["name"] for key in listed] == ["ci"]
+    assert "key" not in listed[0]
+
+def test_revoked_api_key_is_rejected():
+    """Test that revocation takes effect immediately on this worker."""
+    api_keys.cache.clear()
+    headers = _user_headers()
+    created = client.post("/auth/api-keys", json={"name": "old"}, headers=headers).json()
+    key_headers = {"Authorization": f"Bearer {created['key']}"}
+    assert client.get("/auth/me", headers=key_headers).status_code == 200
+
+    response = client.delete(f"/auth/api-keys/{created['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["revoked_at"] is not None
+    assert client.get("/auth/me", headers=key_headers).status_code == 401
+
+    assert client.delete("/auth/api-keys/999", headers=headers).status_code == 404
+    forged = created["key"][:-4] + "AAAA"
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
@@ -0,0 +1,165 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.database import get_db, Base
+from app import crud, rate_limit
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Create tables before each test and clean up after."""
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def auth_headers():
+    """Create authenticated user and return headers."""
+    client.post(
+        "/auth/register",
+        json={"username": "batchuser", "email": "batch@example.com", "password": "testpassword123"}
+    )
+    response = client.post("/auth/login", data={"username": "batchuser", "password": "testpassword123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_batch_runs_operations_in_order(auth_headers):
+    """Test a create/update/delete sequence in one request."""
+    existing = client.post("/tasks/", json={"title": "Existing"}, headers=auth_headers).json()
+    doomed = client.post("/tasks/", json={"title": "Doomed"}, headers=auth_headers).json()
+
+    response = client.post("/batch/", json={"operations": [
+        {"op": "create", "task": {"title": "New", "priority": "high"}},
+        {"op": "update", "task_id": existing["id"], "task": {"status": "completed"}},
+        {"op": "delete", "task_id": doomed["id"]},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["committed"] is True
+    assert [r["status"] for r in data["results"]] == [201, 200, 200]
+    assert data["results"][0]["task"]["title"] == "New"
+    assert data["results"][1]["task"]["status"] == "completed"
+
+    titles = sorted(task["title"] for task in client.get("/tasks/", headers=auth_headers).json())
+    assert titles == ["Existing", "New"]
+    changes = client.get("/tasks/changes", headers=auth_headers).json()
+    assert {change["op"] for change in changes["changes"]} == {"created", "updated", "deleted"}
+
+def test_atomic_batch_rolls_back_on_failure(auth_headers):
+    """Test that one failing operation undoes the whole atomic batch."""
+    response = client.post("/batch/", json={"operations": [
+        {"op": "create", "task": {"title": "Never"}},
+        {"op": "update", "task_id": 999, "task": {"title": "Missing"}},
+        {"op": "delete", "task_id": 998},
+    ]}, headers=auth_headers)
+    assert response.status_code == 409
+    data = response.json()
+    assert data["committed"] is False
+    assert [r["status"] for r in data["results"]] == [424, 404, 424]
+    assert data["results"][0]["task_id"] is None
+    assert client.get("/tasks/", headers=auth_headers).json() == []
+
+def test_atomic_batch_reports_a_database_error_per_operation(auth_headers, monkeypatch):
+    """Test that an operation raising a database error fails an atomic batch with 409, not 500."""
+    def conflicting_update(db, task_id, task_update, user_id, **kwargs):
+        raise StaleDataError("UPDATE statement on table 'tasks' expected to update 1 row(s); 0 were matched.")
+
+    existing = client.post("/tasks/", json={"title": "Existing"}, headers=auth_headers).json()
+    monkeypatch.setattr(crud, "update_task", conflicting_update)
+    response = client.post("/batch/", json={"operations": [
+        {"op": "create", "task": {"title": "Never"}},
+        {"op": "update", "task_id": existing["id"], "task": {"title": "Raced"}},
+        {"op": "delete", "task_id": existing["id"]},
+    ]}, headers=auth_headers)
+    assert response.status_code == 409
+    data = response.json()
+    assert data["committed"] is False
+    assert [r["status"] for r in data["results"]] == [424, 409, 424]
+    assert [task["title"] for task in client.get("/tasks/", headers=auth_headers).json()] == ["Existing"]
+
+def test_batch_update_with_a_stale_version(auth_headers):
+    """Test that an update giving an old version fails with 412 and a current one applies."""
+    task = client.post("/tasks/", json={"title": "Versioned"}, headers=auth_headers).json()
+    client.put(f"/tasks/{task['id']}", json={"title": "Moved on"}, headers=auth_headers)
+
+    response = client.post("/batch/", json={"atomic": False, "operations": [
+        {"op": "update", "task_id": task["id"], "version": 1, "task": {"title": "Stale"}},
+        {"op": "update", "task_id": task["id"], "version": 2, "task": {"title": "Current"}},
+    ]}, headers=auth_headers)
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == [412, 200]
+    assert data["results"][1]["task"]["version"] == 3
+    assert client.get(f"/tasks/{task['id']}", headers=auth_headers).json()["title"] == "Current"
+
+def test_non_atomic_batch_reports_per_operation(auth_headers):
+    """Test that non-atomic batches commit the operations that succeeded."""
+    response = client.post("/batch/", json={"atomic": False, "operations": [
+        {"op": "create", "task": {"title": "Kept"}},
+        {"op": "delete", "task_id": 999},
+        {"op": "create", "task": {"title": "Also kept"}},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["committed"] is True
+    assert [r["status"] for r in data["results"]] == [201, 404, 201]
+    assert len(client.get("/tasks/", headers=auth_headers).json()) == 2
+
+def test_non_atomic_batch_reruns_without_a_failed_operation(auth_headers, monkeypatch):
+    """Test that an operation raising a database error is dropped and the others committed once."""
+    create_task = crud.create_task
+
+    def create_or_fail(db, task, user_id, commit=True):
+        if task.title == "Boom":
+            raise IntegrityError("INSERT", {}, Exception("constraint failed"))
+        return create_task(db, task=task, user_id=user_id, commit=commit)
+
+    monkeypatch.setattr(crud, "create_task", create_or_fail)
+    response = client.post("/batch/", json={"atomic": False, "operations": [
+        {"op": "create", "task": {"title": "Kept"}},
+        {"op": "create", "task": {"title": "Boom"}},
+        {"op": "create", "task": {"title": "Also kept"}},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["committed"] is True
+    assert [r["status"] for r in data["results"]] == [201, 409, 201]
+    tasks = client.get("/tasks/", headers=auth_headers).json()
+    assert sorted(task["title"] for task in tasks) == ["Also kept", "Kept"]
+    # The results describe the rows committed by the re-run
+    assert {data["results"][0]["task_id"], data["results"][2]["task_id"]} == {task["id"] for task in tasks}
+
+def test_batch_validation(auth_headers):
+    """Test malformed operations and oversized batches are rejected up front."""
+    response = client.post("/batch/", json={"operations": [{"op": "explode"}]}, headers=auth_headers)
+    assert response.status_code == 422
+
+    operations = [{"op": "delete", "task_id": i} for i in range(101)]
+    response = client.post("/batch/", json={"operations": operations}, headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.post("/batch/", json={"operations": []})
+    assert response.status_code == 401
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.database import get_db, Base
+from app import crud, events, models, rate_limit, schemas
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    """Create tables before each test and clean up after."""
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+def test_hub_delivers_across_threads():
+    """Test that events published from a worker thread reach the subscriber."""
+    hub = events.EventHub()
+
+    async def scenario():
+        subscription = hub.subscribe(1)
+        other = hub.subscribe(2)
+        thread = threading.Thread(target=hub.publish, args=(1, {"type": "created", "task_id": 5}))
+        thread.start()
+        thread.join()
+        event = await asyncio.wait_for(subscription.queue.get(), 1)
+        assert event["task_id"] == 5
+        assert other.queue.empty()
+
+    asyncio.run(scenario())
+
+def test_slow_consumer_gets_resync():
+    """Test that a full queue collapses to a single resync marker."""
+    hub = events.EventHub(queue_size=3)
+
+    async def scenario():
+        subscription = hub.subscribe(1)
+        for i in range(5):
+            hub.publish(1, {"type": "updated", "task_id": i})
+        assert subscription.queue.qsize() == 1
+
+        chunks = [chunk async for chunk in hub.stream(subscription)]
+        assert chunks[-1].startswith("event: resync")
+        assert 1 not in hub.subscribers
+
+    asyncio.run(scenario())
+
+
+def test_change_log_backend_reads_other_workers_writes():
+    """Test the multi-worker backend picks up writes from the shared change log."""
+    with TestingSessionLocal() as db:
+        user = models.User(username="poller", email="poller@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        crud.create_task(db, schemas.TaskCreate(title="Before"), user_id=user_id)
+
+        backend = events.ChangeLogBackend(bind=engine)
+        assert backend.poll({user_id}) == []
+
+        task_id = crud.create_task(db, schemas.TaskCreate(title="After"), user_id=user_id).id
+        crud.delete_task(db, task_id=task_id, user_id=user_id)
+
+    polled = backend.poll({user_id})
+    assert [(event["type"], event["task_id"]) for _, event in polled] == [("created", task_id), ("deleted", task_id)]
+    assert backend.poll({user_id}) == []
+
+
+def test_change_log_backend_does_not_skip_late_commits():
+    """Test that an entry stamped long before it was read is still delivered."""
+    with TestingSessionLocal() as db:
+        user = models.User(username="late", email="late@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        crud.create_task(db, schemas.TaskCreate(title="Before"), user_id=user_id)
+        backend = events.ChangeLogBackend(bind=engine)
+        assert backend.poll({user_id}) == []
+
+        task_id = crud.create_task(db, schemas.TaskCreate(title="Slow"), user_id=user_id).id
+        # As if the writing transaction had taken an hour to commit
+        db.query(models.TaskChange).filter(models.TaskChange.task_id == task_id).update(
+            {"changed_at": datetime.utcnow() - timedelta(hours=1)}
+        )
+        db.commit()
+
+    assert [event["task_id"] for _, event in backend.poll({user_id})] == [task_id]
+
+def test_change_log_backend_polls_thousands_of_users():
+    """Test that polling for more users than fit in one SQL expression still works."""
+    with TestingSessionLocal() as db:
+        user = models.User(username="crowd", email="crowd@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        connected = set(range(user_id + 1, user_id + 1500)) | {user_id}
+        backend = events.ChangeLogBackend(bind=engine)
+        assert backend.poll(connected) == []
+
+        task_id = crud.create_task(db, schemas.TaskCreate(title="Heard"), user_id=user_id).id
+
+    assert [(owner, event["task_id"]) for owner, event in backend.poll(connected)] == [(user_id, task_id)]
+    assert backend.poll(connected) == []
+
+def test_change_log_backend_starts_from_the_subscription():
+    """Test that a change committed between subscribing and the first poll is delivered."""
+    backend = events.ChangeLogBackend(bind=engine)
+    hub = events.EventHub(backend)
+    with TestingSessionLocal() as db:
+        user = models.User(username="early", email="early@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        crud.create_task(db, schemas.TaskCreate(title="Before"), user_id=user_id)
+        since = crud.get_change_cursor(db, user_id=user_id).seq
+
+        async def connect():
+            hub.subscribe(user_id, since=since)
+
+        asyncio.run(connect())
+        task_id = crud.create_task(db, schemas.TaskCreate(title="Between"), user_id=user_id).id
+
+    assert [event["task_id"] for _, event in backend.poll(set(hub.subscribers))] == [task_id]
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.group_commit import GroupCommitWriter
+from app import crud, models, schemas
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'group.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with factory() as db:
+        db.add(models.User(username="writer", email="writer@example.com", hashed_password="x"))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+def test_concurrent_writes_share_commits(session_factory):
+    """Test that concurrent callers each get their own task back from a shared batch."""
+    writer = GroupCommitWriter(session_factory, window_ms=20, max_batch=100)
+    writer.start()
+    results = {}
+
+    def create(i):
+        results[i] = writer.execute(
+            lambda db: crud.create_task(db, schemas.TaskCreate(title=f"Task {i}"), user_id=1, commit=False),
+            owner_id=1,
+        )
+
+    threads = [threading.Thread(target=create, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    assert {i: task.title for i, task in results.items()} == {i: f"Task {i}" for i in range(20)}
+    assert len({task.id for task in results.values()}) == 20
+    with session_factory() as db:
+        assert db.query(models.Task).count() == 20
+
+def test_failing_operation_does_not_affect_batch(session_factory):
+    """Test that one failing operation gets its error while the others commit."""
+    writer = GroupCommitWriter(session_factory, window_ms=50, max_batch=10)
+    writer.start()
+
+    def broken(db):
+        crud.create_task(db, schemas.TaskCreate(title="Doomed"), user_id=1, commit=False)
+        raise ValueError("boom")
+
+    ok = writer.submit(lambda db: crud.create_task(db, schemas.TaskCreate(title="Kept"), user_id=1, commit=False))
+    bad = writer.submit(broken)
+    also_ok = writer.submit(lambda db: crud.create_task(db, schemas.TaskCreate(title="Also kept"), user_id=1, commit=False))
+    writer.close()
+
+    assert ok.result().title == "Kept"
+    assert also_ok.result().title == "Also kept"
+    with pytest.raises(ValueError):
+        bad.result()
+    with session_factory() as db:
+        assert sorted(t.title for t in db.query(models.Task)) == ["Also kept", "Kept"]
+
+def test_writer_runs_only_between_start_and_close(session_factory):
+    """Test that the writer thread is started explicitly and operations are refused once it is closed."""
+    writer = GroupCommitWriter(session_factory)
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda db: None)
+    writer.start()
+    assert writer.execute(lambda db: "done") == "done"
+    writer.close()
+    assert not any(thread.name == "group-commit" for thread in threading.enumerate())
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda db: None)
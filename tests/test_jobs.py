@@ -0,0 +1,208 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.database import get_db, Base
+from app import jobs, rate_limit
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def setup_database(monkeypatch):
+    """Create tables before each test and clean up after."""
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
+    monkeypatch.setattr(jobs, "runner", jobs.JobRunner(bind=engine, session_factory=TestingSessionLocal))
+    monkeypatch.setattr(jobs, "JOB_CHUNK_SIZE", 2)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def auth_headers():
+    """Create authenticated user and return headers."""
+    client.post(
+        "/auth/register",
+        json={"username": "jobuser", "email": "job@example.com", "password": "testpassword123"}
+    )
+    response = client.post("/auth/login", data={"username": "jobuser", "password": "testpassword123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def _submit(auth_headers, **job):
+    response = client.post("/jobs/", json=job, headers=auth_headers)
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    return response.json()["id"]
+
+def _job(auth_headers, job_id):
+    return client.get(f"/jobs/{job_id}", headers=auth_headers).json()
+
+def test_import_bulk_update_and_export(auth_headers):
+    """Test the three job kinds end to end, run by a worker in this thread."""
+    job_id = _submit(auth_headers, kind="import", tasks=[{"title": f"Imported {i}", "priority": "low"} for i in range(5)])
+    assert jobs.runner.run_once("worker-a") == job_id
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["processed"], job["total"], job["attempts"]) == ("succeeded", 5, 5, 1)
+    assert job["result"] == {"created": 5, "skipped": 0}
+    assert len(client.get("/tasks/", headers=auth_headers).json()) == 5
+
+    job_id = _submit(auth_headers, kind="bulk_update", filter={"priority": "low"}, update={"status": "completed"})
+    jobs.runner.run_once("worker-a")
+    assert _job(auth_headers, job_id)["result"] == {"updated": 5}
+    assert len(client.get("/tasks/status/completed", headers=auth_headers).json()) == 5
+
+    job_id = _submit(auth_headers, kind="export", fields=["title"])
+    assert client.get(f"/jobs/{job_id}/result", headers=auth_headers).status_code == 409
+    jobs.runner.run_once("worker-a")
+    response = client.get(f"/jobs/{job_id}/result", headers=auth_headers)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["title"] for line in lines] == [f"Imported {i}" for i in range(5)]
+    assert set(lines[0]) == {"id", "title"}
+
+    assert [job["kind"] for job in client.get("/jobs/", headers=auth_headers).json()] == ["export", "bulk_update", "import"]
+    assert jobs.runner.run_once("worker-a") is None
+
+def test_retry_with_backoff_then_fail(auth_headers, monkeypatch):
+    """Test that a failing job is retried after a growing delay and then marked failed."""
+    calls = []
+
+    def flaky(ctx):
+        calls.append(ctx.processed)
+        ctx.report(ctx.processed + 1, 10)
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(jobs.HANDLERS, "export", flaky)
+    job_id = _submit(auth_headers, kind="export", max_attempts=2)
+    now = datetime.utcnow()
+    jobs.runner.run_once("worker-a", now=now)
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("queued", 1, "RuntimeError: boom")
+
+    # Not due until the backoff has passed
+    assert jobs.runner.run_once("worker-a", now=now) is None
+    later = now + timedelta(seconds=jobs.JOB_RETRY_BASE_SECONDS + 1)
+    assert jobs.runner.run_once("worker-a", now=later) == job_id
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["attempts"], job["processed"]) == ("failed", 2, 2)
+    # The second attempt resumed from the first one's progress
+    assert calls == [0, 1]
+
+def test_chunk_committed_before_a_crash_is_not_applied_again(auth_headers, monkeypatch):
+    """Test that a worker dying between a chunk's commit and its report does not duplicate the chunk."""
+    report = jobs.JobContext.report
+    reports = []
+
+    def dies_after_second_commit(ctx, processed, *args, **kwargs):
+        reports.append(processed)
+        if len(reports) == 2:
+            raise RuntimeError("worker died")
+        return report(ctx, processed, *args, **kwargs)
+
+    monkeypatch.setattr(jobs.JobContext, "report", dies_after_second_commit)
+    later = datetime.utcnow() + timedelta(seconds=jobs.JOB_RETRY_MAX_SECONDS + 1)
+
+    job_id = _submit(auth_headers, kind="import", tasks=[{"title": f"Imported {i}", "priority": "low"} for i in range(5)])
+    jobs.runner.run_once("worker-a")
+    assert _job(auth_headers, job_id)["processed"] == 2
+    assert jobs.runner.run_once("worker-b", now=later) == job_id
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["attempts"], job["result"]) == ("succeeded", 2, {"created": 5, "skipped": 0})
+    tasks = client.get("/tasks/", headers=auth_headers).json()
+    assert sorted(task["title"] for task in tasks) == [f"Imported {i}" for i in range(5)]
+
+    reports.clear()
+    job_id = _submit(auth_headers, kind="bulk_update", filter={"priority": "low"}, update={"status": "completed"})
+    jobs.runner.run_once("worker-a")
+    assert jobs.runner.run_once("worker-b", now=later) == job_id
+    assert _job(auth_headers, job_id)["result"] == {"updated": 5}
+    # Each task was updated exactly once
+    assert [task["version"] for task in client.get("/tasks/", headers=auth_headers).json()] == [2] * 5
+
+def test_retried_export_starts_over(auth_headers, monkeypatch):
+    """Test that an export retried after a failed attempt lists each task once."""
+    report = jobs.JobContext.report
+    reports = []
+
+    def dies_on_second_chunk(ctx, processed, *args, **kwargs):
+        reports.append(processed)
+        if len(reports) == 2:
+            raise RuntimeError("worker died")
+        return report(ctx, processed, *args, **kwargs)
+
+    for i in range(3):
+        client.post("/tasks/", json={"title": f"Task {i}"}, headers=auth_headers)
+    monkeypatch.setattr(jobs.JobContext, "report", dies_on_second_chunk)
+    job_id = _submit(auth_headers, kind="export", fields=["title"])
+    jobs.runner.run_once("worker-a")
+    assert _job(auth_headers, job_id)["status"] == "queued"
+    later = datetime.utcnow() + timedelta(seconds=jobs.JOB_RETRY_MAX_SECONDS + 1)
+    assert jobs.runner.run_once("worker-b", now=later) == job_id
+    response = client.get(f"/jobs/{job_id}/result", headers=auth_headers)
+    assert response.headers["content-disposition"] == f'attachment; filename="tasks-{job_id}.ndjson"'
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == [f"Task {i}" for i in range(3)]
+
+def test_client_idempotency_keys_do_not_touch_job_chunks(auth_headers):
+    """Test that a job's chunk progress is not kept in the client's idempotency key namespace."""
+    job_id = _submit(auth_headers, kind="import", tasks=[{"title": f"Imported {i}"} for i in range(3)])
+    for processed in (0, 2):
+        response = client.post(
+            "/tasks/", json={"title": "Client task"},
+            headers={**auth_headers, "Idempotency-Key": f"job:{job_id}:{processed}"},
+        )
+        assert response.status_code == 200
+    assert jobs.runner.run_once("worker-a") == job_id
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["result"]) == ("succeeded", {"created": 3, "skipped": 0})
+    assert len(client.get("/tasks/", headers=auth_headers).json()) == 5
+
+def test_expired_lease_is_picked_up_by_another_worker(auth_headers):
+    """Test that a crashed worker's job is re-claimed once its lease runs out."""
+    job_id = _submit(auth_headers, kind="import", tasks=[{"title": "Once"}])
+    now = datetime.utcnow()
+    # worker-a claims the job and dies without reporting
+    assert jobs.runner.claim("worker-a", now=now).id == job_id
+    assert jobs.runner.run_once("worker-b", now=now) is None
+    assert jobs.runner.run_once("worker-b", now=now + jobs.runner.lease + timedelta(seconds=1)) == job_id
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["attempts"]) == ("succeeded", 2)
+
+def test_cancel(auth_headers, monkeypatch):
+    """Test cancelling queued and running jobs."""
+    job_id = _submit(auth_headers, kind="export")
+    response = client.post(f"/jobs/{job_id}/cancel", headers=auth_headers)
+    assert response.json()["status"] == "cancelled"
+    assert jobs.runner.run_once("worker-a") is None
+
+    def cancelled_midway(ctx):
+        client.post(f"/jobs/{ctx.job_id}/cancel", headers=auth_headers)
+        ctx.report(1, 2)
+
+    monkeypatch.setitem(jobs.HANDLERS, "export", cancelled_midway)
+    job_id = _submit(auth_headers, kind="export")
+    jobs.runner.run_once("worker-a")
+    job = _job(auth_headers, job_id)
+    assert (job["status"], job["processed"]) == ("cancelled", 1)
+    assert client.post("/jobs/999/cancel", headers=auth_headers).status_code == 404
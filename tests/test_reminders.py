@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.reminders import ReminderScheduler, DUE, OVERDUE
+from app import crud, models, schemas
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2030, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    session.add(models.User(username="due", email="due@example.com", hashed_password="x"))
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+def add_task(db, title, due, status="pending"):
+    return crud.create_task(db, schemas.TaskCreate(title=title, due_date=due, status=status), user_id=1)
+
+def make_scheduler():
+    return ReminderScheduler(window=timedelta(hours=1), overdue_after=timedelta(minutes=30), sinks=[], bind=engine)
+
+def test_only_the_upcoming_window_is_loaded(db):
+    """Test that tasks due beyond the window or already completed are not loaded."""
+    add_task(db, "Soon", NOW + timedelta(minutes=10))
+    add_task(db, "Later", NOW + timedelta(days=3))
+    add_task(db, "Done", NOW + timedelta(minutes=5), status="completed")
+    scheduler = make_scheduler()
+
+    assert scheduler.load(NOW, NOW + timedelta(hours=1)) == 2
+    assert scheduler.pop_due(NOW + timedelta(minutes=9)) == []
+    assert [(e["type"], e["title"]) for e in scheduler.pop_due(NOW + timedelta(minutes=10))] == [(DUE, "Soon")]
+    assert [(e["type"], e["title"]) for e in scheduler.pop_due(NOW + timedelta(minutes=40))] == [(OVERDUE, "Soon")]
+
+def test_writes_refresh_the_heap(db):
+    """Test that updates reschedule and completion/deletion cancel reminders."""
+    moved = add_task(db, "Moved", NOW + timedelta(minutes=10))
+    completed = add_task(db, "Completed", NOW + timedelta(minutes=20))
+    deleted = add_task(db, "Deleted", NOW + timedelta(minutes=25))
+    scheduler = make_scheduler()
+    scheduler.load(NOW, NOW + timedelta(hours=1))
+
+    moved = crud.update_task(db, moved.id, schemas.TaskUpdate(due_date=NOW + timedelta(minutes=15)), user_id=1)
+    completed = crud.update_task(db, completed.id, schemas.TaskUpdate(status="completed"), user_id=1)
+    scheduler.track(moved)
+    scheduler.track(completed)
+    scheduler.forget(deleted.id)
+
+    fired = scheduler.pop_due(NOW + timedelta(minutes=30))
+    assert [(e["type"], e["title"], e["due_date"]) for e in fired] == [
+        (DUE, "Moved", (NOW + timedelta(minutes=15)).isoformat())
+    ]
+
+def test_each_reminder_is_claimed_by_one_process(db):
+    """Test that schedulers in two processes send a reminder once, and not for a task changed since."""
+    kept = add_task(db, "Kept", NOW + timedelta(minutes=10))
+    completed = add_task(db, "Completed elsewhere", NOW + timedelta(minutes=10))
+    moved = add_task(db, "Moved elsewhere", NOW + timedelta(minutes=10))
+    first, second = make_scheduler(), make_scheduler()
+    first.load(NOW, NOW + timedelta(hours=1))
+    second.load(NOW, NOW + timedelta(hours=1))
+    # Written through a third process, so neither heap hears of it
+    crud.update_task(db, completed.id, schemas.TaskUpdate(status="completed"), user_id=1)
+    crud.update_task(db, moved.id, schemas.TaskUpdate(due_date=NOW + timedelta(days=1)), user_id=1)
+
+    at = NOW + timedelta(minutes=10)
+    claimed = [e["title"] for e in first.pop_due(at) if first.claim(e)]
+    assert claimed == ["Kept"]
+    assert [e["title"] for e in second.pop_due(at) if second.claim(e)] == []
+
+    version = db.get(models.Task, kept.id).version
+    at = NOW + timedelta(minutes=40)
+    assert [(e["type"], e["title"]) for e in second.pop_due(at) if second.claim(e)] == [(OVERDUE, "Kept")]
+    assert [e for e in first.pop_due(at) if first.claim(e)] == []
+    db.expire_all()
+    assert db.get(models.Task, kept.id).version == version
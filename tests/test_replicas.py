@@ -0,0 +1,72 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.database import get_db, Base
+from app import database, rate_limit, models
+
+# Two SQLite files stand in for the primary and a read replica
+@pytest.fixture
+def replica_setup(tmp_path):
+    primary_url = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    primary_engine = create_engine(primary_url, connect_args={"check_same_thread": False})
+    replica_engine = create_engine(replica_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=primary_engine)
+    Base.metadata.create_all(bind=replica_engine)
+    PrimarySession = sessionmaker(autocommit=False, autoflush=False, bind=primary_engine)
+    ReplicaSession = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+    def override_get_db():
+        db = PrimarySession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
+    database.configure_read_replicas([replica_url])
+    yield PrimarySession, ReplicaSession
+    database.configure_read_replicas([])
+    database._pins.clear()
+    primary_engine.dispose()
+    replica_engine.dispose()
+
+def replicate_users(primary_session, replica_session):
+    """Copy users to the replica, as replication eventually would."""
+    with primary_session() as primary, replica_session() as replica:
+        for user in primary.query(models.User).all():
+            replica.merge(models.User(id=user.id, username=user.username,
+                                      email=user.email, hashed_password=user.hashed_password))
+        replica.commit()
+
+def test_reads_go_to_replica_and_writes_to_primary(replica_setup):
+    """Test that GET routes read the replica once the read-your-writes window passes."""
+    PrimarySession, ReplicaSession = replica_setup
+    client = TestClient(app)
+    client.post("/auth/register", json={"username": "replica", "email": "r@example.com", "password": "password123"})
+    token = client.post("/auth/login", data={"username": "replica", "password": "password123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Pinned to the primary right after writing, so the new task is visible
+    client.post("/tasks/", json={"title": "Fresh"}, headers=headers)
+    assert [t["title"] for t in client.get("/tasks/", headers=headers).json()] == ["Fresh"]
+    with ReplicaSession() as replica:
+        assert replica.query(models.Task).count() == 0
+
+    # Once the pin expires reads are served by the (lagging) replica
+    replicate_users(PrimarySession, ReplicaSession)
+    database._pins.clear()
+    assert client.get("/tasks/", headers=headers).json() == []
+    assert client.get("/auth/me", headers=headers).json()["username"] == "replica"
+
+def test_replica_session_rejects_writes(replica_setup):
+    """Test that replica sessions refuse to flush."""
+    factory = database._read_sessions[0]
+    with factory() as session:
+        session.add(models.User(username="x", email="x@example.com", hashed_password="x"))
+        with pytest.raises(RuntimeError):
+            session.flush()
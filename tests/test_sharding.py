@@ -0,0 +1,146 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.database import get_db, Base
+from app import sharding, rate_limit
+
+# A primary SQLite file for users plus three shard files for tasks
+@pytest.fixture
+def shards(tmp_path):
+    primary_engine = create_engine(f"sqlite:///{tmp_path / 'primary.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=primary_engine)
+    PrimarySession = sessionmaker(autocommit=False, autoflush=False, bind=primary_engine)
+
+    def override_get_db():
+        db = PrimarySession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
+    router = sharding.configure_shards(
+        [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)], primary=primary_engine
+    )
+    sharding.create_shard_tables()
+    # Moves need not wait for other processes' cached directory entries here
+    router.directory_ttl = 0
+    yield router
+    sharding.configure_shards([])
+    for shard_engine in router.shards.values():
+        shard_engine.dispose()
+    primary_engine.dispose()
+
+def login(client, username):
+    client.post("/auth/register", json={"username": username, "email": f"{username}@example.com", "password": "password123"})
+    token = client.post("/auth/login", data={"username": username, "password": "password123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def task_titles_on(shard_engine):
+    with shard_engine.connect() as conn:
+        return sorted(row[0] for row in conn.execute(text("SELECT title FROM tasks")))
+
+def test_tasks_are_stored_on_owner_shard(shards):
+    """Test that each user's tasks land on the shard the directory assigns."""
+    client = TestClient(app)
+    headers = {name: login(client, name) for name in ("alice", "bob", "carol", "dave")}
+    for name, h in headers.items():
+        client.post("/tasks/", json={"title": f"{name} task"}, headers=h)
+
+    for user_id, name in enumerate(headers, start=1):
+        assert f"{name} task" in task_titles_on(shards.engine_for(user_id))
+        assert shards.shard_for(user_id) == shards.ring_shard(user_id)
+        assert [t["title"] for t in client.get("/tasks/", headers=headers[name]).json()] == [f"{name} task"]
+
+    # Ids are unique across shards
+    ids = [client.get("/tasks/", headers=h).json()[0]["id"] for h in headers.values()]
+    assert len(set(ids)) == len(ids)
+
+def test_move_user_between_shards(shards):
+    """Test that rebalancing moves a user's tasks and keeps their ids."""
+    client = TestClient(app)
+    headers = login(client, "mover")
+    created = [client.post("/tasks/", json={"title": f"Task {i}"}, headers=headers).json() for i in range(3)]
+    source = shards.shard_for(1)
+    target = next(name for name in shards.shards if name != source)
+
+    # 3 tasks, their 3 closure rows (each task is its own ancestor), 3 change
+    # log entries and the owner's change cursor
+    assert shards.move_user(1, target) == 10
+    assert shards.shard_for(1) == target
+    assert task_titles_on(shards.shards[source]) == []
+    assert task_titles_on(shards.shards[target]) == ["Task 0", "Task 1", "Task 2"]
+
+    response = client.get(f"/tasks/{created[0]['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["title"] == "Task 0"
+
+    # The change log travelled with the tasks
+    changes = client.get("/tasks/changes", headers=headers).json()["changes"]
+    assert [c["task_id"] for c in changes] == [t["id"] for t in created]
+
+def test_interrupted_move_is_finished_by_running_it_again(shards):
+    """Test that rows left on the source by a crash or a stale writer are moved without duplicates."""
+    client = TestClient(app)
+    headers = login(client, "mover")
+    for i in range(2):
+        client.post("/tasks/", json={"title": f"Task {i}"}, headers=headers)
+    source = shards.shard_for(1)
+    target = next(name for name in shards.shards if name != source)
+    shards.move_user(1, target)
+
+    # The originals survive as if the deletes never committed, and a worker still
+    # routing to the source adds a task (and a fresh change cursor) there
+    with shards.shards[target].connect() as conn:
+        tables = {table: conn.execute(table.select()).mappings().all() for table in Base.metadata.sorted_tables
+                  if table in [m.__table__ for m in sharding.sharded_models()]}
+    with shards.shards[source].begin() as conn:
+        for table, rows in tables.items():
+            if rows:
+                conn.execute(table.insert(), [dict(row) for row in rows])
+        conn.execute(text("INSERT INTO tasks (id, title, owner_id, version) VALUES (999999, 'Stale write', 1, 1)"))
+
+    assert shards.move_user(1, target) == sum(len(rows) for rows in tables.values()) + 1
+    assert task_titles_on(shards.shards[source]) == []
+    assert task_titles_on(shards.shards[target]) == ["Stale write", "Task 0", "Task 1"]
+
+def test_move_keeps_rows_written_to_the_source_after_the_copy(shards):
+    """Test that a move deletes only the rows it copied, not ones another writer added meanwhile."""
+    client = TestClient(app)
+    headers = login(client, "mover")
+    client.post("/tasks/", json={"title": "Task"}, headers=headers)
+    source = shards.shard_for(1)
+    target = next(name for name in shards.shards if name != source)
+
+    # A writer that the lock does not block inserts a task between the copy and the deletes
+    written = []
+
+    def late_write(conn, clauseelement, multiparams, params, execution_options):
+        if getattr(clauseelement, "is_delete", False) and clauseelement.table.name == "tasks" and not written:
+            written.append(True)
+            conn.execute(text("INSERT INTO tasks (id, title, owner_id, version) VALUES (999999, 'Late write', 1, 1)"))
+
+    event.listen(shards.shards[source], "before_execute", late_write)
+    shards.move_user(1, target)
+    assert task_titles_on(shards.shards[source]) == []
+    assert task_titles_on(shards.shards[target]) == ["Late write", "Task"]
+
+def test_other_processes_follow_a_move_after_the_directory_ttl(shards, monkeypatch):
+    """Test that a router that cached an owner's shard picks up a move made elsewhere."""
+    client = TestClient(app)
+    headers = login(client, "mover")
+    client.post("/tasks/", json={"title": "Task"}, headers=headers)
+    other = sharding.ShardRouter(shards.shards, primary=shards.primary, directory_ttl=60)
+    source = other.shard_for(1)
+    target = next(name for name in shards.shards if name != source)
+
+    shards.move_user(1, target)
+    assert other.shard_for(1) == source
+    later = time.monotonic() + 61
+    monkeypatch.setattr(sharding.time, "monotonic", lambda: later)
+    assert other.shard_for(1) == target
@@ -1,12 +1,15 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.pool import StaticPool
 from datetime import datetime, timedelta
 
 from app.main import app
 from app.database import get_db, Base
+from app import rate_limit, archival, audit, change_feed, compression, crud, idempotency, models, schemas
 
 # Create in-memory database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -32,8 +35,13 @@ client = TestClient(app)
 @pytest.fixture(autouse=True)
 def setup_database():
     """Create tables before each test and clean up after."""
+    app.dependency_overrides[get_db] = override_get_db
+    rate_limit.backend.reset()
+    audit.writer.session_factory = TestingSessionLocal
+    idempotency.cache.clear()
     Base.metadata.create_all(bind=engine)
     yield
+    audit.writer.flush()
     Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture
@@ -329,4 +337,521 @@ def test_task_isolation_between_users():
     
     # User1 should not be able to access user2's task
     response = client.get(f"/tasks/{task2_id}", headers=headers1)
-    assert response.status_code == 404 
\ No newline at end of file
+    assert response.status_code == 404 
+def test_completed_tasks_are_archived(auth_headers):
+    """Test that archived tasks leave the default list but remain queryable."""
+    client.post("/tasks/", json={"title": "Done", "status": "completed"}, headers=auth_headers)
+    client.post("/tasks/", json={"title": "Open"}, headers=auth_headers)
+
+    archived = archival.archive_completed_tasks(
+        engine, older_than=timedelta(days=1), now=datetime.utcnow() + timedelta(days=2)
+    )
+    assert archived == 1
+
+    response = client.get("/tasks/", headers=auth_headers)
+    assert [t["title"] for t in response.json()] == ["Open"]
+
+    response = client.get("/tasks/", params={"include_archived": True}, headers=auth_headers)
+    assert [t["title"] for t in response.json()] == ["Done", "Open"]
+
+    response = client.get(
+        "/tasks/query", params={"status": "completed", "include_archived": True}, headers=auth_headers
+    )
+    assert [t["title"] for t in response.json()] == ["Done"]
+
+def test_task_change_feed(auth_headers):
+    """Test incremental sync through the change feed, including tombstones."""
+    first = client.post("/tasks/", json={"title": "First"}, headers=auth_headers).json()
+    second = client.post("/tasks/", json={"title": "Second"}, headers=auth_headers).json()
+
+    response = client.get("/tasks/changes", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [(c["op"], c["task"]["title"]) for c in data["changes"]] == [("created", "First"), ("created", "Second")]
+    cursor = data["cursor"]
+
+    client.put(f"/tasks/{first['id']}", json={"title": "First (edited)"}, headers=auth_headers)
+    client.delete(f"/tasks/{second['id']}", headers=auth_headers)
+
+    data = client.get("/tasks/changes", params={"since": cursor}, headers=auth_headers).json()
+    assert [(c["op"], c["task_id"]) for c in data["changes"]] == [("updated", first["id"]), ("deleted", second["id"])]
+    assert data["changes"][0]["task"]["title"] == "First (edited)"
+    assert data["changes"][1]["task"] is None
+    assert data["resync_required"] is False
+
+    # Nothing new since the latest cursor
+    data = client.get("/tasks/changes", params={"since": data["cursor"]}, headers=auth_headers).json()
+    assert data["changes"] == []
+
+def test_task_change_feed_resync_after_compaction(auth_headers):
+    """Test that clients behind the retained window are told to resync."""
+    client.post("/tasks/", json={"title": "Old"}, headers=auth_headers)
+    assert change_feed.compact_changes(
+        engine, older_than=timedelta(days=1), now=datetime.utcnow() + timedelta(days=2)
+    ) == 1
+    client.post("/tasks/", json={"title": "New"}, headers=auth_headers)
+
+    data = client.get("/tasks/changes", params={"since": 0}, headers=auth_headers).json()
+    assert data["resync_required"] is True
+    assert data["cursor"] == 2
+
+    data = client.get("/tasks/changes", params={"since": 1}, headers=auth_headers).json()
+    assert data["resync_required"] is False
+    assert [c["task"]["title"] for c in data["changes"]] == ["New"]
+
+def test_get_overdue_tasks_keyset_pagination(auth_headers):
+    """Test the overdue endpoint skips completed/future tasks and pages by due date."""
+    past = datetime.utcnow() - timedelta(days=10)
+    for i in (3, 1, 2):
+        client.post(
+            "/tasks/",
+            json={"title": f"Overdue {i}", "due_date": (past + timedelta(days=i)).isoformat()},
+            headers=auth_headers
+        )
+    client.post("/tasks/", json={"title": "Done", "status": "completed", "due_date": past.isoformat()}, headers=auth_headers)
+    client.post("/tasks/", json={"title": "Future", "due_date": (datetime.utcnow() + timedelta(days=1)).isoformat()}, headers=auth_headers)
+
+    response = client.get("/tasks/overdue", params={"limit": 2}, headers=auth_headers)
+    assert response.status_code == 200
+    page = response.json()
+    assert [t["title"] for t in page] == ["Overdue 1", "Overdue 2"]
+
+    response = client.get(
+        "/tasks/overdue",
+        params={"limit": 2, "after_due": page[-1]["due_date"], "after_id": page[-1]["id"]},
+        headers=auth_headers
+    )
+    assert [t["title"] for t in response.json()] == ["Overdue 3"]
+
+def test_get_tasks_batch(auth_headers):
+    """Test fetching several tasks at once, reporting missing ids."""
+    ids = [client.post("/tasks/", json={"title": f"Task {i}"}, headers=auth_headers).json()["id"] for i in range(3)]
+
+    response = client.get(
+        "/tasks/batch", params={"ids": f"{ids[2]},{ids[0]},999"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [t["title"] for t in data["tasks"]] == ["Task 2", "Task 0"]
+    assert data["missing"] == [999]
+
+    response = client.post("/tasks/batch", json={"ids": ids}, headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()["tasks"]) == 3
+
+    response = client.get("/tasks/batch", params={"ids": "1,abc"}, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_sparse_fieldsets(auth_headers):
+    """Test that ?fields= narrows the payload and rejects unknown fields."""
+    created = client.post(
+        "/tasks/",
+        json={"title": "Sparse", "description": "A long description", "priority": "high"},
+        headers=auth_headers
+    ).json()
+
+    response = client.get("/tasks/", params={"fields": "title,status"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == [{"id": created["id"], "title": "Sparse", "status": "pending"}]
+
+    response = client.get(f"/tasks/{created['id']}", params={"fields": "priority"}, headers=auth_headers)
+    assert response.json() == {"id": created["id"], "priority": "high"}
+
+    response = client.get("/tasks/batch", params={"ids": created["id"], "fields": "title"}, headers=auth_headers)
+    assert response.json()["tasks"] == [{"id": created["id"], "title": "Sparse"}]
+
+    # Without fields the full task is returned, including null values
+    response = client.get(f"/tasks/{created['id']}", headers=auth_headers)
+    assert response.json() == created
+
+    response = client.get("/tasks/", params={"fields": "title,secret"}, headers=auth_headers)
+    assert response.status_code == 400
+    assert "secret" in response.json()["detail"]
+
+    client.put(f"/tasks/{created['id']}", json={"tags": ["ops", "backend"]}, headers=auth_headers)
+    response = client.get("/tasks/query", params={"fields": "tags", "tags_any": "ops"}, headers=auth_headers)
+    assert response.json() == [{"id": created["id"], "tags": ["backend", "ops"]}]
+    response = client.get("/tasks/batch", params={"ids": created["id"], "fields": "title,tags"}, headers=auth_headers)
+    assert response.json()["tasks"] == [{"id": created["id"], "title": "Sparse", "tags": ["backend", "ops"]}]
+
+    # Both the full and the sparse form are documented
+    paths = client.get("/openapi.json").json()["paths"]
+    def documented(path, method="get"):
+        schema = paths[path][method]["responses"]["200"]["content"]["application/json"]["schema"]
+        return [option.get("items", option)["$ref"].rsplit("/", 1)[-1] for option in schema["anyOf"]]
+    assert documented("/tasks/{task_id}") == ["Task", "TaskPartial"]
+    assert documented("/tasks/") == ["Task", "TaskPartial"]
+    assert documented("/tasks/batch", "post") == ["TaskBatch", "TaskPartialBatch"]
+
+def test_response_compression(auth_headers):
+    """Test that large responses are gzipped and small ones are left alone."""
+    for i in range(20):
+        client.post("/tasks/", json={"title": f"Task {i}", "description": "x" * 200}, headers=auth_headers)
+
+    response = client.get("/tasks/", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 20
+
+    response = client.get("/tasks/", params={"limit": 1, "fields": "title"}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/tasks/", headers={**auth_headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 20
+
+def test_export_streams_ndjson(auth_headers):
+    """Test that the export streams every task and is compressed on the fly."""
+    for i in range(5):
+        client.post("/tasks/", json={"title": f"Task {i}", "description": "y" * 200}, headers=auth_headers)
+
+    response = client.get("/tasks/export", params={"fields": "title"}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["title"] for line in lines] == [f"Task {i}" for i in range(5)]
+    assert set(lines[0]) == {"id", "title"}
+
+def test_brotli_compression(auth_headers):
+    """Test that brotli is preferred when accepted, for whole and streamed responses."""
+    for i in range(20):
+        client.post("/tasks/", json={"title": f"Task {i}", "description": "x" * 200}, headers=auth_headers)
+    br_headers = {**auth_headers, "Accept-Encoding": "gzip, br"}
+
+    response = client.get("/tasks/", headers=br_headers)
+    assert response.headers["content-encoding"] == "br"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()) == 20
+
+    response = client.get("/tasks/export", headers=br_headers)
+    assert response.headers["content-encoding"] == "br"
+    assert "content-length" not in response.headers
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == [f"Task {i}" for i in range(20)]
+
+def test_task_etag_and_compressed_body_reuse(auth_headers):
+    """Test conditional GETs and that identical responses are not recompressed."""
+    task = client.post("/tasks/", json={"title": "Big", "description": "z" * 1000}, headers=auth_headers).json()
+    gzip_headers = {**auth_headers, "Accept-Encoding": "gzip"}
+
+    first = client.get(f"/tasks/{task['id']}", headers=gzip_headers)
+    assert first.headers["content-encoding"] == "gzip"
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    hits = compression.body_cache.hits
+    second = client.get(f"/tasks/{task['id']}", headers=gzip_headers)
+    assert second.content == first.content
+    assert second.headers["etag"] == etag
+    assert compression.body_cache.hits == hits + 1
+
+    not_modified = client.get(f"/tasks/{task['id']}", headers={**gzip_headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+    client.put(f"/tasks/{task['id']}", json={"status": "completed"}, headers=auth_headers)
+    changed = client.get(f"/tasks/{task['id']}", headers={**gzip_headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["status"] == "completed"
+
+def test_task_etag_is_not_shared_by_a_recreated_task(auth_headers):
+    """Test that another user's task created after a delete never gets the deleted task's cached body or 304."""
+    gzip_headers = {**auth_headers, "Accept-Encoding": "gzip"}
+    task = client.post("/tasks/", json={"title": "Mine", "description": "secret " * 200}, headers=auth_headers).json()
+    etag = client.get(f"/tasks/{task['id']}", headers=gzip_headers).headers["etag"]
+    client.delete(f"/tasks/{task['id']}", headers=auth_headers)
+
+    client.post("/auth/register", json={"username": "other", "email": "other@example.com", "password": "testpassword123"})
+    token = client.post("/auth/login", data={"username": "other", "password": "testpassword123"}).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+    other = client.post("/tasks/", json={"title": "Theirs", "description": "public " * 200}, headers=other_headers).json()
+    assert other["id"] != task["id"]
+    assert other["version"] == task["version"]
+
+    response = client.get(f"/tasks/{other['id']}", headers={**other_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Theirs"
+    assert response.headers["etag"] != etag
+
+def _create(auth_headers, title, parent_id=None, **fields):
+    response = client.post("/tasks/", json={"title": title, "parent_id": parent_id, **fields}, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def test_subtask_tree_reads(auth_headers):
+    """Test subtree fetch and completion rollup over a three-level tree."""
+    root = _create(auth_headers, "Project")
+    phase = _create(auth_headers, "Phase", root)
+    _create(auth_headers, "Step 1", phase, status="completed")
+    _create(auth_headers, "Step 2", phase)
+    _create(auth_headers, "Unrelated")
+
+    response = client.get(f"/tasks/{root}/subtree", headers=auth_headers)
+    assert response.status_code == 200
+    tree = response.json()
+    assert [t["title"] for t in tree] == ["Project", "Phase", "Step 1", "Step 2"]
+    assert tree[2]["parent_id"] == phase
+
+    rollup = client.get(f"/tasks/{root}/rollup", headers=auth_headers).json()
+    assert rollup == {"task_id": root, "total": 4, "completed": 1, "open": 3, "depth": 2}
+
+    response = client.post("/tasks/", json={"title": "Orphan", "parent_id": 999}, headers=auth_headers)
+    assert response.status_code == 404
+    assert client.get("/tasks/999/subtree", headers=auth_headers).status_code == 404
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_move_and_delete_subtree(auth_headers):
+    """Test moving a subtree, rejecting cycles, and deleting a subtree."""
+    root = _create(auth_headers, "Root")
+    other = _create(auth_headers, "Other")
+    phase = _create(auth_headers, "Phase", root)
+    step = _create(auth_headers, "Step", phase)
+
+    response = client.post(f"/tasks/{phase}/move", json={"parent_id": other}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["parent_id"] == other
+    assert [t["id"] for t in client.get(f"/tasks/{other}/subtree", headers=auth_headers).json()] == [other, phase, step]
+    assert [t["id"] for t in client.get(f"/tasks/{root}/subtree", headers=auth_headers).json()] == [root]
+
+    response = client.post(f"/tasks/{other}/move", json={"parent_id": step}, headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.post(f"/tasks/{phase}/move", json={"parent_id": None}, headers=auth_headers)
+    assert response.json()["parent_id"] is None
+    assert client.get(f"/tasks/{other}/rollup", headers=auth_headers).json()["total"] == 1
+
+    response = client.delete(f"/tasks/{phase}", headers=auth_headers)
+    assert sorted(response.json()["deleted_ids"]) == sorted([phase, step])
+    assert client.get(f"/tasks/{step}", headers=auth_headers).status_code == 404
+    changes = client.get("/tasks/changes", headers=auth_headers).json()["changes"]
+    assert {(c["op"], c["task_id"]) for c in changes if c["op"] == "deleted"} == {("deleted", phase), ("deleted", step)}
+
+def test_archival_keeps_parents_of_remaining_subtasks(auth_headers):
+    """Test that trees are archived leaves first."""
+    parent = _create(auth_headers, "Parent", status="completed")
+    _create(auth_headers, "Open child", parent)
+
+    archived = archival.archive_completed_tasks(
+        engine, older_than=timedelta(days=1), now=datetime.utcnow() + timedelta(days=2)
+    )
+    assert archived == 0
+    assert client.get(f"/tasks/{parent}/rollup", headers=auth_headers).json()["total"] == 2
+
+def test_archival_leaves_a_task_reopened_while_archiving(auth_headers):
+    """Test that a task reopened after the archiver selected it is neither copied nor deleted."""
+    reopened = _create(auth_headers, "Reopened", status="completed")
+    done = _create(auth_headers, "Done", status="completed")
+
+    def reopen_before_copying(conn, clauseelement, multiparams, params, execution_options):
+        if getattr(clauseelement, "table", None) is models.TaskArchive.__table__:
+            conn.execute(text("UPDATE tasks SET status = 'pending' WHERE id = :id"), {"id": reopened})
+
+    event.listen(engine, "before_execute", reopen_before_copying)
+    try:
+        archived = archival.archive_completed_tasks(
+            engine, older_than=timedelta(days=1), now=datetime.utcnow() + timedelta(days=2)
+        )
+    finally:
+        event.remove(engine, "before_execute", reopen_before_copying)
+    assert archived == 1
+    assert [t["id"] for t in client.get("/tasks/", headers=auth_headers).json()] == [reopened]
+    response = client.get("/tasks/", params={"include_archived": True}, headers=auth_headers)
+    assert sorted(t["id"] for t in response.json()) == sorted([reopened, done])
+
+def test_task_tags_and_filters(auth_headers):
+    """Test tagging tasks, replacing tags, and filtering by any / all tags."""
+    both = _create(auth_headers, "Both", tags=["backend", "customer-x", "backend"])
+    backend = _create(auth_headers, "Backend", tags=["backend"])
+    _create(auth_headers, "Untagged")
+
+    task = client.get(f"/tasks/{both}", headers=auth_headers).json()
+    assert task["tags"] == ["backend", "customer-x"]
+
+    def titles(query):
+        response = client.get(f"/tasks/query?{query}", headers=auth_headers)
+        assert response.status_code == 200
+        return [t["title"] for t in response.json()]
+
+    assert titles("tags_any=backend,frontend") == ["Both", "Backend"]
+    assert titles("tags_all=backend,customer-x") == ["Both"]
+    assert titles("tags_any=frontend") == []
+
+    response = client.put(f"/tasks/{backend}", json={"tags": ["frontend"]}, headers=auth_headers)
+    assert response.json()["tags"] == ["frontend"]
+    assert titles("tags_any=frontend") == ["Backend"]
+    assert client.put(f"/tasks/{both}", json={"title": "Renamed"}, headers=auth_headers).json()["tags"] == [
+        "backend", "customer-x"
+    ]
+
+    assert client.delete(f"/tasks/{both}", headers=auth_headers).status_code == 200
+    assert titles("tags_any=backend") == []
+
+def test_dashboard(auth_headers):
+    """Test dashboard counts and its due / recently updated sections."""
+    now = datetime.utcnow()
+    ids = [
+        _create(auth_headers, f"Task {i}", due_date=(now + timedelta(days=7 - i)).isoformat(), priority="high" if i % 2 else "low")
+        for i in range(7)
+    ]
+    _create(auth_headers, "No due date")
+    client.put(f"/tasks/{ids[6]}", json={"status": "completed"}, headers=auth_headers)
+    client.put(f"/tasks/{ids[0]}", json={"title": "Touched"}, headers=auth_headers)
+
+    response = client.get("/tasks/dashboard", headers=auth_headers)
+    assert response.status_code == 200
+    dashboard = response.json()
+    assert dashboard["total"] == 8
+    assert dashboard["by_status"] == {"pending": 7, "in_progress": 0, "completed": 1}
+    assert dashboard["by_priority"] == {"low": 4, "medium": 1, "high": 3}
+    assert [t["id"] for t in dashboard["next_due"]] == [ids[5], ids[4], ids[3], ids[2], ids[1]]
+    assert set(dashboard["next_due"][0]) == {"id", "title", "priority", "status", "due_date", "updated_at"}
+    assert len(dashboard["recently_updated"]) == 5
+    # Timestamps have one-second resolution here, so only check the section's shape
+    assert len({t["id"] for t in dashboard["recently_updated"]}) == 5
+
+def test_recurring_task_calendar(auth_headers):
+    """Test lazy expansion of a weekly task and its stored exceptions."""
+    monday = datetime(2026, 1, 5, 9, 0)
+    weekly = _create(auth_headers, "Standup", due_date=monday.isoformat(), recurrence="FREQ=WEEKLY;BYDAY=MO")
+    _create(auth_headers, "One-off", due_date=datetime(2026, 1, 14, 12, 0).isoformat())
+
+    def calendar(start, end, **params):
+        response = client.get(
+            "/tasks/calendar", params={"start": start.isoformat(), "end": end.isoformat(), **params}, headers=auth_headers
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    entries = calendar(datetime(2026, 1, 1), datetime(2026, 2, 1))
+    assert [(e["title"], e["due_date"]) for e in entries] == [
+        ("Standup", "2026-01-05T09:00:00"),
+        ("Standup", "2026-01-12T09:00:00"),
+        ("One-off", "2026-01-14T12:00:00"),
+        ("Standup", "2026-01-19T09:00:00"),
+        ("Standup", "2026-01-26T09:00:00"),
+    ]
+
+    def occurrence(**body):
+        return client.put(f"/tasks/{weekly}/occurrences", json=body, headers=auth_headers)
+
+    assert occurrence(occurs_at="2026-01-12T09:00:00", status="completed").json()["status"] == "completed"
+    assert occurrence(occurs_at="2026-01-19T09:00:00", cancelled=True).status_code == 200
+    assert occurrence(occurs_at="2026-01-26T09:00:00", due_date="2026-02-02T10:00:00").status_code == 200
+    assert occurrence(occurs_at="2026-01-13T09:00:00", status="completed").status_code == 400
+
+    entries = calendar(datetime(2026, 1, 10), datetime(2026, 2, 3))
+    assert [(e["due_date"], e["status"]) for e in entries if e.get("recurring")] == [
+        ("2026-01-12T09:00:00", "completed"),
+        ("2026-02-02T09:00:00", "pending"),
+        ("2026-02-02T10:00:00", "pending"),
+    ]
+
+    # A year of a daily series is cut off at the limit without expanding the rest
+    _create(auth_headers, "Daily", due_date=datetime(2020, 1, 1).isoformat(), recurrence="FREQ=DAILY")
+    assert len(calendar(datetime(2026, 1, 1), datetime(2027, 1, 1), limit=10)) == 10
+
+    assert client.get(
+        "/tasks/calendar", params={"start": "2026-01-01T00:00:00", "end": "2028-01-01T00:00:00"}, headers=auth_headers
+    ).status_code == 400
+    response = client.post("/tasks/", json={"title": "Bad", "recurrence": "FREQ=HOURLY"}, headers=auth_headers)
+    assert response.status_code == 422
+
+def test_task_history(auth_headers):
+    """Test that writes reach the history through the background writer, paged newest first."""
+    task_id = _create(auth_headers, "Draft", tags=["docs"])
+    client.put(f"/tasks/{task_id}", json={"title": "Final", "status": "in_progress"}, headers=auth_headers)
+    client.put(f"/tasks/{task_id}", json={"title": "Final"}, headers=auth_headers)
+    client.put(f"/tasks/{task_id}", json={"tags": ["docs", "review"]}, headers=auth_headers)
+    # Rolled back with the failed batch, so never recorded
+    client.post("/batch/", json={"operations": [
+        {"op": "update", "task_id": task_id, "task": {"title": "Lost"}},
+        {"op": "delete", "task_id": 999},
+    ]}, headers=auth_headers)
+    assert client.get(f"/tasks/{task_id}/history", headers=auth_headers).json()["events"] == []
+    client.delete(f"/tasks/{task_id}", headers=auth_headers)
+    audit.writer.flush()
+
+    page = client.get(f"/tasks/{task_id}/history?limit=2", headers=auth_headers).json()
+    assert [e["op"] for e in page["events"]] == ["deleted", "updated"]
+    assert page["events"][1]["changes"] == {"tags": {"old": ["docs"], "new": ["docs", "review"]}}
+    page = client.get(f"/tasks/{task_id}/history?before_id={page['next_before_id']}", headers=auth_headers).json()
+    assert [e["op"] for e in page["events"]] == ["updated", "created"]
+    assert page["events"][0]["changes"] == {
+        "title": {"old": "Draft", "new": "Final"},
+        "status": {"old": "pending", "new": "in_progress"},
+    }
+    assert page["events"][1]["changes"]["tags"] == {"old": None, "new": ["docs"]}
+    assert page["next_before_id"] is None
+
+    assert client.get("/tasks/999/history", headers=auth_headers).status_code == 404
+    stats = client.get("/health").json()["audit"]
+    assert stats["written"] >= 4 and stats["dropped"] == 0
+
+def test_idempotency_key(auth_headers):
+    """Test that a retried write is answered from the stored response instead of being applied again."""
+    headers = {**auth_headers, "Idempotency-Key": "create-1"}
+    first = client.post("/tasks/", json={"title": "Once"}, headers=headers)
+    retry = client.post("/tasks/", json={"title": "Once"}, headers=headers)
+    assert retry.status_code == 200
+    assert retry.json() == json.loads(first.text)
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    # Also answered from the table once this process has forgotten it
+    idempotency.cache.clear()
+    assert client.post("/tasks/", json={"title": "Once"}, headers=headers).json()["id"] == first.json()["id"]
+    assert len(client.get("/tasks/", headers=auth_headers).json()) == 1
+
+    # The same key with a different request is rejected; without a key nothing changes
+    assert client.post("/tasks/", json={"title": "Twice"}, headers=headers).status_code == 422
+    client.post("/tasks/", json={"title": "Once"}, headers=auth_headers)
+    assert len(client.get("/tasks/", headers=auth_headers).json()) == 2
+
+    task_id = first.json()["id"]
+    headers = {**auth_headers, "Idempotency-Key": "delete-1"}
+    assert client.delete(f"/tasks/{task_id}", headers=headers).status_code == 200
+    retry = client.delete(f"/tasks/{task_id}", headers=headers)
+    assert retry.status_code == 200 and retry.json()["deleted_ids"] == [task_id]
+    # A failed write stores nothing, so the key stays usable
+    headers = {**auth_headers, "Idempotency-Key": "update-1"}
+    assert client.put("/tasks/999", json={"title": "x"}, headers=headers).status_code == 404
+    assert client.put("/tasks/999", json={"title": "x"}, headers=headers).status_code == 404
+
+    # Expired keys are purged and can be reused
+    assert idempotency.purge_expired(engine) == 0
+    assert idempotency.purge_expired(engine, now=datetime.utcnow() + timedelta(seconds=idempotency.IDEMPOTENCY_TTL_SECONDS + 1)) == 2
+
+def test_task_version_and_if_match(auth_headers):
+    """Test that updates bump the version and If-Match rejects writes based on a stale read."""
+    task_id = _create(auth_headers, "Versioned")
+    read = client.get(f"/tasks/{task_id}", headers=auth_headers)
+    assert read.json()["version"] == 1 and read.headers["etag"].startswith('"1-')
+
+    updated = client.put(f"/tasks/{task_id}", json={"title": "Mine"}, headers={**auth_headers, "If-Match": read.headers["etag"]})
+    assert updated.status_code == 200
+    assert updated.json()["version"] == 2 and updated.headers["etag"].startswith('"2-')
+    # A second client still holding version 1 does not overwrite the first
+    stale = client.put(f"/tasks/{task_id}", json={"title": "Theirs"}, headers={**auth_headers, "If-Match": '"1"'})
+    assert stale.status_code == 412
+    assert client.put(f"/tasks/{task_id}", json={"title": "x"}, headers={**auth_headers, "If-Match": "abc"}).status_code == 412
+    assert client.get(f"/tasks/{task_id}", headers=auth_headers).json()["title"] == "Mine"
+
+    # Tag changes and moves bump the version too, so the version tracks the whole task
+    assert client.put(f"/tasks/{task_id}", json={"tags": ["a"]}, headers=auth_headers).json()["version"] == 3
+    parent_id = _create(auth_headers, "Parent")
+    assert client.post(f"/tasks/{task_id}/move", json={"parent_id": parent_id}, headers=auth_headers).json()["version"] == 4
+    assert client.put(f"/tasks/{task_id}", json={"status": "completed"}, headers={**auth_headers, "If-Match": 'W/"4"'}).status_code == 200
+
+    # Two writers that read the same version: the second UPDATE matches no row
+    first, second = TestingSessionLocal(), TestingSessionLocal()
+    try:
+        owner_id = read.json()["owner_id"]
+        read_by_second = crud.get_task(second, task_id=task_id, user_id=owner_id)
+        assert read_by_second.version == 5
+        crud.update_task(first, task_id=task_id, task_update=schemas.TaskUpdate(title="First"), user_id=owner_id)
+        with pytest.raises(StaleDataError):
+            crud.update_task(second, task_id=task_id, task_update=schemas.TaskUpdate(title="Second"), user_id=owner_id)
+    finally:
+        first.close()
+        second.close()
+    assert client.get(f"/tasks/{task_id}", headers=auth_headers).json()["title"] == "First"